@@ -0,0 +1,289 @@
+import dataclasses
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cohort_analysis import build_install_index, lookup_install_codes
+from date_dimension import day_numbers
+from holistic_analysis import holistic_main
+from installs_analysis import installs_main
+from money import MICROS_COLUMN, USD_COLUMN, format_usd, sum_micros
+from payouts_analysis import payouts_main
+from revenue_analysis import revenue_main
+
+# The file names every app directory gets, matching the default paths of the *_main functions
+APP_FILES = {
+    "installs": "data/installs.csv",
+    "revenue": "data/revenue_converted.csv",
+    "adspend": "data/adspend_converted.csv",
+    "payouts": "data/payouts_converted.csv",
+}
+ANALYSES = ("holistic", "revenue", "payouts", "installs")
+MANIFEST_NAME = "partitions.json"
+
+# Ad spend is keyed by these columns; it is split between apps by their share of the installs of each cell
+SPEND_CELL = ["day", "country_id", "network_id"]
+
+
+def _app_dir(out_dir, app_id):
+    return os.path.join(out_dir, f"app_{app_id}")
+
+
+def _write_partitions(frame, app_ids, out_dir, name, columns):
+    # Append each app's rows to its file; every file was created with its header beforehand
+    for app_id, rows in frame.groupby(app_ids, sort=False):
+        rows[columns].to_csv(os.path.join(_app_dir(out_dir, app_id), APP_FILES[name]), mode="a", header=False,
+                             index=False)
+
+
+def _install_shares(install_counts, cell):
+    # The share of each app in the installs of each cell, as a frame with the cell columns, app_id and share
+    shares = install_counts / install_counts.groupby(level=cell).transform("sum")
+    return shares.rename("share").reset_index()
+
+
+def _split_micros(allocated):
+    # Split each source row's value_micros by the shares, rounding down and giving the micro-dollars left over to the
+    # largest remainders, so the parts of every row add up to it exactly; missing amounts stay missing
+    micros = allocated[MICROS_COLUMN]
+    missing = micros.isna().to_numpy()
+    micros = micros.fillna(0).to_numpy(dtype=np.int64)
+    exact = micros * allocated["share"].to_numpy()
+    parts = np.floor(exact).astype(np.int64)
+    source_rows = allocated["source_row"].to_numpy()
+    shortfall = micros - pd.Series(parts).groupby(source_rows).transform("sum").to_numpy()
+    order = np.lexsort((parts - exact, source_rows))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = pd.Series(source_rows[order]).groupby(source_rows[order]).cumcount().to_numpy()
+    return pd.arrays.IntegerArray(parts + (rank < shortfall), missing)
+
+
+def _format_fixed(values):
+    # Write amounts in fixed point, as data_check.convert_scientific_notation does, so the partitions never get a
+    # scientific notation value; missing and non-finite amounts are written as they are
+    values = np.asarray(values, dtype=float)
+    formatted = np.array(['{:.6f}'.format(value) for value in values], dtype=object)
+    return np.where(np.isfinite(values), formatted, values.astype(object))
+
+
+def _unattributed_value(rows):
+    # The USD value left out, plus its exact micro-dollars for files converted with as_micros; ad spend rows split
+    # between apps count once
+    n_rows = rows["source_row"].nunique() if "source_row" in rows.columns else len(rows)
+    value = {"rows": n_rows, USD_COLUMN: float(rows[USD_COLUMN].astype(float).sum())}
+    if MICROS_COLUMN in rows.columns:
+        value[MICROS_COLUMN] = sum_micros(rows[MICROS_COLUMN])
+    return value
+
+
+def _add_unattributed(totals, value):
+    for key, item in value.items():
+        totals[key] = totals.get(key, 0) + item
+
+
+def partition_by_app(data_paths=None, out_dir="apps", chunksize=1_000_000):
+    """
+    Splits the four datasets into one directory per app_id in a single pass over each file.
+
+    Installs are split by their app_id; installs without one are left out. Revenue and payouts rows are assigned to
+    the app of their install (looked up by binary search in the sorted, deduplicated installs); rows without a
+    matching install, or whose install has no app_id, cannot be attributed and are left out. Ad spend has no app_id,
+    so the spend of every (day, country_id, network_id) cell is split between the apps in proportion to their
+    installs in that cell; the share of the installs without an app_id is left out. Spend in a cell without installs
+    is split by the installs in the same country and network over all days, and is left out only if there are none.
+    The split value_usd is written in fixed point ('{:.6f}'). A value_micros column
+    (``data_check.convert_scientific_notation(as_micros=True)``) is split too, in whole micro-dollars that add up to
+    the cell's amount, and value_usd is written from it.
+
+    Every app directory gets all four files, with the names the ``*_main`` functions read by default, so the
+    analyses run unchanged from inside it.
+
+    Args:
+        data_paths (dict, optional): The source file of each dataset. Defaults to the files in data/.
+        out_dir (str): The directory the app directories are written to.
+        chunksize (int): The number of revenue, payouts and ad spend rows processed at a time.
+
+    Returns:
+        dict: The manifest, also written to <out_dir>/partitions.json, with the app_ids and the number of rows and
+        the value left unattributed per dataset (the number of rows only for installs).
+    """
+    data_paths = {**APP_FILES, **(data_paths or {})}
+    installs = pd.read_csv(data_paths["installs"])
+    app_ids = np.sort(installs["app_id"].dropna().unique())
+
+    headers = {name: pd.read_csv(path, nrows=0).columns for name, path in data_paths.items()}
+    for app_id in app_ids:
+        os.makedirs(os.path.join(_app_dir(out_dir, app_id), "data"), exist_ok=True)
+        for name, columns in headers.items():
+            pd.DataFrame(columns=columns).to_csv(os.path.join(_app_dir(out_dir, app_id), APP_FILES[name]),
+                                                 index=False)
+
+    _write_partitions(installs, installs["app_id"], out_dir, "installs", headers["installs"])
+    unattributed = {"installs": {"rows": int(installs["app_id"].isna().sum())}}
+
+    # Revenue and payouts follow their install; duplicated installs count for their first row, as everywhere else
+    install_index = build_install_index(installs[["event_date", "install_id"]])
+    first_rows = installs.drop_duplicates(subset="install_id", keep="first").sort_values("install_id",
+                                                                                          kind="mergesort")
+    app_of_install = first_rows["app_id"].to_numpy()
+    for name in ("revenue", "payouts"):
+        unattributed[name] = {"rows": 0, USD_COLUMN: 0.0}
+        # The amounts are copied as text, so they are written back exactly as they were read
+        for chunk in pd.read_csv(data_paths[name], chunksize=chunksize,
+                                 dtype={USD_COLUMN: str, MICROS_COLUMN: "Int64"}):
+            codes = lookup_install_codes(install_index, chunk["install_id"].to_numpy())
+            matched = codes >= 0
+            matched[matched] = pd.notna(app_of_install[codes[matched]])
+            _add_unattributed(unattributed[name], _unattributed_value(chunk[~matched]))
+            chunk = chunk[matched]
+            _write_partitions(chunk, app_of_install[codes[matched]], out_dir, name, headers[name])
+
+    # Each app's share of the installs of every spend cell, and of every (country_id, network_id) over all days for
+    # spend on days without installs in its cell
+    # installs without an app_id keep their share, which is left unattributed
+    cells = installs.assign(day=day_numbers(installs["event_date"])).dropna(subset=SPEND_CELL)
+    cells = cells.groupby(SPEND_CELL + ["app_id"], dropna=False).size()
+    shares = _install_shares(cells, SPEND_CELL)
+    fallback_cell = SPEND_CELL[1:]
+    fallback_shares = _install_shares(cells.groupby(level=fallback_cell + ["app_id"]).sum(), fallback_cell)
+    unattributed["adspend"] = {"rows": 0, USD_COLUMN: 0.0}
+    for chunk in pd.read_csv(data_paths["adspend"], chunksize=chunksize):
+        chunk["day"] = day_numbers(chunk["event_date"])
+        chunk["source_row"] = np.arange(len(chunk))
+        in_cells = chunk.set_index(SPEND_CELL).index.isin(shares.set_index(SPEND_CELL).index)
+        allocated = pd.concat([chunk[in_cells].merge(shares, on=SPEND_CELL),
+                               chunk[~in_cells].merge(fallback_shares, on=fallback_cell, how="left")])
+        matched = allocated["share"].notna()
+        _add_unattributed(unattributed["adspend"], _unattributed_value(allocated[~matched]))
+        allocated = allocated[matched].copy()
+        scaled = _format_fixed(allocated[USD_COLUMN].astype(float) * allocated["share"])
+        if MICROS_COLUMN in allocated.columns:
+            micros = _split_micros(allocated)
+            formatted = format_usd(micros.fillna(0)).to_numpy(dtype=object)
+            allocated[USD_COLUMN] = np.where(micros.isna(), scaled, formatted)
+            allocated[MICROS_COLUMN] = micros
+        else:
+            allocated[USD_COLUMN] = scaled
+        # The split is done over all the installs of a row's cell, so the parts add up to the row before the
+        # share of installs without an app_id is taken out
+        no_app = allocated["app_id"].isna()
+        _add_unattributed(unattributed["adspend"], _unattributed_value(allocated[no_app]))
+        allocated = allocated[~no_app]
+        _write_partitions(allocated, allocated["app_id"].astype(app_ids.dtype), out_dir, "adspend",
+                          headers["adspend"])
+
+    manifest = {"app_ids": [app_id.item() for app_id in app_ids], "unattributed": unattributed}
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def _to_json_value(value):
+    # Scalars and containers as JSON; tables are written to CSV files instead
+    if isinstance(value, dict):
+        return {str(key): _to_json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _to_json_value(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def write_result(result, results_dir, name):
+    """
+    Writes a result dataclass as <name>.json with its scalar fields and one <name>_<field>.csv per table.
+
+    Args:
+        result: The result of a ``*_main`` function.
+        results_dir (str): The output directory.
+        name (str): The name of the analysis.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    scalars = {}
+    for result_field in dataclasses.fields(result):
+        value = getattr(result, result_field.name)
+        if result_field.name == "figures":
+            continue
+        tables = value if isinstance(value, dict) else {None: value}
+        if all(isinstance(table, (pd.Series, pd.DataFrame)) for table in tables.values()) and tables:
+            for key, table in tables.items():
+                suffix = result_field.name if key is None else f"{result_field.name}_{key}"
+                table.to_csv(os.path.join(results_dir, f"{name}_{suffix}.csv"))
+        else:
+            scalars[result_field.name] = _to_json_value(value)
+    with open(os.path.join(results_dir, f"{name}.json"), "w") as file:
+        json.dump(scalars, file, indent=2)
+
+
+def _run_analysis(name):
+    # The analyses read the default data/ paths, relative to the app directory
+    if name == "holistic":
+        return holistic_main(make_plots=False)
+    if name == "revenue":
+        return revenue_main(make_plots=False)
+    if name == "payouts":
+        return payouts_main(APP_FILES["payouts"], make_plots=False)
+    if name == "installs":
+        return installs_main(APP_FILES["installs"], make_plots=False)
+    raise ValueError(f"Unknown analysis: {name}")
+
+
+def run_app(app_dir, analyses=ANALYSES):
+    """
+    Runs the analyses on one app's partition and writes their results to <app_dir>/results.
+
+    The process works from inside the app directory, so the analyses read the app's files through their default
+    paths. An analysis that fails, e.g. on an app without any revenue, is recorded in errors.json instead of
+    stopping the batch.
+
+    Args:
+        app_dir (str): The app directory written by ``partition_by_app``.
+        analyses (iterable of str): The analyses to run, from ``ANALYSES``.
+
+    Returns:
+        dict: The error message of each failed analysis.
+    """
+    os.chdir(os.path.abspath(app_dir))
+    errors = {}
+    for name in analyses:
+        try:
+            write_result(_run_analysis(name), "results", name)
+        except Exception as error:
+            errors[name] = f"{type(error).__name__}: {error}"
+    with open(os.path.join("results", "errors.json"), "w") as file:
+        json.dump(errors, file, indent=2)
+    return errors
+
+
+def batch_main(data_paths=None, out_dir="apps", analyses=ANALYSES, max_workers=None, chunksize=1_000_000):
+    """
+    Runs the pipeline per app_id: partitions the data once, then analyses the apps in parallel.
+
+    Args:
+        data_paths (dict, optional): The source file of each dataset; see ``partition_by_app``.
+        out_dir (str): The directory the app directories are written to.
+        analyses (iterable of str): The analyses to run per app, from ``ANALYSES``.
+        max_workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+        chunksize (int): The number of rows processed at a time while partitioning.
+
+    Returns:
+        dict: The errors of each app, keyed by app_id; empty for apps whose analyses all succeeded.
+    """
+    manifest = partition_by_app(data_paths, out_dir, chunksize)
+    app_dirs = [os.path.abspath(_app_dir(out_dir, app_id)) for app_id in manifest["app_ids"]]
+    # Each worker changes its own working directory, so the main process's stays where it is
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        errors = executor.map(run_app, app_dirs, [tuple(analyses)] * len(app_dirs))
+        return dict(zip(manifest["app_ids"], errors))
+
+
+if __name__ == "__main__":
+    for app, app_errors in batch_main().items():
+        print(f"app {app}: {'ok' if not app_errors else app_errors}")
@@ -0,0 +1,220 @@
+import tempfile
+
+import pandas as pd
+
+from date_dimension import parse_event_dates
+from dedup import partition_keys
+from hyperloglog import DEFAULT_PRECISION, HyperLogLog
+
+DEFAULT_CHUNKSIZE = 1_000_000
+
+# Number of partial aggregates collected before they are folded into one, to bound peak memory
+_COMBINE_EVERY = 16
+
+
+def _combine(partials, how):
+    # Fold partial group-by results from several chunks into a single result with the same index
+    combined = pd.concat(partials)
+    levels = list(range(combined.index.nlevels))
+    return getattr(combined.groupby(level=levels), how)()
+
+
+def _fold(partials_iter, how):
+    # Combine partial results incrementally so at most _COMBINE_EVERY partials are held at once
+    pending = []
+    for partial in partials_iter:
+        pending.append(partial)
+        if len(pending) >= _COMBINE_EVERY:
+            pending = [_combine(pending, how)]
+    if not pending:
+        return pd.Series(dtype=float)
+    return _combine(pending, how)
+
+
+def is_chunked(data):
+    """
+    Checks whether the data is a chunked CSV source rather than an in-memory DataFrame.
+
+    Args:
+        data: A pandas DataFrame or a ChunkedCSV.
+
+    Returns:
+        bool: True if the data is a ChunkedCSV.
+    """
+    return isinstance(data, ChunkedCSV)
+
+
+class ChunkedCSV:
+    """
+    A CSV file that is streamed in fixed-size chunks instead of being loaded into memory at once.
+
+    It supports the subset of the DataFrame interface used by the analysis functions: ``df[column]`` reductions
+    (sum, count, mean, min, max, nunique, value_counts) and ``df.groupby(by)[column]`` aggregations (sum, count,
+    mean, min, max) plus ``df.groupby(by).size()``. Every call is a single streaming pass that reads only the
+    columns it needs, so peak memory is bounded by the chunk size and the size of the result.
+    """
+
+    def __init__(self, file_path, chunksize=DEFAULT_CHUNKSIZE, parse_dates=None):
+        self.file_path = file_path
+        self.chunksize = chunksize
+        self.parse_dates = list(parse_dates or [])
+
+    @property
+    def columns(self):
+        return pd.read_csv(self.file_path, nrows=0).columns
+
+    def chunks(self, columns=None):
+        """
+        Yields the file chunk by chunk.
+
+        Args:
+            columns (list of str, optional): Only read these columns.
+
+        Returns:
+            iterator of pd.DataFrame: The chunks.
+        """
+        parse_dates = [column for column in self.parse_dates if columns is None or column in columns]
+        chunks = pd.read_csv(self.file_path, usecols=columns, chunksize=self.chunksize)
+        if not parse_dates:
+            return chunks
+        return self._parse_dates(chunks, parse_dates)
+
+    @staticmethod
+    def _parse_dates(chunks, parse_dates):
+        # Parse only the distinct dates of each chunk, with the explicit event_date format
+        for chunk in chunks:
+            for column in parse_dates:
+                chunk[column] = parse_event_dates(chunk[column])
+            yield chunk
+
+    def __getitem__(self, column):
+        return ChunkedColumn(self, column)
+
+    def groupby(self, by):
+        return ChunkedGroupBy(self, by)
+
+    def __repr__(self):
+        return f"ChunkedCSV({self.file_path!r}, chunksize={self.chunksize})"
+
+
+class ChunkedColumn:
+    """A single column of a ChunkedCSV, reduced chunk by chunk."""
+
+    def __init__(self, source, column):
+        self.source = source
+        self.column = column
+
+    def _values(self):
+        for chunk in self.source.chunks([self.column]):
+            yield chunk[self.column]
+
+    def sum(self):
+        return sum(values.sum() for values in self._values())
+
+    def count(self):
+        return sum(int(values.count()) for values in self._values())
+
+    def mean(self):
+        total = 0.0
+        count = 0
+        for values in self._values():
+            total += values.sum()
+            count += int(values.count())
+        return total / count if count else float("nan")
+
+    def min(self):
+        return min((values.min() for values in self._values() if values.count()), default=float("nan"))
+
+    def max(self):
+        return max((values.max() for values in self._values() if values.count()), default=float("nan"))
+
+    def unique(self):
+        # The result holds every distinct value, so memory grows with their number
+        seen = set()
+        for values in self._values():
+            seen.update(values.dropna().unique())
+        return pd.Index(list(seen))
+
+    def nunique(self):
+        # Count the distinct values of each hash partition on disk, so memory is bounded by the largest partition
+        # rather than by the number of distinct values; values are compared as they are written in the file
+        with tempfile.TemporaryDirectory() as work_dir:
+            paths, _ = partition_keys(self.source.file_path, work_dir, self.column, chunksize=self.source.chunksize)
+            return sum(pd.read_csv(path, usecols=[self.column], dtype={self.column: str})[self.column].nunique()
+                       for path in paths)
+
+    def approx_nunique(self, precision=DEFAULT_PRECISION):
+        # A HyperLogLog sketch has a fixed size, unlike the set of values kept by unique
+        sketch = HyperLogLog(precision)
+        for values in self._values():
+            sketch.add(values)
+        return sketch.count()
+
+    def value_counts(self):
+        # Like unique, the result has one entry per distinct value
+        return _fold((values.value_counts() for values in self._values()), "sum").sort_values(ascending=False)
+
+
+class ChunkedGroupBy:
+    """A group-by over a ChunkedCSV; partial aggregates of each chunk are combined into the final result."""
+
+    def __init__(self, source, by):
+        self.source = source
+        self.by = [by] if isinstance(by, str) else list(by)
+
+    def __getitem__(self, column):
+        return ChunkedSeriesGroupBy(self.source, self.by, column)
+
+    def size(self):
+        chunks = self.source.chunks(self.by)
+        return _fold((chunk.groupby(self.by).size() for chunk in chunks), "sum")
+
+
+class ChunkedSeriesGroupBy:
+    """One column of a ChunkedGroupBy."""
+
+    def __init__(self, source, by, column):
+        self.source = source
+        self.by = by
+        self.column = column
+
+    def _partials(self, how):
+        for chunk in self.source.chunks(self.by + [self.column]):
+            yield getattr(chunk.groupby(self.by)[self.column], how)()
+
+    def sum(self):
+        return _fold(self._partials("sum"), "sum").rename(self.column)
+
+    def count(self):
+        return _fold(self._partials("count"), "sum").rename(self.column)
+
+    def min(self):
+        return _fold(self._partials("min"), "min").rename(self.column)
+
+    def max(self):
+        return _fold(self._partials("max"), "max").rename(self.column)
+
+    def mean(self):
+        return (self.sum() / self.count()).rename(self.column)
+
+
+def multi_groupby_sum(source, by_columns, column):
+    """
+    Sums a column grouped by several keys independently, in a single streaming pass.
+
+    Args:
+        source (ChunkedCSV): The chunked data.
+        by_columns (list of str): The keys to group by, one result per key.
+        column (str): The column to sum.
+
+    Returns:
+        list of pd.Series: The sums for each key, in the order of ``by_columns``.
+    """
+    pending = {by: [] for by in by_columns}
+    for chunk in source.chunks(list(dict.fromkeys(by_columns + [column]))):
+        for by in by_columns:
+            pending[by].append(chunk.groupby(by)[column].sum())
+            if len(pending[by]) >= _COMBINE_EVERY:
+                pending[by] = [_combine(pending[by], "sum")]
+    return [_combine(pending[by], "sum").rename(column) if pending[by] else pd.Series(dtype=float, name=column)
+            for by in by_columns]
@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+from date_dimension import day_numbers, parse_event_dates
+from reporting import print_cohort_report
+from results import CohortResult
+
+HORIZONS = (1, 7, 30, 90)
+EVENT_COLUMNS = ["event_date", "install_id", "value_usd"]
+
+
+def build_install_index(installs, dimensions=()):
+    """
+    Builds a sorted, integer-coded lookup of installs and assigns every install to its cohort.
+
+    Installs are deduplicated on install_id (keeping the first row, as in the holistic conversion rate) and sorted by
+    install_id, so an install's integer code is its position in the sorted order. The cohort of an install is its
+    install date, optionally split further by dimensions such as country_id, network_id or app_id.
+
+    Args:
+        installs (pd.DataFrame): The installs data with event_date, install_id and the requested dimensions.
+        dimensions (iterable of str): Extra install columns to split cohorts by.
+
+    Returns:
+        dict: A dictionary containing the following keys:
+            - install_ids (numpy.ndarray): The sorted unique install_ids.
+            - install_day (numpy.ndarray): The install day number for each install code.
+            - cohort_code (numpy.ndarray): The cohort number for each install code.
+            - cohorts (pd.Series): The number of installs per cohort, indexed by the cohort keys.
+    """
+    dimensions = list(dimensions)
+    installs = installs.drop_duplicates(subset="install_id", keep="first")
+    installs = installs.sort_values("install_id", kind="mergesort")
+
+    keys = installs[dimensions].copy()
+    keys.insert(0, "install_date", parse_event_dates(installs["event_date"]))
+    # Installs with a missing date or dimension keep their own cohort instead of getting no cohort code; without an
+    # install day their events fall outside every horizon
+    grouped = keys.groupby(list(keys.columns), sort=True, dropna=False)
+
+    return {
+        "install_ids": installs["install_id"].to_numpy(),
+        "install_day": day_numbers(keys["install_date"]),
+        "cohort_code": grouped.ngroup().to_numpy(),
+        "cohorts": grouped.size().rename("installs"),
+    }
+
+
+def lookup_install_codes(install_index, install_ids):
+    """
+    Resolves event install_ids to install codes by binary search against the sorted install_ids.
+
+    Args:
+        install_index (dict): The output of ``build_install_index``.
+        install_ids (array-like): The install_ids of a batch of events.
+
+    Returns:
+        numpy.ndarray: The install code of each event, or -1 when the install_id is not in the installs data.
+    """
+    sorted_ids = install_index["install_ids"]
+    install_ids = np.asarray(install_ids)
+    if len(sorted_ids) == 0:
+        return np.full(len(install_ids), -1)
+    codes = np.searchsorted(sorted_ids, install_ids)
+    codes[codes == len(sorted_ids)] = 0
+    codes[sorted_ids[codes] != install_ids] = -1
+    return codes
+
+
+def accumulate_cohort_values(install_index, events, horizons=HORIZONS, totals=None):
+    """
+    Adds the values of a batch of events to per-cohort, per-horizon buckets.
+
+    Every event is placed in the first horizon bucket that covers its day offset from install (offset 0 is the
+    install day, and an event counts towards D7 when it happens at most 7 days after install). Events before the
+    install date, beyond the largest horizon or without a matching install are ignored. Summing the buckets
+    cumulatively gives the D1/D7/... values, so a batch costs a single ``np.bincount``.
+
+    Args:
+        install_index (dict): The output of ``build_install_index``.
+        events (pd.DataFrame): A batch of revenue or payout events with event_date, install_id and value_usd.
+        horizons (iterable of int): The horizons in days, in ascending order.
+        totals (numpy.ndarray, optional): An array of shape (number of cohorts, number of horizons) to add to.
+
+    Returns:
+        tuple: The updated totals array and the largest event day number in the batch (or None if it was empty).
+    """
+    horizons = np.asarray(horizons)
+    n_cohorts = len(install_index["cohorts"])
+    if totals is None:
+        totals = np.zeros((n_cohorts, len(horizons)))
+    if events.empty:
+        return totals, None
+
+    event_day = day_numbers(events["event_date"])
+    codes = lookup_install_codes(install_index, events["install_id"].to_numpy())
+    matched = codes >= 0
+    codes = codes[matched]
+    offset = event_day[matched] - install_index["install_day"][codes]
+    bucket = np.searchsorted(horizons, offset, side="left")
+    in_range = (offset >= 0) & (bucket < len(horizons))
+
+    cell = install_index["cohort_code"][codes[in_range]] * len(horizons) + bucket[in_range]
+    values = events["value_usd"].to_numpy(dtype=float)[matched][in_range]
+    totals += np.bincount(cell, weights=values, minlength=n_cohorts * len(horizons)).reshape(totals.shape)
+    return totals, int(event_day.max())
+
+
+def _accumulate_csv(install_index, csv_path, horizons, chunksize):
+    # Stream the events file so that the full event table is never held in memory or joined
+    totals = None
+    last_day = None
+    for chunk in pd.read_csv(csv_path, usecols=EVENT_COLUMNS, chunksize=chunksize):
+        totals, chunk_last_day = accumulate_cohort_values(install_index, chunk, horizons, totals)
+        if chunk_last_day is not None:
+            last_day = chunk_last_day if last_day is None else max(last_day, chunk_last_day)
+    if totals is None:
+        totals = np.zeros((len(install_index["cohorts"]), len(horizons)))
+    return np.cumsum(totals, axis=1), last_day
+
+
+def cohort_ltv(installs_csv, revenue_csv, payouts_csv, dimensions=(), horizons=HORIZONS, chunksize=5_000_000):
+    """
+    Computes cumulative revenue and payouts per install cohort at several days-since-install horizons.
+
+    Cohorts whose install date is too recent for a horizon to have fully elapsed (relative to the last event in the
+    revenue and payouts data) get NaN for that horizon instead of a misleadingly low value.
+
+    Args:
+        installs_csv (str): The path to the CSV file containing installs data.
+        revenue_csv (str): The path to the CSV file containing revenue data.
+        payouts_csv (str): The path to the CSV file containing payouts data.
+        dimensions (iterable of str): Extra install columns to split cohorts by, e.g. ("country_id",).
+        horizons (iterable of int): The horizons in days, in ascending order.
+        chunksize (int): The number of revenue/payout rows processed at a time.
+
+    Returns:
+        pd.DataFrame: One row per cohort with the installs count and revenue_d{n} / payouts_d{n} columns.
+    """
+    horizons = sorted(horizons)
+    installs = pd.read_csv(installs_csv, usecols=["event_date", "install_id", *dimensions])
+    install_index = build_install_index(installs, dimensions)
+    del installs
+
+    revenue, revenue_last_day = _accumulate_csv(install_index, revenue_csv, horizons, chunksize)
+    payouts, payouts_last_day = _accumulate_csv(install_index, payouts_csv, horizons, chunksize)
+    last_days = [day for day in (revenue_last_day, payouts_last_day) if day is not None]
+
+    cohorts = install_index["cohorts"]
+    result = cohorts.to_frame()
+    cohort_day = day_numbers(cohorts.index.get_level_values("install_date"))
+    for i, horizon in enumerate(horizons):
+        mature = cohort_day + horizon <= max(last_days) if last_days else np.zeros(len(cohorts), dtype=bool)
+        result[f"revenue_d{horizon}"] = np.where(mature, revenue[:, i], np.nan)
+        result[f"payouts_d{horizon}"] = np.where(mature, payouts[:, i], np.nan)
+    return result
+
+
+def cohort_main():
+    # Set the paths to the CSV files
+    installs_path = "data/installs.csv"
+    revenue_path = "data/revenue_converted.csv"
+    payouts_path = "data/payouts_converted.csv"
+
+    cohorts = cohort_ltv(installs_path, revenue_path, payouts_path)
+    cohorts_by_network = cohort_ltv(installs_path, revenue_path, payouts_path, dimensions=("network_id",))
+
+    cohorts.to_csv("cohort_ltv.csv")
+    cohorts_by_network.to_csv("cohort_ltv_by_network.csv")
+
+    return CohortResult(cohorts=cohorts, cohorts_by_network=cohorts_by_network)
+
+
+if __name__ == "__main__":
+    print_cohort_report(cohort_main())
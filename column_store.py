@@ -0,0 +1,211 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from date_dimension import day_numbers
+
+DEFAULT_CHUNKSIZE = 1_000_000
+DATE_COLUMNS = ["event_date"]
+FLOAT_COLUMNS = ["value_usd"]
+
+# Written last by a conversion; a store without it is incomplete
+MANIFEST_NAME = "manifest.json"
+
+
+def column_store_path(csv_path):
+    """
+    Returns the directory holding the per-column .npy files of a CSV file, e.g. data/revenue_converted_columns.
+
+    Args:
+        csv_path (str): The path to the CSV file.
+
+    Returns:
+        str: The column store directory.
+    """
+    return os.path.splitext(csv_path)[0] + "_columns"
+
+
+def _column_dtype(column, values):
+    # Dates are stored as int32 day numbers, value columns as float64 (value_micros as int64) and other numeric
+    # columns as they are parsed
+    if column in DATE_COLUMNS:
+        return np.dtype(np.int32)
+    if column in FLOAT_COLUMNS:
+        return np.dtype(np.float64)
+    if pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return np.dtype(np.int64)
+    if pd.api.types.is_float_dtype(values):
+        return np.dtype(np.float64)
+    return None
+
+
+def _promote_to_float64(raw_path, block_rows):
+    # Rewrite the int64 values written so far as float64, one block at a time
+    float_path = raw_path + ".float64"
+    with open(raw_path, "rb") as raw, open(float_path, "wb") as out:
+        while True:
+            block = np.frombuffer(raw.read(block_rows * 8), dtype=np.int64)
+            if not len(block):
+                break
+            out.write(block.astype(np.float64).tobytes())
+    os.replace(float_path, raw_path)
+
+
+def _write_npy(raw_path, npy_path, dtype, n_rows):
+    # Prefix the raw values with an .npy header now that the number of rows is known
+    header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (n_rows,)}
+    with open(raw_path, "rb") as raw, open(npy_path, "wb") as npy:
+        np.lib.format.write_array_header_1_0(npy, header)
+        shutil.copyfileobj(raw, npy, 1 << 24)
+    os.remove(raw_path)
+
+
+def _csv_signature(csv_path):
+    # The size and modification time identify the version of the CSV file a store was converted from
+    stat = os.stat(csv_path)
+    return {"csv_size": stat.st_size, "csv_mtime_ns": stat.st_mtime_ns}
+
+
+def convert_csv_to_columns(csv_path, out_dir=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Writes every numeric and date column of a CSV file to its own .npy file.
+
+    The file is parsed once, chunk by chunk, and each column is appended to a raw file; the rows are counted by the
+    parser, so quoted fields with line breaks are counted correctly. Date columns are stored as int32 day numbers
+    (days since 1970-01-01). String columns such as install_id are skipped.
+
+    The dtype of each column is taken from the first chunk and promoted when a later chunk needs more: an integer
+    column in which a later chunk has a missing or fractional value is rewritten as float64 (exact up to 2**53), so
+    missing values are stored as NaN. A column that is numeric in the first chunk but not in a later one raises a
+    ValueError.
+
+    The store is built in a temporary directory next to ``out_dir`` and moved into place when it is complete, and its
+    manifest is written last, so a conversion that fails part way never leaves a store that ``load_columns`` trusts.
+
+    Args:
+        csv_path (str): The path to the CSV file.
+        out_dir (str, optional): The output directory. Defaults to ``column_store_path(csv_path)``.
+        chunksize (int): The number of rows parsed at a time.
+
+    Returns:
+        ColumnStore: The converted columns.
+    """
+    out_dir = out_dir or column_store_path(csv_path)
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    signature = _csv_signature(csv_path)
+    work_dir = tempfile.mkdtemp(dir=parent, prefix=".columns_")
+    try:
+        dtypes = None
+        files = {}
+        n_rows = 0
+        try:
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+                if dtypes is None:
+                    dtypes = {column: _column_dtype(column, chunk[column]) for column in chunk.columns}
+                    dtypes = {column: dtype for column, dtype in dtypes.items() if dtype is not None}
+                    files = {column: open(os.path.join(work_dir, f"{column}.raw"), "wb") for column in dtypes}
+                for column, dtype in dtypes.items():
+                    if column in DATE_COLUMNS:
+                        values = day_numbers(chunk[column])
+                    else:
+                        chunk_dtype = _column_dtype(column, chunk[column])
+                        if chunk_dtype is None:
+                            raise ValueError(f"{csv_path}: column {column!r} is numeric in the first rows but holds "
+                                             f"non-numeric values in the rows after row {n_rows}")
+                        if dtype.kind == "i" and chunk_dtype.kind == "f":
+                            # A missing or fractional value in a later chunk turns the whole column into float64
+                            raw_path = os.path.join(work_dir, f"{column}.raw")
+                            files[column].close()
+                            _promote_to_float64(raw_path, chunksize)
+                            files[column] = open(raw_path, "ab")
+                            dtype = dtypes[column] = np.dtype(np.float64)
+                        values = chunk[column].to_numpy(dtype=dtype)
+                    files[column].write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+                n_rows += len(chunk)
+        finally:
+            for file in files.values():
+                file.close()
+
+        for column, dtype in (dtypes or {}).items():
+            _write_npy(os.path.join(work_dir, f"{column}.raw"), os.path.join(work_dir, f"{column}.npy"), dtype, n_rows)
+
+        # Swap the finished store in for the old one, then mark it complete
+        if os.path.isdir(out_dir):
+            stale_dir = tempfile.mkdtemp(dir=parent, prefix=".stale_columns_")
+            os.rmdir(stale_dir)
+            os.rename(out_dir, stale_dir)
+            shutil.rmtree(stale_dir)
+        os.rename(work_dir, out_dir)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as file:
+        json.dump({"rows": n_rows, **signature}, file)
+    return ColumnStore(out_dir)
+
+
+def _is_complete(out_dir, csv_path):
+    # A store is usable only if its manifest exists and was written for the current version of the CSV file
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return all(manifest.get(key) == value for key, value in _csv_signature(csv_path).items())
+
+
+def load_columns(csv_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Opens the column store of a CSV file, converting the file first if the store is missing, incomplete or was
+    converted from another version of the CSV.
+
+    Args:
+        csv_path (str): The path to the CSV file.
+        chunksize (int): The number of rows parsed at a time when converting.
+
+    Returns:
+        ColumnStore: The columns of the CSV file.
+    """
+    out_dir = column_store_path(csv_path)
+    if not _is_complete(out_dir, csv_path):
+        return convert_csv_to_columns(csv_path, out_dir, chunksize)
+    return ColumnStore(out_dir)
+
+
+class ColumnStore:
+    """
+    A directory of .npy column files, opened lazily as read-only memory maps.
+
+    ``store[column]`` returns a NumPy array backed by the file, so only the columns a function touches are read, and
+    reductions are a sequential scan of one file. Missing values are stored as NaN and, unlike in a DataFrame, plain
+    NumPy reductions do not skip them: use ``np.nansum`` and the like, or ``money.total_usd``. It can be passed in
+    place of a DataFrame to functions that only reduce whole columns and skip NaN, e.g.
+    ``revenue_analysis.total_revenue``.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._arrays = {}
+
+    @property
+    def columns(self):
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(self.directory) if name.endswith(".npy"))
+
+    def __getitem__(self, column):
+        if column not in self._arrays:
+            path = os.path.join(self.directory, f"{column}.npy")
+            if not os.path.exists(path):
+                raise KeyError(column)
+            self._arrays[column] = np.load(path, mmap_mode="r")
+        return self._arrays[column]
+
+    def __len__(self):
+        columns = self.columns
+        return len(self[columns[0]]) if columns else 0
+
+    def __repr__(self):
+        return f"ColumnStore({self.directory!r})"
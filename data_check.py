@@ -1,13 +1,47 @@
+import argparse
 import csv
+import json
 import re
+import numpy as np
 import pandas as pd
-import time
 
+from dedup import find_duplicates
+from hyperloglog import HyperLogLog
+from money import MICROS_COLUMN, format_usd, to_micros
+from reporting import print_data_check_report
+from results import DataCheckResult
 
-def convert_scientific_notation(file_path):
+
+def convert_scientific_notation(file_path, as_micros=False):
+    """
+    Writes a copy of a CSV file with value_usd in fixed-point decimals to <name>_converted.csv.
+
+    With ``as_micros`` the copy also gets a value_micros column of int64 micro-dollars, and value_usd is formatted
+    from those integers so both columns agree. value_micros is an addition, not a replacement: every analysis keeps
+    reading value_usd, and only the USD totals are summed exactly from value_micros (see ``money.total_usd``).
+    Missing and non-finite amounts are left empty in value_micros and keep their value_usd cell; the quality report of
+    ``validate_csv`` counts them as value_micros nulls.
+
+    Args:
+        file_path (str): The path to the CSV file, ending in .csv.
+        as_micros (bool): Add the value_micros column.
+
+    Returns:
+        str: The path of the converted file.
+    """
     # Load CSV into pandas dataframe
     df = pd.read_csv(file_path)
 
+    if as_micros:
+        new_file_path = file_path[:-4] + '_converted.csv'
+        if "value_usd" in df.columns:
+            micros = to_micros(df["value_usd"], allow_missing=True)
+            formatted = format_usd(micros.fillna(0)).to_numpy(dtype=object)
+            df["value_usd"] = np.where(micros.isna(), df["value_usd"].to_numpy(dtype=object), formatted)
+            df.insert(df.columns.get_loc("value_usd") + 1, MICROS_COLUMN, micros)
+            df.to_csv(new_file_path, index=False)
+        return new_file_path
+
     # Identify columns with scientific notation
     scientific_cols = df.select_dtypes(include=['float', 'int']).columns
 
@@ -20,10 +54,6 @@ def convert_scientific_notation(file_path):
             df[col] = df[col].apply(lambda x: '{:.6f}'.format(x))
             # Write dataframe to new CSV file
             df.to_csv(new_file_path, index=False)
-        else:
-            print("Not value_usd column")
-
-    print("Conversion completed.\n")
 
     return new_file_path
 
@@ -80,6 +110,168 @@ def check_data_types(file_path):
     return data_types_count
 
 
+# Accepted value_usd range of the streaming validator; values outside it are flagged as anomalies
+VALUE_USD_RANGE = (0.0, None)
+
+# Clean data paths, which the analyses read
+CLEAN_PATHS = {
+    "adspend": "data/adspend_converted.csv",
+    "installs": "data/installs.csv",
+    "payouts": "data/payouts_converted.csv",
+    "revenue": "data/revenue_converted.csv",
+}
+
+# Number of anomalous row numbers kept in the quality report
+MAX_FLAGGED_ROWS = 20
+
+# The grammars int() and float() accept once surrounding whitespace is stripped, underscores between digits included
+_DIGITS = r"\d(?:_?\d)*"
+_INT_PATTERN = rf"[+-]?{_DIGITS}"
+_FLOAT_PATTERN = rf"[+-]?(?:(?:(?:{_DIGITS})?\.{_DIGITS}|{_DIGITS}\.?)(?:[eE][+-]?{_DIGITS})?|(?i:inf|infinity|nan))"
+_SCIENTIFIC_PATTERN = r"[eE][+-]?\d+"
+
+
+def _classify_cells(cells):
+    # Vectorized version of the per-cell classification of check_data_types, with the same int()/float() rules: "nan"
+    # and "inf" are floats, and whitespace around a number is ignored. Non-finite numbers come back as NaN/inf
+    stripped = cells.str.strip()
+    empty = cells == ""
+    is_int = stripped.str.fullmatch(_INT_PATTERN)
+    is_number = is_int | stripped.str.fullmatch(_FLOAT_PATTERN)
+    scientific = is_number & ~is_int & cells.str.contains(_SCIENTIFIC_PATTERN)
+    numbers = pd.to_numeric(stripped.where(is_number).str.replace("_", "", regex=False), errors="coerce")
+    # pd.to_numeric only reads ASCII digits; the few other numbers float() accepts are parsed one by one
+    missed = is_number & numbers.isna() & ~stripped.str.fullmatch(r"[+-]?(?i:nan)")
+    if missed.any():
+        numbers[missed] = stripped[missed].map(float)
+    counts = {
+        "int": int(is_int.sum()),
+        "float": int((is_number & ~is_int & ~scientific).sum()),
+        "string": int((~empty & ~is_number).sum()),
+        "empty": int(empty.sum()),
+        "scientific": int(scientific.sum()),
+    }
+    return counts, numbers
+
+
+def _combine_moments(stats, values):
+    # Chan et al. parallel update of the count, mean and sum of squared deviations (Welford's M2) with a chunk
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return
+    n_b = len(values)
+    mean_b = values.mean()
+    m2_b = ((values - mean_b) ** 2).sum()
+    n_a = stats["count"]
+    delta = mean_b - stats["mean"]
+    stats["count"] = n_a + n_b
+    stats["mean"] += delta * n_b / stats["count"]
+    stats["m2"] += m2_b + delta ** 2 * n_a * n_b / stats["count"]
+    stats["min"] = min(stats["min"], values.min())
+    stats["max"] = max(stats["max"], values.max())
+
+
+def validate_csv(file_path, chunksize=1_000_000, key_column="install_id", value_column="value_usd",
+                 value_range=VALUE_USD_RANGE, report_path=None, exact_duplicates=False):
+    """
+    Validates a CSV file in a single streaming pass and builds a data quality report.
+
+    Every cell is read once, as text, and used for the type classification of ``check_data_types``, the null counts,
+    and the min/max/mean/std of numeric columns (merged across chunks with Welford/Chan updates, so memory does not
+    grow with the file). The number of distinct keys is estimated with a HyperLogLog sketch, which gives an estimate
+    of the duplicate keys, and value_usd values outside ``value_range`` or not finite are flagged.
+
+    The sketch's error is relative to the number of distinct keys (0.8% of a million keys is 8000), so the duplicate
+    estimate comes with a 95% range and is only meaningful when duplicates are a sizeable share of the keys. With
+    ``exact_duplicates`` the duplicates are counted exactly by a second pass over hash partitions of the keys (see
+    ``dedup.find_duplicates``).
+
+    Args:
+        file_path (str): The path to the CSV file.
+        chunksize (int): The number of rows read at a time.
+        key_column (str): The column whose distinct values and duplicates are estimated, if present.
+        value_column (str): The column checked against ``value_range``, if present.
+        value_range (tuple): The (lower, upper) accepted bounds, inclusive; None for no bound.
+        report_path (str, optional): Write the report to this JSON file.
+        exact_duplicates (bool): Count the distinct and duplicated keys exactly instead of estimating them.
+
+    Returns:
+        dict: The quality report.
+    """
+    rows = 0
+    columns = {}
+    sketch = HyperLogLog()
+    key_count = 0
+    flagged = 0
+    flagged_rows = []
+    lower, upper = value_range
+
+    for chunk in pd.read_csv(file_path, dtype=str, keep_default_na=False, chunksize=chunksize):
+        for column in chunk.columns:
+            cells = chunk[column]
+            if column not in columns:
+                columns[column] = {"nulls": 0, "types": dict.fromkeys(["int", "float", "string", "empty",
+                                                                        "scientific"], 0),
+                                   "stats": {"count": 0, "mean": 0.0, "m2": 0.0, "min": np.inf, "max": -np.inf}}
+            summary = columns[column]
+            counts, numbers = _classify_cells(cells)
+            for data_type, count in counts.items():
+                summary["types"][data_type] += count
+            summary["nulls"] += counts["empty"]
+            _combine_moments(summary["stats"], numbers.to_numpy(dtype=float))
+
+            if column == key_column:
+                keys = cells[cells != ""]
+                sketch.add(keys)
+                key_count += len(keys)
+
+            if column == value_column:
+                values = numbers.to_numpy(dtype=float)
+                out_of_range = ~np.isfinite(values) & (cells != "").to_numpy()
+                if lower is not None:
+                    out_of_range |= values < lower
+                if upper is not None:
+                    out_of_range |= values > upper
+                flagged += int(out_of_range.sum())
+                if len(flagged_rows) < MAX_FLAGGED_ROWS:
+                    # Row numbers count data rows from 1, excluding the header
+                    positions = np.flatnonzero(out_of_range)[:MAX_FLAGGED_ROWS - len(flagged_rows)]
+                    flagged_rows.extend(int(rows + position + 1) for position in positions)
+        rows += len(chunk)
+
+    report = {"file": file_path, "rows": rows, "columns": {}}
+    for column, summary in columns.items():
+        stats = summary["stats"]
+        numeric = stats["count"] > 0
+        report["columns"][column] = {
+            "nulls": summary["nulls"],
+            "types": summary["types"],
+            "min": float(stats["min"]) if numeric else None,
+            "max": float(stats["max"]) if numeric else None,
+            "mean": stats["mean"] if numeric else None,
+            "std": float(np.sqrt(stats["m2"] / stats["count"])) if numeric else None,
+        }
+    if key_column in columns and exact_duplicates:
+        _, drop_rows, _ = find_duplicates(file_path, key_column, chunksize=chunksize)
+        report["key"] = {"column": key_column, "distinct": key_count - len(drop_rows), "duplicates": len(drop_rows)}
+    elif key_column in columns:
+        distinct = sketch.count()
+        # The 95% range of the distinct count bounds the duplicates from the other side
+        margin = int(np.ceil(1.96 * sketch.relative_error * distinct))
+        report["key"] = {"column": key_column, "approx_distinct": distinct,
+                         "approx_duplicates": max(key_count - distinct, 0),
+                         "duplicates_range": [max(key_count - distinct - margin, 0),
+                                              min(max(key_count - distinct + margin, 0), key_count)]}
+    if value_column in columns:
+        report["value_out_of_range"] = {"column": value_column, "range": list(value_range), "count": flagged,
+                                        "sample_rows": flagged_rows}
+
+    if report_path is not None:
+        with open(report_path, "w") as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
 def explore_csv(file_path):
     """
     Description:
@@ -117,64 +309,35 @@ def explore_csv(file_path):
     print(df.isnull().sum())
 
 
-def data_check_main():
-    # Call convert_scientific_notation
-    print("Adspend: ")
-    convert_scientific_notation('data/adspend.csv')
-    print("Installs:")
-    convert_scientific_notation('data/installs.csv')
-    print("Payouts:")
-    convert_scientific_notation('data/payouts.csv')
-    print("Revenue:")
-    convert_scientific_notation('data/revenue.csv')
-
-    print("Files are being exported...\n")
-    time.sleep(10)  # wait for 10 seconds for csv files to be exported
-
-    # Clean data paths
-    adspend_path = "data/adspend_converted.csv"
-    installs_path = "data/installs.csv"
-    payouts_path = "data/payouts_converted.csv"
-    revenue_path = "data/revenue_converted.csv"
-
-    # Call the function with the file paths and print the resulting dictionaries
-    print("Adspend: ")
-    data_types_count_adspend = check_data_types(adspend_path)
-    for column, count in data_types_count_adspend.items():
-        print(f"{column}, {count}")
-
-    print("\nInstalls: ")
-    data_types_count_installs = check_data_types(installs_path)
-    for column, count in data_types_count_installs.items():
-        print(f"{column}, {count}")
-
-    print("\nPayouts: ")
-    data_types_count_payouts = check_data_types(payouts_path)
-    for column, count in data_types_count_payouts.items():
-        print(f"{column}, {count}")
-
-    print("\nRevenue: ")
-    data_types_count_revenue = check_data_types(revenue_path)
-    for column, count in data_types_count_revenue.items():
-        print(f"{column}, {count}")
-
-    # Call explore_csv to explore data
-    print("______________________")
-    print("Explore Adspend:")
-    explore_csv('data/adspend_converted.csv')
-    print("______________________")
-    print("Explore Installs:")
-    explore_csv('data/installs.csv')
-    print("______________________")
-    print("Explore Payouts:")
-    explore_csv('data/payouts_converted.csv')
-    print("______________________")
-    print("Explore Revenue:")
-    explore_csv('data/revenue_converted.csv')
-    print("______________________")
+def data_check_main(as_micros=False):
+    # Convert scientific notation, or to micro-dollars; to_csv has finished writing each file when it returns
+    converted_paths = {
+        "adspend": convert_scientific_notation('data/adspend.csv', as_micros),
+        "installs": convert_scientific_notation('data/installs.csv', as_micros),
+        "payouts": convert_scientific_notation('data/payouts.csv', as_micros),
+        "revenue": convert_scientific_notation('data/revenue.csv', as_micros),
+    }
 
-    print("Done, files are ready for analysis.")
+    # Validate every clean file in one streaming pass; the type counts are those of check_data_types
+    quality_reports = {name: validate_csv(path, report_path=path[:-4] + "_quality.json")
+                       for name, path in CLEAN_PATHS.items()}
+    data_types_counts = {name: {column: summary["types"] for column, summary in report["columns"].items()}
+                         for name, report in quality_reports.items()}
+
+    return DataCheckResult(converted_paths=converted_paths, data_types_counts=data_types_counts,
+                           quality_reports=quality_reports)
 
 
 if __name__ == "__main__":
-    data_check_main()
+    parser = argparse.ArgumentParser(description="Convert the raw CSV files and report their data quality.")
+    parser.add_argument("--explore", action="store_true",
+                        help="also print the explore_csv summary of every clean file (loads each file in memory)")
+    args = parser.parse_args()
+
+    print_data_check_report(data_check_main())
+    if args.explore:
+        for path in CLEAN_PATHS.values():
+            explore_csv(path)
+    print("______________________")
+
+    print("Done, files are ready for analysis.")
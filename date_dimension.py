@@ -0,0 +1,143 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# The format of event_date in all data files
+DATE_FORMAT = "%Y-%m-%d"
+
+# The day number of missing or unparseable dates
+MISSING_DAY = np.iinfo(np.int32).min
+
+
+def _parse_unique_dates(dates, date_format):
+    # Parse with the explicit format; ISO 8601 variants such as full timestamps fall back to pandas' ISO parser
+    try:
+        return pd.to_datetime(dates, format=date_format)
+    except (ValueError, TypeError):
+        return pd.to_datetime(dates, format="ISO8601")
+
+
+def day_numbers(dates, date_format=DATE_FORMAT):
+    """
+    Converts dates to integer day numbers (days since 1970-01-01).
+
+    Strings are parsed with an explicit format, and only the distinct values are parsed, so a column of millions of
+    rows over a few hundred days costs a few hundred parses. Datetime values are converted without parsing.
+
+    Args:
+        dates (array-like): Dates as strings, datetimes or datetime64 values.
+        date_format (str): The format of date strings.
+
+    Returns:
+        numpy.ndarray: An int32 array of day numbers; missing dates are ``MISSING_DAY``.
+    """
+    dates = dates if isinstance(dates, (pd.Series, pd.Index)) else pd.Series(np.asarray(dates))
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        days = dates.to_numpy().astype("datetime64[D]")
+        return np.where(np.isnat(days), MISSING_DAY, days.astype(np.int64)).astype(np.int32)
+
+    codes, uniques = pd.factorize(dates)
+    unique_days = _parse_unique_dates(uniques, date_format).to_numpy().astype("datetime64[D]")
+    unique_days = np.where(np.isnat(unique_days), MISSING_DAY, unique_days.astype(np.int64)).astype(np.int32)
+    # Missing values have code -1, which picks the MISSING_DAY appended at the end
+    return np.append(unique_days, np.int32(MISSING_DAY))[codes]
+
+
+def days_to_datetime64(days):
+    """
+    Converts day numbers back to datetime64[ns] values.
+
+    Args:
+        days (array-like): Day numbers, e.g. the output of ``day_numbers``.
+
+    Returns:
+        numpy.ndarray: The dates as datetime64[ns]; ``MISSING_DAY`` becomes NaT.
+    """
+    days = np.asarray(days)
+    dates = days.astype("datetime64[D]").astype("datetime64[ns]")
+    dates[days == MISSING_DAY] = np.datetime64("NaT")
+    return dates
+
+
+def parse_event_dates(dates, date_format=DATE_FORMAT):
+    """
+    Parses a date column once into a datetime64[ns] column, never into Python date objects.
+
+    Args:
+        dates (pd.Series): The dates, e.g. the event_date column of a data file.
+        date_format (str): The format of date strings.
+
+    Returns:
+        pd.Series: The dates at midnight, with the index and name of ``dates``.
+    """
+    return pd.Series(days_to_datetime64(day_numbers(dates, date_format)), index=dates.index, name=dates.name)
+
+
+@lru_cache(maxsize=16)
+def date_dimension(first_day, last_day):
+    """
+    Builds the calendar attributes of every day in a range, once per range.
+
+    The table is cached and shared between callers, so it must not be modified.
+
+    Args:
+        first_day (int): The first day number.
+        last_day (int): The last day number, inclusive.
+
+    Returns:
+        pd.DataFrame: One row per day, indexed by day number, with the columns date, year, month (the first day of
+        the month), month_number, day_of_month, day_of_week (0 is Monday), day_name, iso_week and is_weekend.
+    """
+    days = np.arange(first_day, last_day + 1, dtype=np.int32)
+    dates = pd.DatetimeIndex(days_to_datetime64(days))
+    day_of_week = dates.dayofweek.to_numpy().astype(np.int8)
+    return pd.DataFrame({
+        "date": dates,
+        "year": dates.year.to_numpy().astype(np.int16),
+        "month": dates.to_numpy().astype("datetime64[M]").astype("datetime64[ns]"),
+        "month_number": dates.month.to_numpy().astype(np.int8),
+        "day_of_month": dates.day.to_numpy().astype(np.int8),
+        "day_of_week": day_of_week,
+        "day_name": pd.Categorical(dates.day_name()),
+        "iso_week": dates.isocalendar().week.to_numpy().astype(np.int8),
+        "is_weekend": day_of_week >= 5,
+    }, index=pd.Index(days, name="day"))
+
+
+def date_attributes(days, columns=None):
+    """
+    Looks up calendar attributes of day numbers in the date dimension instead of deriving them row by row.
+
+    Args:
+        days (array-like): Day numbers without missing days.
+        columns (list of str, optional): The attributes to return. Defaults to all of them.
+
+    Returns:
+        pd.DataFrame: One row per day number, in the order of ``days``.
+    """
+    days = np.asarray(days, dtype=np.int32)
+    first_day = int(days.min()) if len(days) else 0
+    dimension = date_dimension(first_day, int(days.max()) if len(days) else -1)
+    if columns is not None:
+        dimension = dimension[columns]
+    # The dimension has one row per day from first_day on, so a day's row is at its offset from first_day
+    return dimension.iloc[days - first_day].reset_index(drop=True)
+
+
+def temporal_scope(dates):
+    """
+    Finds the first and last date of a date column and the number of days they span.
+
+    Args:
+        dates (pd.Series): The dates.
+
+    Returns:
+        tuple: The first date (pd.Timestamp), the last date (pd.Timestamp) and the number of days between them,
+        inclusive.
+    """
+    days = day_numbers(dates)
+    days = days[days != MISSING_DAY]
+    first_day, last_day = int(days.min()), int(days.max())
+    first_date, last_date = pd.to_datetime(days_to_datetime64([first_day, last_day]))
+    return first_date, last_date, last_day - first_day + 1
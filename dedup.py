@@ -0,0 +1,174 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from hyperloglog import hash_values
+
+DEFAULT_PARTITIONS = 64
+ROW_COLUMN = "row_number"
+
+
+def _partition_path(work_dir, partition):
+    return os.path.join(work_dir, f"partition_{partition:04d}.csv")
+
+
+def partition_keys(csv_path, work_dir, key_column="install_id", n_partitions=DEFAULT_PARTITIONS,
+                   chunksize=1_000_000, columns=()):
+    """
+    Splits the keys of a CSV file into partition files by the hash of the key, so that all rows of a key end up in
+    the same, much smaller, partition.
+
+    Only the key, the requested columns and the row number (the position of the row in the file) are written, which
+    keeps the partitions a fraction of the size of the data. Rows are written in file order. Rows without a key are
+    skipped.
+
+    Args:
+        csv_path (str): The path to the CSV file.
+        work_dir (str): The directory the partition files are written to.
+        key_column (str): The column to partition on.
+        n_partitions (int): The number of partitions.
+        chunksize (int): The number of rows read at a time.
+        columns (iterable of str): Other columns to write with the key, e.g. value_usd.
+
+    Returns:
+        tuple: The paths of the non-empty partition files (list of str) and the number of rows in the file (int).
+    """
+    written = set()
+    n_rows = 0
+    usecols = [key_column] + [column for column in columns if column != key_column]
+    for chunk in pd.read_csv(csv_path, usecols=usecols, dtype={key_column: str}, chunksize=chunksize):
+        chunk = chunk[usecols]
+        chunk[ROW_COLUMN] = np.arange(n_rows, n_rows + len(chunk))
+        n_rows += len(chunk)
+        chunk = chunk[chunk[key_column].notna()]
+        partitions = hash_values(chunk[key_column]) % np.uint64(n_partitions)
+        for partition, rows in chunk.groupby(partitions):
+            path = _partition_path(work_dir, int(partition))
+            rows.to_csv(path, mode="a", header=path not in written, index=False)
+            written.add(path)
+    return sorted(written), n_rows
+
+
+def _find_partition_duplicates(path, key_column):
+    # Rows are appended in file order, so the first row of a key is the one with the lowest row number
+    keys = pd.read_csv(path, dtype={key_column: str})
+    repeated = keys[keys.duplicated(subset=key_column, keep=False)]
+    report = repeated.groupby(key_column)[ROW_COLUMN].agg(occurrences="size", first_row="min")
+    drop_rows = repeated.loc[repeated.duplicated(subset=key_column, keep="first"), ROW_COLUMN].to_numpy()
+    return report, drop_rows
+
+
+def find_duplicates(csv_path, key_column="install_id", n_partitions=DEFAULT_PARTITIONS, chunksize=1_000_000,
+                    max_workers=None, work_dir=None):
+    """
+    Finds duplicated keys in a CSV file without holding all keys in memory at once.
+
+    The keys are first partitioned to disk by hash (see ``partition_keys``); every partition is then deduplicated on
+    its own, in parallel, so memory is bounded by the largest partition rather than the whole file.
+
+    Args:
+        csv_path (str): The path to the CSV file.
+        key_column (str): The column to deduplicate on.
+        n_partitions (int): The number of partitions; raise it when a partition does not fit in memory.
+        chunksize (int): The number of rows read at a time.
+        max_workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+        work_dir (str, optional): The directory for the temporary partition files. Defaults to the system's
+            temporary directory.
+
+    Returns:
+        tuple: A tuple containing the following elements:
+            - pd.DataFrame: The duplicate report, one row per duplicated key with its number of occurrences and the
+              row number of its first occurrence, in order of first occurrence.
+            - numpy.ndarray: The sorted row numbers of all occurrences after the first, i.e. the rows to drop.
+            - int: The number of rows in the file.
+    """
+    with tempfile.TemporaryDirectory(dir=work_dir) as partition_dir:
+        paths, n_rows = partition_keys(csv_path, partition_dir, key_column, n_partitions, chunksize)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_find_partition_duplicates, paths, [key_column] * len(paths)))
+
+    reports = [report for report, _ in results]
+    if reports:
+        report = pd.concat(reports).sort_values("first_row").reset_index()
+    else:
+        report = pd.DataFrame({key_column: [], "occurrences": [], "first_row": []})
+    drop_rows = np.sort(np.concatenate([rows for _, rows in results])) if results else np.empty(0, dtype=np.int64)
+    return report, drop_rows, n_rows
+
+
+def write_deduplicated(csv_path, out_path, drop_rows, chunksize=1_000_000):
+    """
+    Copies a CSV file without the given rows, keeping the order of the remaining rows.
+
+    Args:
+        csv_path (str): The path to the CSV file.
+        out_path (str): The path of the deduplicated CSV file.
+        drop_rows (numpy.ndarray): The sorted row numbers to leave out.
+        chunksize (int): The number of rows read at a time.
+
+    Returns:
+        int: The number of rows written.
+    """
+    n_written = 0
+    start = 0
+    header = True
+    # Fields are copied as text, so values are written exactly as they were read
+    for chunk in pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunksize):
+        # drop_rows is sorted, so the rows of this chunk are one slice of it, found by binary search
+        first, last = np.searchsorted(drop_rows, [start, start + len(chunk)])
+        keep = np.ones(len(chunk), dtype=bool)
+        keep[drop_rows[first:last] - start] = False
+        start += len(chunk)
+        kept = chunk[keep]
+        kept.to_csv(out_path, mode="w" if header else "a", header=header, index=False)
+        header = False
+        n_written += len(kept)
+    return n_written
+
+
+def deduplicate_csv(csv_path, out_path=None, report_path=None, key_column="install_id",
+                    n_partitions=DEFAULT_PARTITIONS, chunksize=1_000_000, max_workers=None, work_dir=None):
+    """
+    Deduplicates a CSV file on a key column, keeping the first row of every key, and reports the duplicates.
+
+    Equivalent to ``drop_duplicates(subset=key_column, keep='first')`` on the whole file, but the file is only ever
+    read in chunks and the keys are deduplicated per hash partition, so it works on files whose keys do not fit in
+    memory. Rows without a key are all kept, whereas ``drop_duplicates`` would keep only the first of them.
+
+    Args:
+        csv_path (str): The path to the CSV file.
+        out_path (str, optional): The path of the deduplicated CSV file. Defaults to <name>_deduplicated.csv.
+        report_path (str, optional): The path of the duplicate report. Defaults to <name>_duplicates.csv.
+        key_column (str): The column to deduplicate on.
+        n_partitions (int): The number of hash partitions.
+        chunksize (int): The number of rows read at a time.
+        max_workers (int, optional): The number of worker processes.
+        work_dir (str, optional): The directory for the temporary partition files.
+
+    Returns:
+        dict: A dictionary containing the following keys:
+            - rows (int): The number of rows in the file.
+            - deduplicated_rows (int): The number of rows written to out_path.
+            - duplicated_keys (int): The number of keys occurring more than once.
+            - report (pd.DataFrame): The duplicate report; see ``find_duplicates``.
+            - out_path (str) and report_path (str): The paths of the written files.
+    """
+    name = os.path.splitext(csv_path)[0]
+    out_path = out_path or f"{name}_deduplicated.csv"
+    report_path = report_path or f"{name}_duplicates.csv"
+
+    report, drop_rows, n_rows = find_duplicates(csv_path, key_column, n_partitions, chunksize, max_workers, work_dir)
+    report.to_csv(report_path, index=False)
+    n_written = write_deduplicated(csv_path, out_path, drop_rows, chunksize)
+    return {"rows": n_rows, "deduplicated_rows": n_written, "duplicated_keys": len(report), "report": report,
+            "out_path": out_path, "report_path": report_path}
+
+
+if __name__ == "__main__":
+    for path in ["data/installs.csv", "data/revenue_converted.csv"]:
+        result = deduplicate_csv(path)
+        print(f"{path}: {result['rows']} rows, {result['duplicated_keys']} duplicated install_ids, "
+              f"{result['deduplicated_rows']} rows written to {result['out_path']}")
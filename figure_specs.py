@@ -0,0 +1,202 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+# The PNG text chunk holding the hash of the data a figure was rendered from
+HASH_KEY = "DataHash"
+
+# How the render workers are started; "forkserver" is only available on POSIX
+POOL_START_METHOD = "forkserver" if os.name == "posix" else "spawn"
+
+# Backends that cannot open a window; show_figures does nothing with them
+NON_INTERACTIVE_BACKENDS = {"agg", "cairo", "pdf", "pgf", "ps", "svg", "template"}
+
+
+@dataclass
+class FigureSpec:
+    """
+    A figure declared as data, so that it can be rendered later, in another process, or not at all if the PNG is
+    already up to date.
+
+    ``draw`` is a module-level function called as ``draw(fig, data, **options)`` that draws on an empty
+    ``matplotlib.figure.Figure``; it must not save or show the figure.
+    """
+    filename: str
+    draw: Callable
+    data: Any
+    options: Dict[str, Any] = field(default_factory=dict)
+    figsize: Tuple[float, float] = (12, 6)
+    dpi: int = 300
+
+
+def _update_hash(digest, value):
+    # Feed a value to the digest by content, recursing into containers
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        digest.update(repr(value.columns if isinstance(value, pd.DataFrame) else value.name).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=not isinstance(value, pd.Index)).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=repr):
+            digest.update(repr(key).encode())
+            _update_hash(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update_hash(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+
+def _update_code_hash(digest, code):
+    # Feed a function's bytecode, constants and referenced names, recursing into nested functions and lambdas, so
+    # editing the drawing function changes the hash
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for constant in code.co_consts:
+        if hasattr(constant, "co_code"):
+            _update_code_hash(digest, constant)
+        else:
+            digest.update(repr(constant).encode())
+
+
+def spec_hash(spec):
+    """
+    Hashes everything that determines how a figure looks: the drawing function and its code, its data and options,
+    size and dpi.
+
+    Only the code of ``draw`` itself is hashed, not that of helpers it calls; ``force=True`` in ``render_figures``
+    re-renders after such changes.
+
+    Args:
+        spec (FigureSpec): The figure.
+
+    Returns:
+        str: A hexadecimal SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{spec.draw.__module__}.{spec.draw.__qualname__}".encode())
+    if hasattr(spec.draw, "__code__"):
+        _update_code_hash(digest, spec.draw.__code__)
+    _update_hash(digest, [spec.data, spec.options, spec.figsize, spec.dpi])
+    return digest.hexdigest()
+
+
+def stored_hash(filename):
+    """
+    Reads the data hash saved in a PNG rendered by ``render_figure``.
+
+    Args:
+        filename (str): The path of the PNG file.
+
+    Returns:
+        str: The hash, or None if the file does not exist or has no hash.
+    """
+    if not os.path.exists(filename):
+        return None
+    try:
+        with Image.open(filename) as image:
+            return getattr(image, "text", {}).get(HASH_KEY)
+    except OSError:
+        return None
+
+
+def build_figure(spec):
+    """
+    Draws a figure on a new Agg figure without saving it.
+
+    The figure is created without pyplot, so drawing works in worker processes and never opens a window. The
+    ``*_main`` functions return their FigureSpecs rather than figures, so a figure is only drawn when it is rendered
+    or when a caller asks for it here.
+
+    Args:
+        spec (FigureSpec): The figure.
+
+    Returns:
+        matplotlib.figure.Figure: The drawn figure.
+    """
+    fig = Figure(figsize=spec.figsize)
+    FigureCanvasAgg(fig)
+    spec.draw(fig, spec.data, **spec.options)
+    return fig
+
+
+def show_figures(specs):
+    """
+    Draws figures on pyplot figures and shows them, when pyplot has an interactive backend.
+
+    Args:
+        specs (iterable of FigureSpec): The figures.
+    """
+    # pyplot is only needed to open windows, so the render stage and its workers never import it
+    import matplotlib.pyplot as plt
+
+    if plt.get_backend().lower() in NON_INTERACTIVE_BACKENDS:
+        return
+    for spec in specs:
+        spec.draw(plt.figure(figsize=spec.figsize), spec.data, **spec.options)
+    plt.show()
+
+
+def render_figure(spec, data_hash=None):
+    """
+    Draws a figure with the Agg renderer and saves it, with the hash of its data in the PNG metadata.
+
+    Args:
+        spec (FigureSpec): The figure.
+        data_hash (str, optional): The precomputed ``spec_hash(spec)``.
+
+    Returns:
+        str: The filename.
+    """
+    fig = build_figure(spec)
+    metadata = {HASH_KEY: data_hash or spec_hash(spec)} if spec.filename.lower().endswith(".png") else None
+    fig.savefig(spec.filename, dpi=spec.dpi, bbox_inches="tight", metadata=metadata)
+    return spec.filename
+
+
+def render_figures(specs, max_workers=None, force=False):
+    """
+    Renders the figures whose data changed since their PNG was last rendered, in parallel.
+
+    A figure is skipped when its file exists and holds the hash of the same data, drawing function, options, size and
+    dpi. The other figures are rendered in a process pool (or in this process when there is only one).
+
+    Args:
+        specs (iterable of FigureSpec): The figures.
+        max_workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+        force (bool): Render every figure, even if it is up to date.
+
+    Returns:
+        dict: The status of each filename, "rendered" or "cached".
+    """
+    status = {}
+    stale = []
+    for spec in specs:
+        data_hash = spec_hash(spec)
+        if not force and stored_hash(spec.filename) == data_hash:
+            status[spec.filename] = "cached"
+        else:
+            stale.append((spec, data_hash))
+            status[spec.filename] = "rendered"
+
+    if len(stale) == 1 or max_workers == 1:
+        for spec, data_hash in stale:
+            render_figure(spec, data_hash)
+    elif stale:
+        # Workers are started from a clean server process rather than forked, since forking a process whose numba or
+        # BLAS thread pools are running can leave it deadlocked at exit
+        context = multiprocessing.get_context(POOL_START_METHOD)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            list(executor.map(render_figure, *zip(*stale)))
+    return status
@@ -1,10 +1,93 @@
+import os
+import tempfile
+
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
 
+from chunked_backend import ChunkedCSV
+from column_store import load_columns
+from dedup import partition_keys
+from figure_specs import FigureSpec, render_figures, show_figures
+from hyperloglog import approx_nunique
+from install_sketches import approx_unique_installs, load_sketches
+from kpi_bootstrap import bootstrap_holistic_kpis
+from money import total_usd
+from reporting import print_holistic_report
+from rollups import build_daily_aggregates, load_rollups, monthly_rollup, percentage_change
+from results import HolisticResult
+
+
+def _install_partitions(installs_csv, values_csv, values_columns, chunksize):
+    # Hash-partition both files on install_id to disk, so every install and all its value rows land in the same
+    # partition; yields the installs and value rows (None if there are none) of each partition in turn, which bounds
+    # memory by the largest partition instead of the number of distinct install_ids
+    with tempfile.TemporaryDirectory() as work_dir:
+        installs_dir, values_dir = os.path.join(work_dir, 'installs'), os.path.join(work_dir, 'values')
+        os.makedirs(installs_dir)
+        os.makedirs(values_dir)
+        install_paths, _ = partition_keys(installs_csv, installs_dir, chunksize=chunksize)
+        partition_keys(values_csv, values_dir, chunksize=chunksize, columns=values_columns)
+        for install_path in install_paths:
+            values_path = os.path.join(values_dir, os.path.basename(install_path))
+            values = pd.read_csv(values_path, dtype={'install_id': str}) if os.path.exists(values_path) else None
+            yield pd.read_csv(install_path, dtype={'install_id': str}), values
+
+
+def _chunked_average_value_per_user(installs_csv, values_csv, chunksize):
+    # Streaming equivalent of merging installs with a value table on install_id: every value row counts once per
+    # matching install row, and users are the install_ids present in both files. Partitions hold disjoint
+    # install_ids, so their totals and user counts add up
+    total_value = 0.0
+    users = 0
+    for installs, values in _install_partitions(installs_csv, values_csv, ['value_usd'], chunksize):
+        if values is None:
+            continue
+        multiplicity = values['install_id'].map(installs['install_id'].value_counts())
+        matched = multiplicity.notna()
+        total_value += (values.loc[matched, 'value_usd'] * multiplicity[matched]).sum()
+        users += values.loc[matched, 'install_id'].nunique()
+    return total_value / users
+
+
+def _chunked_conversion_rate(installs_csv, revenue_csv, chunksize):
+    # Streaming equivalent of deduplicating both files on install_id (keeping the first row) and counting installs
+    # whose first revenue row is positive; partitions keep the rows in file order, so the first row of an install in
+    # its partition is its first row in the file
+    total_installs = 0
+    conversions = 0
+    for installs, revenue in _install_partitions(installs_csv, revenue_csv, ['value_usd'], chunksize):
+        install_ids = installs['install_id'].unique()
+        total_installs += len(install_ids)
+        if revenue is None:
+            continue
+        first_rows = revenue.drop_duplicates(subset='install_id', keep='first')
+        converted = first_rows.loc[first_rows['value_usd'] > 0, 'install_id']
+        conversions += int(converted.isin(install_ids).sum())
+    return conversions / total_installs * 100
+
+
+def calculate_user_acquisition_cost(adspend_csv, installs_csv, chunksize=None, approximate=False,
+                                    install_sketches=None):
+    if install_sketches is not None:
+        # Stored per day/country/network sketches answer the install count without reading installs_csv
+        total_ad_spend = pd.read_csv(adspend_csv, usecols=['value_usd'])['value_usd'].sum()
+        return total_ad_spend / approx_unique_installs(install_sketches)
+
+    if approximate:
+        # Estimate the installs with a HyperLogLog sketch instead of an exact hash set of all install_ids
+        adspend = ChunkedCSV(adspend_csv, chunksize=chunksize) if chunksize is not None else pd.read_csv(adspend_csv)
+        installs = ChunkedCSV(installs_csv, chunksize=chunksize) if chunksize is not None else pd.read_csv(
+            installs_csv, usecols=['install_id'])
+        return adspend['value_usd'].sum() / approx_nunique(installs['install_id'])
+
+    if chunksize is not None:
+        # Stream both files instead of loading them
+        total_ad_spend = total_usd(ChunkedCSV(adspend_csv, chunksize=chunksize))
+        total_installs = ChunkedCSV(installs_csv, chunksize=chunksize)['install_id'].nunique()
+        return total_ad_spend / total_installs
 
-def calculate_user_acquisition_cost(adspend_csv, installs_csv):
     # Read the CSV files
     adspend_df = pd.read_csv(adspend_csv)
     installs_df = pd.read_csv(installs_csv)
@@ -21,7 +104,10 @@ def calculate_user_acquisition_cost(adspend_csv, installs_csv):
     return user_acquisition_cost
 
 
-def calculate_average_revenue_per_user(installs_csv, revenue_csv):
+def calculate_average_revenue_per_user(installs_csv, revenue_csv, chunksize=None):
+    if chunksize is not None:
+        return _chunked_average_value_per_user(installs_csv, revenue_csv, chunksize)
+
     # Read the CSV files into DataFrames
     installs_df = pd.read_csv(installs_csv)
     revenue_df = pd.read_csv(revenue_csv)
@@ -39,7 +125,10 @@ def calculate_average_revenue_per_user(installs_csv, revenue_csv):
     return average_revenue_per_user
 
 
-def calculate_average_payout_per_user(installs_csv, payouts_csv):
+def calculate_average_payout_per_user(installs_csv, payouts_csv, chunksize=None):
+    if chunksize is not None:
+        return _chunked_average_value_per_user(installs_csv, payouts_csv, chunksize)
+
     # Read the CSV files into DataFrames
     installs_df = pd.read_csv(installs_csv)
     payouts_df = pd.read_csv(payouts_csv)
@@ -81,17 +170,20 @@ def calculate_average_payout_per_user(installs_csv, payouts_csv):
 #     return marketing_roi
 
 
-def conversion_rate(installs_csv, revenue_csv):
+def conversion_rate(installs_csv, revenue_csv, chunksize=None):
     """
     Calculate the conversion rate based on installs and revenue, considering only installs with revenue greater than zero.
 
     Args:
     installs_csv (str): The path to the CSV file containing installs data.
     revenue_csv (str): The path to the CSV file containing revenue data.
+    chunksize (int, optional): Stream both files in chunks of this many rows instead of loading them.
 
     Returns:
     float: The conversion rate as a percentage.
     """
+    if chunksize is not None:
+        return _chunked_conversion_rate(installs_csv, revenue_csv, chunksize)
 
     installs = pd.read_csv(installs_csv).drop_duplicates(subset='install_id', keep='first')
     revenue = pd.read_csv(revenue_csv).drop_duplicates(subset='install_id', keep='first')
@@ -106,7 +198,22 @@ def conversion_rate(installs_csv, revenue_csv):
     return conversion_pct
 
 
-def calculate_gross_profit_margin(revenue_csv, adspend_csv, payouts_csv):
+def calculate_gross_profit_margin(revenue_csv, adspend_csv, payouts_csv, chunksize=None, use_column_store=False):
+    if use_column_store:
+        # Sum the memory-mapped value columns, exactly if stored as micro-dollars; the CSV files are converted on
+        # first use only
+        total_revenue = total_usd(load_columns(revenue_csv))
+        total_ad_spend = total_usd(load_columns(adspend_csv))
+        total_payout = total_usd(load_columns(payouts_csv))
+        return (total_revenue - total_ad_spend - total_payout) / total_revenue
+
+    if chunksize is not None:
+        # Only the value column of each file is needed, summed chunk by chunk
+        total_revenue = total_usd(ChunkedCSV(revenue_csv, chunksize=chunksize))
+        total_ad_spend = total_usd(ChunkedCSV(adspend_csv, chunksize=chunksize))
+        total_payout = total_usd(ChunkedCSV(payouts_csv, chunksize=chunksize))
+        return (total_revenue - total_ad_spend - total_payout) / total_revenue
+
     # Read the CSV files into DataFrames
     revenue_df = pd.read_csv(revenue_csv)
     adspend_df = pd.read_csv(adspend_csv)
@@ -127,60 +234,65 @@ def calculate_gross_profit_margin(revenue_csv, adspend_csv, payouts_csv):
     return profit_margin
 
 
-def plot_time_series(installs_path, revenue_path, adspend_path, payouts_path):
-    # Read CSV files
-    installs_df = pd.read_csv(installs_path, parse_dates=['event_date'])
-    revenue_df = pd.read_csv(revenue_path, parse_dates=['event_date'])
-    adspend_df = pd.read_csv(adspend_path, parse_dates=['event_date'])
-    payouts_df = pd.read_csv(payouts_path, parse_dates=['event_date'])
-
-    # Calculate total value per month
-    # For installs, create a 'month' column, group by month, and count the number of installs per month
-    installs_df['month'] = installs_df['event_date'].dt.to_period('M')
-    installs_monthly = installs_df.groupby('month').size()
-
-    # For revenue, create a 'month' column, group by month, and sum the value_usd per month
-    revenue_df['month'] = revenue_df['event_date'].dt.to_period('M')
-    revenue_monthly = revenue_df.groupby('month')['value_usd'].sum()
+def monthly_percentage_change(installs_path, revenue_path, adspend_path, payouts_path, rollup_path=None):
+    """
+    Calculates the month-over-month percentage change of installs, revenue, ad spend and payouts.
 
-    # For adspend, create a 'month' column, group by month, and sum the value_usd per month
-    adspend_df['month'] = adspend_df['event_date'].dt.to_period('M')
-    adspend_monthly = adspend_df.groupby('month')['value_usd'].sum()
+    The changes are computed from monthly rollups of daily totals (see ``rollups.py``) rather than from the raw rows.
 
-    # For payouts, create a 'month' column, group by month, and sum the value_usd per month
-    payouts_df['month'] = payouts_df['event_date'].dt.to_period('M')
-    payouts_monthly = payouts_df.groupby('month')['value_usd'].sum()
+    Args:
+        rollup_path (str, optional): A .npz file written by ``rollups.save_rollups``; the data files are not read
+            when it is given.
 
-    # Calculate percentage change
-    installs_pct = installs_monthly.pct_change()
-    revenue_pct = revenue_monthly.pct_change()
-    adspend_pct = adspend_monthly.pct_change()
-    payouts_pct = payouts_monthly.pct_change()
+    Returns:
+        pd.DataFrame: One column per series, indexed by the first day of each month.
+    """
+    if rollup_path is not None:
+        _, monthly = load_rollups(rollup_path)
+    else:
+        monthly = monthly_rollup(build_daily_aggregates(installs_path, revenue_path, adspend_path, payouts_path))
+    return percentage_change(monthly)
 
-    # Convert Period objects to Timestamp objects
-    installs_pct.index = installs_pct.index.to_timestamp()
-    revenue_pct.index = revenue_pct.index.to_timestamp()
-    adspend_pct.index = adspend_pct.index.to_timestamp()
-    payouts_pct.index = payouts_pct.index.to_timestamp()
 
+def draw_time_series(fig, pct_change):
     # Plot time series
-    sns.set_style("whitegrid")
-    plt.figure(figsize=(12, 6))
-    plt.plot(installs_pct, label="Installs", marker='o', linestyle='--')
-    plt.plot(revenue_pct, label="Revenue", marker='o', color='green')
-    plt.plot(adspend_pct, label="Adspend", marker='o', color='red')
-    plt.plot(payouts_pct, label="Payouts", marker='o', linestyle='dotted')
-    plt.xlabel("")
-    plt.ylabel("Percentage Change")
-    plt.title("Holistic Time Series Analysis")
+    with sns.axes_style("whitegrid"):
+        ax = fig.add_subplot()
+    ax.plot(pct_change["Installs"].dropna(), label="Installs", marker='o', linestyle='--')
+    ax.plot(pct_change["Revenue"].dropna(), label="Revenue", marker='o', color='green')
+    ax.plot(pct_change["Adspend"].dropna(), label="Adspend", marker='o', color='red')
+    ax.plot(pct_change["Payouts"].dropna(), label="Payouts", marker='o', linestyle='dotted')
+    ax.set_xlabel("")
+    ax.set_ylabel("Percentage Change")
+    ax.set_title("Holistic Time Series Analysis")
 
     # Change x-axis labels to show month name and year in text
-    plt.xticks(revenue_pct.index, revenue_pct.index.strftime('%b %Y'), rotation=45, ha='right')
+    months = pct_change["Revenue"].dropna().index
+    ax.set_xticks(months)
+    ax.set_xticklabels(months.strftime('%b %Y'), rotation=45, ha='right')
 
-    plt.legend()
-    plt.tight_layout()
+    ax.legend()
+    fig.tight_layout()
+
+
+def time_series_figure_spec(installs_path, revenue_path, adspend_path, payouts_path, rollup_path=None):
+    """
+    Declares the holistic time series chart for ``figure_specs.render_figures``.
+
+    Returns:
+        FigureSpec: The chart of ``monthly_percentage_change``, saved as 'Holistic Time Series.png'.
+    """
+    pct_change = monthly_percentage_change(installs_path, revenue_path, adspend_path, payouts_path, rollup_path)
+    return FigureSpec('Holistic Time Series.png', draw_time_series, pct_change, figsize=(12, 6), dpi=600)
+
+
+def plot_time_series(installs_path, revenue_path, adspend_path, payouts_path, rollup_path=None):
+    fig = plt.figure(figsize=(12, 6))
+    draw_time_series(fig, monthly_percentage_change(installs_path, revenue_path, adspend_path, payouts_path,
+                                                    rollup_path))
     plt.savefig('Holistic Time Series.png', dpi=600, bbox_inches='tight')
     plt.show()
+    return fig
 
 
 def calculate_risk_to_reward(user_acquisition_cost, average_revenue_per_user, average_payout_per_user):
@@ -193,42 +305,52 @@ def calculate_risk_to_reward(user_acquisition_cost, average_revenue_per_user, av
     return risk_to_reward
 
 
-def holistic_main():
-    # Set the paths to the CSV files
-    installs_path = "data/installs.csv"
-    revenue_path = "data/revenue_converted.csv"
-    adspend_path = "data/adspend_converted.csv"
-    payouts_path = "data/payouts_converted.csv"
-
+def holistic_main(chunksize=None, make_plots=True, installs_path="data/installs.csv",
+                  revenue_path="data/revenue_converted.csv", adspend_path="data/adspend_converted.csv",
+                  payouts_path="data/payouts_converted.csv", use_column_store=False, n_bootstrap=None, seed=None,
+                  approximate=False, rollup_path=None, sketch_path=None):
     # Calculate the ARPU
-    average_revenue_per_user = calculate_average_revenue_per_user(installs_path, revenue_path)
-    print('Average Revenue per User (ARPU): $', round(average_revenue_per_user, 2))
+    average_revenue_per_user = calculate_average_revenue_per_user(installs_path, revenue_path, chunksize)
 
-    # Calculate the UAC
-    user_acquisition_cost = calculate_user_acquisition_cost(adspend_path, installs_path)
-    print('User Acquisition Cost (UAC/CPL): $', round(user_acquisition_cost, 2))
+    # Calculate the UAC, from saved per-day install sketches (see install_sketches.py) if there are any
+    install_sketches = load_sketches(sketch_path) if sketch_path is not None else None
+    user_acquisition_cost = calculate_user_acquisition_cost(adspend_path, installs_path, chunksize, approximate,
+                                                            install_sketches)
 
     # Calculate the APPU
-    average_payout_per_user = calculate_average_payout_per_user(installs_path, payouts_path)
-    print('Average Payout per User (APPU): $', round(average_payout_per_user, 2))
+    average_payout_per_user = calculate_average_payout_per_user(installs_path, payouts_path, chunksize)
 
-    conversion_rate_pct = conversion_rate(installs_path, revenue_path)
-    print(f"Conversion Rate: {round(conversion_rate_pct, 2)}%")
+    conversion_rate_pct = conversion_rate(installs_path, revenue_path, chunksize)
 
     # # Call the function calculate_marketing_roi
     # roi = calculate_marketing_roi(adspend_path, installs_path, revenue_path, conversion_rate_pct)
-    # print(f"Marketing ROI: {roi:.2f}%")
 
     # Calculate the profit margin
-    profit_margin = calculate_gross_profit_margin(revenue_path, adspend_path, payouts_path)
-    print('Gross Profit Margin:', round(profit_margin, 2) * 100, "%")
+    profit_margin = calculate_gross_profit_margin(revenue_path, adspend_path, payouts_path, chunksize,
+                                                  use_column_store)
 
-    # Plot plot_time_series
-    plot_time_series(installs_path, revenue_path, adspend_path, payouts_path)
+    # Render the time series chart unless the saved PNG was rendered from the same data; the result holds its spec
+    figures = []
+    if make_plots:
+        figures.append(time_series_figure_spec(installs_path, revenue_path, adspend_path, payouts_path, rollup_path))
+        render_figures(figures)
 
     risk_to_reward = calculate_risk_to_reward(user_acquisition_cost, average_revenue_per_user, average_payout_per_user)
-    print(f"Risk-to-Reward ratio: {risk_to_reward:.2f}:1")
+
+    # Bootstrap confidence intervals for every KPI
+    confidence_intervals = None
+    if n_bootstrap:
+        confidence_intervals = bootstrap_holistic_kpis(installs_path, revenue_path, adspend_path, payouts_path,
+                                                       n_bootstrap=n_bootstrap, seed=seed)
+
+    return HolisticResult(average_revenue_per_user=average_revenue_per_user,
+                          user_acquisition_cost=user_acquisition_cost,
+                          average_payout_per_user=average_payout_per_user, conversion_rate_pct=conversion_rate_pct,
+                          profit_margin=profit_margin, risk_to_reward=risk_to_reward, figures=figures,
+                          confidence_intervals=confidence_intervals)
 
 
 if __name__ == '__main__':
-    holistic_main()
+    result = holistic_main()
+    print_holistic_report(result)
+    show_figures(result.figures)
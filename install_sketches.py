@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+
+from date_dimension import day_numbers
+from hyperloglog import estimate_count, hash_values, register_updates
+
+SKETCH_DIMENSIONS = ("country_id", "network_id")
+
+# A relative standard error of about 1.6%, and 4 KiB for each cell that holds many install_ids
+DEFAULT_SKETCH_PRECISION = 12
+
+# A cell keeps sparse (register, rank) pairs, 9 bytes each, until it has more than 2 ** precision / SPARSE_FRACTION
+# of them, and only then gets a dense row of registers; most (day, country, network) cells hold few install_ids
+SPARSE_FRACTION = 16
+
+
+def _max_per_key(keys, ranks):
+    # Keep the highest rank of each register key, sorted by key
+    order = np.lexsort((ranks, keys))
+    keys, ranks = keys[order], ranks[order]
+    last = np.ones(len(keys), dtype=bool)
+    last[:-1] = keys[1:] != keys[:-1]
+    return keys[last], ranks[last]
+
+
+def _grow_rows(registers, n_rows):
+    # Make room for n_rows dense rows, doubling the capacity so that appending rows costs amortized linear time
+    if n_rows <= len(registers):
+        return registers
+    grown = np.zeros((max(n_rows, 2 * len(registers)), registers.shape[1]), dtype=np.uint8)
+    grown[:len(registers)] = registers
+    return grown
+
+
+def build_sketches(csv_path, dimensions=SKETCH_DIMENSIONS, id_column="install_id",
+                   precision=DEFAULT_SKETCH_PRECISION, chunksize=5_000_000):
+    """
+    Builds one HyperLogLog sketch of install_ids per (day, *dimensions) cell in a single pass over a CSV file.
+
+    Sketches are mergeable, so the number of distinct install_ids of any date range and slice is the count of the
+    element-wise maximum of the selected cells' registers, without rescanning the raw data.
+
+    As in HyperLogLog++, a cell is stored sparsely, as the (register, rank) pairs it has set, until it has set more
+    than ``2 ** precision / SPARSE_FRACTION`` registers; only then does it get a dense row of registers. The merged
+    registers, and so the estimates, are the same as with dense rows for every cell.
+
+    Args:
+        csv_path (str): The path to the CSV file, e.g. the installs data.
+        dimensions (iterable of str): The columns that split cells besides the day.
+        id_column (str): The column whose distinct values are counted.
+        precision (int): The sketch precision; a dense cell has 2 ** precision one-byte registers.
+        chunksize (int): The number of rows read at a time.
+
+    Returns:
+        dict: A dictionary containing the following keys:
+            - keys (pd.DataFrame): The day (days since 1970-01-01) and dimensions of each cell.
+            - dense_row (numpy.ndarray): The row of each cell in ``registers``, or -1 for a sparse cell.
+            - registers (numpy.ndarray): The uint8 registers of the dense cells, one row per cell.
+            - sparse_keys (numpy.ndarray): The cell * 2 ** precision + register index of each sparse pair.
+            - sparse_ranks (numpy.ndarray): The uint8 rank of each sparse pair.
+            - precision (int): The sketch precision.
+    """
+    key_columns = ["day", *dimensions]
+    n_registers = 1 << precision
+    sparse_limit = n_registers // SPARSE_FRACTION
+    cells = pd.MultiIndex.from_arrays([[] for _ in key_columns], names=key_columns)
+    dense_row = np.zeros(0, dtype=np.int64)
+    registers = np.zeros((0, n_registers), dtype=np.uint8)
+    n_dense = 0
+    sparse_keys = np.zeros(0, dtype=np.int64)
+    sparse_ranks = np.zeros(0, dtype=np.uint8)
+
+    for chunk in pd.read_csv(csv_path, usecols=["event_date", id_column, *dimensions], chunksize=chunksize):
+        chunk = chunk[chunk[id_column].notna()]
+        chunk.insert(0, "day", day_numbers(chunk.pop("event_date")))
+        keys = pd.MultiIndex.from_frame(chunk[key_columns])
+
+        # Cells seen for the first time start sparse
+        new_cells = keys.unique().difference(cells)
+        if len(new_cells):
+            cells = cells.append(new_cells)
+            dense_row = np.concatenate([dense_row, np.full(len(new_cells), -1, dtype=np.int64)])
+
+        cell = cells.get_indexer(keys)
+        index, rank = register_updates(hash_values(chunk[id_column]), precision)
+
+        # Updates of dense cells go straight to their registers, the others are merged into the sparse pairs
+        row = dense_row[cell]
+        dense = row >= 0
+        np.maximum.at(registers.reshape(-1), row[dense] * n_registers + index[dense], rank[dense])
+        sparse_keys, sparse_ranks = _max_per_key(
+            np.concatenate([sparse_keys, cell[~dense].astype(np.int64) * n_registers + index[~dense]]),
+            np.concatenate([sparse_ranks, rank[~dense]]))
+
+        # Cells with too many pairs move to dense rows
+        sparse_cell = sparse_keys // n_registers
+        promoted = np.flatnonzero(np.bincount(sparse_cell, minlength=len(cells)) > sparse_limit)
+        if len(promoted):
+            registers = _grow_rows(registers, n_dense + len(promoted))
+            dense_row[promoted] = np.arange(n_dense, n_dense + len(promoted))
+            n_dense += len(promoted)
+            moved = dense_row[sparse_cell] >= 0
+            registers.reshape(-1)[dense_row[sparse_cell[moved]] * n_registers + sparse_keys[moved] % n_registers] \
+                = sparse_ranks[moved]
+            sparse_keys, sparse_ranks = sparse_keys[~moved], sparse_ranks[~moved]
+
+    keys = cells.to_frame(index=False)
+    keys["day"] = keys["day"].astype(np.int32)
+    return {"keys": keys, "dense_row": dense_row, "registers": registers[:n_dense], "sparse_keys": sparse_keys,
+            "sparse_ranks": sparse_ranks, "precision": precision}
+
+
+def merged_registers(sketches, mask):
+    """
+    Merges the registers of the selected cells, dense and sparse, into one dense sketch.
+
+    Args:
+        sketches (dict): The output of ``build_sketches`` or ``load_sketches``.
+        mask (numpy.ndarray): A boolean per cell.
+
+    Returns:
+        numpy.ndarray: The 2 ** precision uint8 registers.
+    """
+    n_registers = 1 << sketches["precision"]
+    merged = np.zeros(n_registers, dtype=np.uint8)
+    rows = sketches["dense_row"][mask]
+    rows = rows[rows >= 0]
+    if len(rows):
+        merged = sketches["registers"][rows].max(axis=0)
+    sparse_keys = sketches["sparse_keys"]
+    selected = mask[sparse_keys // n_registers]
+    np.maximum.at(merged, sparse_keys[selected] % n_registers, sketches["sparse_ranks"][selected])
+    return merged
+
+
+def save_sketches(sketches, path):
+    """
+    Saves sketches as a compressed NumPy archive.
+
+    Args:
+        sketches (dict): The output of ``build_sketches``.
+        path (str): The path of the .npz file to write.
+    """
+    keys = sketches["keys"]
+    np.savez_compressed(path, registers=sketches["registers"], dense_row=sketches["dense_row"],
+                        sparse_keys=sketches["sparse_keys"], sparse_ranks=sketches["sparse_ranks"],
+                        precision=sketches["precision"], key_columns=np.array(keys.columns, dtype=str),
+                        **{f"key_{column}": keys[column].to_numpy() for column in keys.columns})
+
+
+def load_sketches(path):
+    """
+    Loads sketches saved with ``save_sketches``.
+
+    Args:
+        path (str): The path of the .npz file.
+
+    Returns:
+        dict: The sketches.
+    """
+    with np.load(path) as archive:
+        keys = pd.DataFrame({column: archive[f"key_{column}"] for column in archive["key_columns"]})
+        if "dense_row" not in archive:
+            # Sketches saved before the sparse cells have a dense row for every cell
+            return {"keys": keys, "dense_row": np.arange(len(keys)), "registers": archive["registers"],
+                    "sparse_keys": np.zeros(0, dtype=np.int64), "sparse_ranks": np.zeros(0, dtype=np.uint8),
+                    "precision": int(archive["precision"])}
+        return {"keys": keys, "dense_row": archive["dense_row"], "registers": archive["registers"],
+                "sparse_keys": archive["sparse_keys"], "sparse_ranks": archive["sparse_ranks"],
+                "precision": int(archive["precision"])}
+
+
+def approx_unique_installs(sketches, start_date=None, end_date=None, **filters):
+    """
+    Estimates the number of distinct install_ids in a date range and slice by merging the matching cells.
+
+    Args:
+        sketches (dict): The output of ``build_sketches`` or ``load_sketches``.
+        start_date (str, optional): The first date, inclusive.
+        end_date (str, optional): The last date, inclusive.
+        **filters: Accepted values per dimension, e.g. ``country_id=[1, 2]``.
+
+    Returns:
+        int: The estimated number of distinct install_ids.
+    """
+    keys = sketches["keys"]
+    mask = np.ones(len(keys), dtype=bool)
+    if start_date is not None:
+        mask &= keys["day"].to_numpy() >= day_numbers([start_date])[0]
+    if end_date is not None:
+        mask &= keys["day"].to_numpy() <= day_numbers([end_date])[0]
+    for column, values in filters.items():
+        mask &= keys[column].isin(values).to_numpy()
+    if not mask.any():
+        return 0
+    return estimate_count(merged_registers(sketches, mask))
+
+
+def approx_unique_installs_by(sketches, by, start_date=None, end_date=None, **filters):
+    """
+    Estimates the number of distinct install_ids per value of a dimension, e.g. per network.
+
+    Args:
+        sketches (dict): The output of ``build_sketches`` or ``load_sketches``.
+        by (str): The dimension to break the count down by ("day" or one of the sketch dimensions).
+        start_date (str, optional): The first date, inclusive.
+        end_date (str, optional): The last date, inclusive.
+        **filters: Accepted values per dimension.
+
+    Returns:
+        pd.Series: The estimated count per value of ``by``.
+    """
+    values = np.sort(sketches["keys"][by].unique())
+    counts = [approx_unique_installs(sketches, start_date, end_date, **{**filters, by: [value]}) for value in values]
+    return pd.Series(counts, index=pd.Index(values, name=by), name="approx_unique_installs")
+
+
+if __name__ == "__main__":
+    install_sketches = build_sketches("data/installs.csv")
+    save_sketches(install_sketches, "data/install_sketches.npz")
+    print("Approximate unique installs:", approx_unique_installs(install_sketches))
+    print(approx_unique_installs_by(install_sketches, "network_id"))
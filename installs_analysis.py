@@ -1,60 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
+from date_dimension import parse_event_dates
+from figure_specs import FigureSpec, render_figures, show_figures
+from hyperloglog import approx_nunique
+from plot_utils import LABEL_BOX, draw_pareto, label_bars, pareto_points, share_labels, top_n_with_other
+from reporting import print_installs_report
+from results import InstallsResult
+from time_series import build_daily_calendar, rolling_stats
+
+INSTALL_DIMENSIONS = ["country_id", "network_id", "app_id", "device_os_version"]
+
 
 def load_data(file_path):
-    return pd.read_csv(file_path, parse_dates=["event_date"])
+    installs = pd.read_csv(file_path)
+    installs["event_date"] = parse_event_dates(installs["event_date"])
+    return installs
 
 
 def get_temporal_scope(dataframe, date_column):
     min_date = dataframe[date_column].min()
     max_date = dataframe[date_column].max()
-    print(f"\nTemporal scope of installs.csv: {min_date} - {max_date}")
     return min_date, max_date
 
 
-def count_install_ids(dataframe, column):
-    unique_install_ids = dataframe[column].nunique()
+def count_install_ids(dataframe, column, approximate=False):
+    # With approximate=True the unique count is a HyperLogLog estimate instead of an exact hash set of all ids
+    if approximate:
+        unique_install_ids = approx_nunique(dataframe[column])
+    else:
+        unique_install_ids = dataframe[column].nunique()
     total_install_ids = dataframe[column].count()
-    print(f"\nUnique Install IDs: {unique_install_ids}\nTotal Install IDs: {total_install_ids}\n")
     return unique_install_ids, total_install_ids
 
 
 def find_duplicate_install_ids(dataframe, column):
     duplicate_install_ids = dataframe[dataframe.duplicated(subset=column, keep=False)].sort_values(by=column)
-    print("Duplicate Install IDs:\n", duplicate_install_ids[column].values)
     return duplicate_install_ids
 
 
 def read_and_explore(dataframe):
     installs_explore = dataframe
-    print("\nExplore installs DF:", installs_explore, "\n")
     return installs_explore
 
 
 def count_unique_values(dataframe):
     columns = ["country_id", "network_id", "app_id", "device_os_version"]
-    unique_counts = {}
+    unique_values = {}
     for column in columns:
-        unique_values = dataframe[column].unique()
-        print(f"Number of unique {column}s:", len(unique_values))
-        print(f"List of unique {column}s:", unique_values)
-        print()
-
-
-def plot_installs_over_time_and_moving_average(dataframe, date_column, window=30, figsize=(10, 6)):
-    # Aggregate installs by date
-    installs_by_date = dataframe.groupby(date_column).size()
-
-    # Calculate the 30-day moving average
-    moving_average = installs_by_date.rolling(window=window).mean()
-
-    # Create a time series plot with installs and moving average
-    fig, ax = plt.subplots(figsize=figsize)
-    ax.plot(installs_by_date.index, installs_by_date, label='Installs')
-    ax.plot(moving_average.index, moving_average, label=f'{window}-Day Moving Average', linestyle='--')
+        unique_values[column] = dataframe[column].unique()
+    return unique_values
+
+
+def aggregate_installs_by_dimensions(dataframe, dimensions=INSTALL_DIMENSIONS, max_workers=None):
+    # Count install IDs per combination of all dimensions in one scan; NaN keys are kept here so that each
+    # dimension's marginal below matches a plain groupby on that dimension alone
+    if max_workers and max_workers > 1:
+        # Split the rows between threads and add up their partial counts
+        bounds = np.linspace(0, len(dataframe), max_workers + 1).astype(int)
+        slices = [dataframe.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            partials = list(executor.map(
+                lambda part: part.groupby(dimensions, dropna=False)["install_id"].count(), slices))
+        combined = pd.concat(partials).groupby(level=list(range(len(dimensions))), dropna=False).sum()
+    else:
+        combined = dataframe.groupby(dimensions, dropna=False)["install_id"].count()
+
+    # The combinations table is much smaller than the raw rows, so the per-dimension totals are cheap
+    return {dimension: combined.groupby(level=dimension).sum() for dimension in dimensions}
+
+
+def draw_installs_over_time(fig, installs_over_time, window=30):
+    # installs_over_time holds the daily installs and their moving average, one column each
+    ax = fig.subplots()
+    ax.plot(installs_over_time.index, installs_over_time["installs"], label='Installs')
+    ax.plot(installs_over_time.index, installs_over_time[f"mean_{window}"], label=f'{window}-Day Moving Average',
+            linestyle='--')
 
     # Customize the plot appearance
     ax.set_title('Installs Over Time and Moving Average')
@@ -68,266 +92,106 @@ def plot_installs_over_time_and_moving_average(dataframe, date_column, window=30
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %Y'))
 
     # Rotate x-axis labels for better readability
-    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-
-    # Show the plot
-    plt.tight_layout()
-    plt.savefig('installs plot_installs_over_time_and_moving_average.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def plot_installs_by_country_bar_graph(dataframe):
-    installs_by_country = dataframe.groupby("country_id")["install_id"].count().sort_values(ascending=False)
-    total_installs = installs_by_country.sum()
-
-    fig, ax = plt.subplots(figsize=(10, 6))
-    bars = installs_by_country.plot(kind="bar", ax=ax)
+    for label in ax.get_xticklabels():
+        label.set(rotation=45, ha='right')
 
-    ax.set_title("Distribution of Install IDs by Country")
-    ax.set_xlabel("Country ID")
-    ax.set_ylabel("Number of Install IDs")
+    fig.tight_layout()
 
-    for bar in bars.containers[0]:
-        x = bar.get_x() + bar.get_width() / 2
-        y = bar.get_height()
-        label = f"{y:.0f}, {y / total_installs * 100:.1f}%"
-        ax.text(x, y + 5, label, ha="center", va="bottom", fontsize=9, rotation=0,
-                bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.2'))
-
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig('installs plot_installs_by_country_bar_graph.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def pareto_distribution_install_id_by_country(dataframe):
-    # Calculate the number of installs for each country
-    installs_by_country = dataframe.groupby("country_id")["install_id"].count().reset_index()
-
-    # Calculate the cumulative percentage of total installs
-    installs_by_country = installs_by_country.sort_values("install_id", ascending=False).reset_index(drop=True)
-    installs_by_country["cumulative_percentage"] = installs_by_country["install_id"].cumsum() / installs_by_country[
-        "install_id"].sum() * 100
-
-    # Plot the Pareto distribution
-    percentiles = np.linspace(0, 100, len(installs_by_country) + 1)
-    selected_percentiles = np.arange(0, 101, 5)
-    selected_cumulative_percentage = np.interp(selected_percentiles, percentiles,
-                                               np.insert(installs_by_country["cumulative_percentage"].values, 0, 0))
-    fig, ax = plt.subplots(figsize=(12, 8))
-    ax.plot(selected_percentiles, selected_cumulative_percentage, marker='o')
-    ax.set_xlabel('Percentile of Country')
-    ax.set_ylabel('Cumulative Percentage of Total Installs')
-    ax.set_title('Pareto Distribution of Installs by Country')
-    ax.set_xticks(np.arange(0, 101, 10))
-    ax.set_yticks(np.arange(0, 101, 10))
-    plt.grid()
-    plt.tight_layout()
-    plt.savefig('installs pareto_distribution_install_id_by_country.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def plot_installs_by_network_bar_graph(dataframe):
-    installs_by_network = dataframe.groupby("network_id")["install_id"].count().sort_values(ascending=False)
-    total_installs = installs_by_network.sum()
-
-    fig, ax = plt.subplots(figsize=(10, 6))
-    bars = installs_by_network.plot(kind="bar", ax=ax)
-
-    ax.set_title("Distribution of Install IDs by Network")
-    ax.set_xlabel("Network ID")
-    ax.set_ylabel("Number of Install IDs")
 
-    for bar in bars.containers[0]:
-        x = bar.get_x() + bar.get_width() / 2
-        y = bar.get_height()
-        label = f"{y:.0f}, {y / total_installs * 100:.1f}%"
-        ax.text(x, y + 5, label, ha="center", va="bottom", fontsize=9, rotation=0,
-                bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.2'))
-
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig('installs plot_installs_by_network_bar_graph.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def pareto_distribution_install_id_by_network(dataframe):
-    # Calculate the number of installs for each network
-    installs_by_network = dataframe.groupby("network_id")["install_id"].count().reset_index()
-
-    # Calculate the cumulative percentage of total installs
-    installs_by_network = installs_by_network.sort_values("install_id", ascending=False).reset_index(drop=True)
-    installs_by_network["cumulative_percentage"] = installs_by_network["install_id"].cumsum() / installs_by_network[
-        "install_id"].sum() * 100
-
-    # Plot the Pareto distribution
-    percentiles = np.linspace(0, 100, len(installs_by_network) + 1)
-    selected_percentiles = np.arange(0, 101, 5)
-    selected_cumulative_percentage = np.interp(selected_percentiles, percentiles,
-                                               np.insert(installs_by_network["cumulative_percentage"].values, 0, 0))
-    fig, ax = plt.subplots(figsize=(12, 8))
-    ax.plot(selected_percentiles, selected_cumulative_percentage, marker='o')
-    ax.set_xlabel('Percentile of Network')
-    ax.set_ylabel('Cumulative Percentage of Total Installs')
-    ax.set_title('Pareto Distribution of Installs by Network')
-    ax.set_xticks(np.arange(0, 101, 10))
-    ax.set_yticks(np.arange(0, 101, 10))
-    plt.grid()
-    plt.tight_layout()
-    plt.savefig('installs pareto_distribution_install_id_by_network.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def plot_installs_by_app_bar_graph(dataframe):
-    installs_by_app = dataframe.groupby("app_id")["install_id"].count().sort_values(ascending=False)
-    total_installs = installs_by_app.sum()
-
-    fig, ax = plt.subplots(figsize=(10, 6))
-    bars = installs_by_app.plot(kind="bar", ax=ax)
-
-    ax.set_title("Distribution of Install IDs by App")
-    ax.set_xlabel("App ID")
-    ax.set_ylabel("Number of Install IDs")
+def draw_installs_bar_graph(fig, installs, total_installs, title, xlabel, min_percentage=None, label_last=False,
+                            rotation=45, tick_labelsize=None):
+    # installs is already cut to the top categories and "Other"; total_installs is the total before that
+    ax = fig.subplots()
+    bars = installs.plot(kind="bar", ax=ax)
 
-    min_bar_height = installs_by_app.min()  # Find the smallest bar
-    last_bar_index = len(bars.containers[0]) - 1
-
-    for index, bar in enumerate(bars.containers[0]):
-        x = bar.get_x() + bar.get_width() / 2
-        y = bar.get_height()
-        percentage = y / total_installs * 100
-
-        # Check if the percentage is above 4.5 or if it is the last bar
-        if percentage > 4.5 or index == last_bar_index:
-            label = f"{y:.0f}, {percentage:.1f}%"
-            ax.text(x, y + 5, label, ha="center", va="bottom", fontsize=9, rotation=0,
-                    bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.2'))
-
-    plt.xticks(rotation=45)
-    ax.tick_params(axis='x', labelsize=8)  # Set the font size to 8
-
-    plt.tight_layout()
-    plt.savefig('installs plot_installs_by_app_bar_graph.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def pareto_distribution_install_id_by_app(dataframe):
-    # Calculate the number of installs for each app
-    installs_by_app = dataframe.groupby("app_id")["install_id"].count().reset_index()
-
-    # Calculate the cumulative percentage of total installs
-    installs_by_app = installs_by_app.sort_values("install_id", ascending=False).reset_index(drop=True)
-    installs_by_app["cumulative_percentage"] = installs_by_app["install_id"].cumsum() / installs_by_app[
-        "install_id"].sum() * 100
-
-    # Plot the Pareto distribution
-    percentiles = np.linspace(0, 100, len(installs_by_app) + 1)
-    selected_percentiles = np.arange(0, 101, 5)
-    selected_cumulative_percentage = np.interp(selected_percentiles, percentiles,
-                                               np.insert(installs_by_app["cumulative_percentage"].values, 0, 0))
-    fig, ax = plt.subplots(figsize=(12, 8))
-    ax.plot(selected_percentiles, selected_cumulative_percentage, marker='o')
-    ax.set_xlabel('Percentile of App')
-    ax.set_ylabel('Cumulative Percentage of Total Installs')
-    ax.set_title('Pareto Distribution of Installs by App')
-    ax.set_xticks(np.arange(0, 101, 10))
-    ax.set_yticks(np.arange(0, 101, 10))
-    plt.grid()
-    plt.tight_layout()
-    plt.savefig('installs pareto_distribution_install_id_by_app.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def plot_installs_by_os_bar_graph(dataframe):
-    installs_by_os = dataframe.groupby("device_os_version")["install_id"].count().sort_values(ascending=False)
-    total_installs = installs_by_os.sum()
-
-    fig, ax = plt.subplots(figsize=(15, 6))
-    bars = installs_by_os.plot(kind="bar", ax=ax)
-
-    ax.set_title("Distribution of Install IDs by Device OS Version")
-    ax.set_xlabel("Device OS Version")
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
     ax.set_ylabel("Number of Install IDs")
 
-    last_bar_index = len(bars.containers[0]) - 1
-
-    for index, bar in enumerate(bars.containers[0]):
-        x = bar.get_x() + bar.get_width() / 2
-        y = bar.get_height()
-        percentage = y / total_installs * 100
-
-        # Check if the percentage is above 2.5 or if it is the last bar
-        if percentage > 2.5 or index == last_bar_index:
-            label = f"{y:.0f}, {percentage:.1f}%"
-            ax.text(x, y + 5, label, ha="center", va="bottom", fontsize=9, rotation=0,
-                    bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.2'))
-
-    plt.xticks(rotation=60)
-    plt.tight_layout()
-    plt.savefig('installs plot_installs_by_os_bar_graph.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def pareto_distribution_install_id_by_os(dataframe):
-    # Calculate the number of installs for each OS version
-    installs_by_os = dataframe.groupby("device_os_version")["install_id"].count().reset_index()
-
-    # Calculate the cumulative percentage of total installs
-    installs_by_os = installs_by_os.sort_values("install_id", ascending=False).reset_index(drop=True)
-    installs_by_os["cumulative_percentage"] = installs_by_os["install_id"].cumsum() / installs_by_os[
-        "install_id"].sum() * 100
-
-    # Plot the Pareto distribution
-    percentiles = np.linspace(0, 100, len(installs_by_os) + 1)
-    selected_percentiles = np.arange(0, 101, 5)
-    selected_cumulative_percentage = np.interp(selected_percentiles, percentiles,
-                                               np.insert(installs_by_os["cumulative_percentage"].values, 0, 0))
-    fig, ax = plt.subplots(figsize=(12, 8))
-    ax.plot(selected_percentiles, selected_cumulative_percentage, marker='o')
-    ax.set_xlabel('Percentile of Device OS Version')
-    ax.set_ylabel('Cumulative Percentage of Total Installs')
-    ax.set_title('Pareto Distribution of Installs by Device OS Version')
-    ax.set_xticks(np.arange(0, 101, 10))
-    ax.set_yticks(np.arange(0, 101, 10))
-    plt.grid()
-    plt.tight_layout()
-    plt.savefig('installs pareto_distribution_install_id_by_os.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def installs_main(file_path):
+    label_bars(ax, share_labels(installs.values, total_installs, min_percentage=min_percentage, with_counts=True,
+                                label_last=label_last), bars.containers[0], fontsize=9, bbox=LABEL_BOX)
+
+    ax.tick_params(axis='x', labelrotation=rotation)
+    if tick_labelsize is not None:
+        ax.tick_params(axis='x', labelsize=tick_labelsize)
+    fig.tight_layout()
+
+
+def installs_figure_specs(installs_df, installs_by, date_column="event_date", window=30):
+    """
+    Declares the installs charts for ``figure_specs.render_figures``.
+
+    The daily installs, their moving average and the Pareto curves are computed here, so the specs hold small
+    aggregates rather than the install rows.
+
+    Args:
+        installs_df (pd.DataFrame): The installs, used for the daily counts only.
+        installs_by (dict): The install counts by dimension, from ``aggregate_installs_by_dimensions``.
+        date_column (str): The install date column.
+        window (int): The moving average window in days.
+
+    Returns:
+        list of FigureSpec: The charts, in the order ``installs_main`` used to plot them.
+    """
+    # Aggregate installs by date onto a dense daily calendar, so days without installs count as zero
+    installs_by_date = build_daily_calendar(installs_df.groupby(date_column).size())
+    installs_over_time = rolling_stats(installs_by_date, windows=(window,), stats=("mean",))[[f"mean_{window}"]]
+    installs_over_time.insert(0, "installs", installs_by_date)
+
+    specs = [FigureSpec('installs plot_installs_over_time_and_moving_average.png', draw_installs_over_time,
+                        installs_over_time, {"window": window}, figsize=(10, 6))]
+
+    # Bar chart and Pareto curve of each dimension; beyond top_n the remaining categories are shown as one "Other" bar
+    charts = [
+        ("country", "country_id", "Country", "Country ID", None, {}),
+        ("network", "network_id", "Network", "Network ID", None, {}),
+        ("app", "app_id", "App", "App ID", 30,
+         {"min_percentage": 4.5, "label_last": True, "tick_labelsize": 8}),
+        ("os", "device_os_version", "Device OS Version", "Device OS Version", 30,
+         {"min_percentage": 2.5, "label_last": True, "rotation": 60}),
+    ]
+    for name, dimension, label, xlabel, top_n, options in charts:
+        installs = installs_by[dimension]
+        specs.append(FigureSpec(f'installs plot_installs_by_{name}_bar_graph.png', draw_installs_bar_graph,
+                                top_n_with_other(installs, top_n),
+                                dict(options, total_installs=installs.sum(),
+                                     title=f"Distribution of Install IDs by {label}", xlabel=xlabel),
+                                figsize=(15, 6) if name == "os" else (10, 6)))
+        specs.append(FigureSpec(f'installs pareto_distribution_install_id_by_{name}.png', draw_pareto,
+                                pareto_points(installs),
+                                {"title": f'Pareto Distribution of Installs by {label}',
+                                 "xlabel": f'Percentile of {label}',
+                                 "ylabel": 'Cumulative Percentage of Total Installs'}, figsize=(12, 8)))
+    return specs
+
+
+def installs_main(file_path, max_workers=None, make_plots=True, approximate=False):
     installs_df = load_data(file_path)
 
+    first_date, last_date = get_temporal_scope(installs_df, "event_date")
 
-    get_temporal_scope(installs_df, "event_date")
-
-    read_and_explore(installs_df)
-
-    count_install_ids(installs_df, "install_id")
-
-    find_duplicate_install_ids(installs_df, "install_id")
-
-    count_unique_values(installs_df)
-
-    plot_installs_over_time_and_moving_average(installs_df, 'event_date')
-
-    plot_installs_by_country_bar_graph(installs_df)
-
-    pareto_distribution_install_id_by_country(installs_df)
-
-    plot_installs_by_network_bar_graph(installs_df)
+    unique_install_ids, total_install_ids = count_install_ids(installs_df, "install_id", approximate)
 
-    pareto_distribution_install_id_by_network(installs_df)
+    duplicates = find_duplicate_install_ids(installs_df, "install_id")
 
-    plot_installs_by_app_bar_graph(installs_df)
+    unique_values = count_unique_values(installs_df)
 
-    pareto_distribution_install_id_by_app(installs_df)
+    # Count installs for all four dimensions once and share the counts between the bar and Pareto plots
+    installs_by = aggregate_installs_by_dimensions(installs_df, max_workers=max_workers)
 
-    plot_installs_by_os_bar_graph(installs_df)
+    # Render the charts whose saved PNG is out of date; the result holds their specs, not drawn figures
+    figures = []
+    if make_plots:
+        figures = installs_figure_specs(installs_df, installs_by)
+        render_figures(figures)
 
-    pareto_distribution_install_id_by_os(installs_df)
+    return InstallsResult(first_date=first_date, last_date=last_date, unique_install_ids=unique_install_ids,
+                          total_install_ids=total_install_ids, duplicate_install_ids=duplicates,
+                          unique_values=unique_values, installs_by=installs_by, figures=figures)
 
 
 if __name__ == "__main__":
     installs_file_path = "data/installs.csv"
-    installs_main(installs_file_path)
+    result = installs_main(installs_file_path)
+    print_installs_report(result)
+    show_figures(result.figures)
@@ -0,0 +1,237 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cohort_analysis import build_install_index, lookup_install_codes
+
+KPI_NAMES = ["average_revenue_per_user", "user_acquisition_cost", "average_payout_per_user", "conversion_rate_pct",
+             "profit_margin", "risk_to_reward"]
+
+# Columns of the per-install value matrix; the merged_* columns weight each value by the number of rows of its install
+# in the installs file, as the merge in holistic_analysis does
+INSTALL_VALUE_COLUMNS = ["revenue", "merged_revenue", "has_revenue", "payouts", "merged_payouts", "has_payouts",
+                         "converted"]
+
+# Number of replicates per task of the process pool; it sets the random streams, not the memory used
+DEFAULT_BATCH_SIZE = 32
+
+# Bytes of draws and counts a worker holds at once while resampling, whatever the number of installs
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+
+# Bytes per row of a block: the int32 draws, their int64 counts and the float64 copy the matrix product makes
+_BYTES_PER_ROW = 20
+
+# Data shared with the worker processes, set once per process by _init_worker
+_WORKER_DATA = {}
+
+
+def per_install_values(installs_csv, revenue_csv, payouts_csv, chunksize=1_000_000):
+    """
+    Aggregates revenue and payouts per install, so that resampling installs carries their values along.
+
+    Installs are deduplicated on install_id (keeping the first row). Revenue and payouts are streamed chunk by chunk
+    and attached to installs by binary search. Rows without a matching install cannot be resampled with an install;
+    their totals are returned separately, as the profit margin of ``holistic_analysis`` still counts them. An install
+    is converted when its first revenue row (in file order) is positive, as in ``holistic_analysis.conversion_rate``.
+
+    Args:
+        installs_csv (str): The path to the CSV file containing installs data.
+        revenue_csv (str): The path to the CSV file containing revenue data.
+        payouts_csv (str): The path to the CSV file containing payouts data.
+        chunksize (int): The number of revenue/payout rows processed at a time.
+
+    Returns:
+        tuple: A tuple containing the following elements:
+            - numpy.ndarray: An array of shape (number of installs, 7) with the columns of ``INSTALL_VALUE_COLUMNS``.
+            - dict: The revenue and payouts of rows without a matching install.
+    """
+    installs = pd.read_csv(installs_csv, usecols=["event_date", "install_id"])
+    install_index = build_install_index(installs)
+    n_installs = len(install_index["install_ids"])
+    values = np.zeros((n_installs, len(INSTALL_VALUE_COLUMNS)))
+    install_rows = np.bincount(lookup_install_codes(install_index, installs["install_id"].dropna().to_numpy()),
+                               minlength=n_installs)
+    unattributed = {"revenue": 0.0, "payouts": 0.0}
+
+    seen = np.zeros(n_installs, dtype=bool)
+    for chunk in pd.read_csv(revenue_csv, usecols=["install_id", "value_usd"], chunksize=chunksize):
+        codes = lookup_install_codes(install_index, chunk["install_id"].to_numpy())
+        matched = codes >= 0
+        revenue = chunk["value_usd"].to_numpy(dtype=float)
+        unattributed["revenue"] += revenue[~matched].sum()
+        revenue = revenue[matched]
+        codes = codes[matched]
+        values[:, 0] += np.bincount(codes, weights=revenue, minlength=n_installs)
+
+        # The first row of each install in this chunk decides its conversion unless an earlier chunk already did
+        first_codes, first_positions = np.unique(codes, return_index=True)
+        new = ~seen[first_codes]
+        values[first_codes[new], 6] = revenue[first_positions[new]] > 0
+        seen[first_codes] = True
+    values[:, 1] = values[:, 0] * install_rows
+    values[:, 2] = seen
+
+    for chunk in pd.read_csv(payouts_csv, usecols=["install_id", "value_usd"], chunksize=chunksize):
+        codes = lookup_install_codes(install_index, chunk["install_id"].to_numpy())
+        matched = codes >= 0
+        payouts = chunk["value_usd"].to_numpy(dtype=float)
+        unattributed["payouts"] += payouts[~matched].sum()
+        payouts = payouts[matched]
+        values[:, 3] += np.bincount(codes[matched], weights=payouts, minlength=n_installs)
+        values[:, 5] += np.bincount(codes[matched], minlength=n_installs)
+    values[:, 4] = values[:, 3] * install_rows
+    values[:, 5] = values[:, 5] > 0
+    return values, unattributed
+
+
+def kpis_from_totals(install_totals, spend_totals, n_installs, unattributed=None):
+    """
+    Computes the holistic KPIs from (weighted) per-install totals and ad spend totals, with the same definitions as
+    ``holistic_analysis.holistic_main``.
+
+    Args:
+        install_totals (numpy.ndarray): Column sums of the per-install value matrix, shape (..., 7).
+        spend_totals (numpy.ndarray): The total ad spend, shape (...).
+        n_installs (int): The number of installs in each sample.
+        unattributed (dict, optional): The revenue and payouts without a matching install, added to the totals of
+            the profit margin as they are.
+
+    Returns:
+        dict: Each KPI of ``KPI_NAMES`` as an array of shape (...).
+    """
+    unattributed = unattributed or {"revenue": 0.0, "payouts": 0.0}
+    revenue, merged_revenue, revenue_users, payouts, merged_payouts, payout_users, conversions = np.moveaxis(
+        install_totals, -1, 0)
+    revenue = revenue + unattributed["revenue"]
+    payouts = payouts + unattributed["payouts"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        arpu = merged_revenue / revenue_users
+        appu = merged_payouts / payout_users
+        uac = spend_totals / n_installs
+        return {
+            "average_revenue_per_user": arpu,
+            "user_acquisition_cost": uac,
+            "average_payout_per_user": appu,
+            "conversion_rate_pct": conversions / n_installs * 100,
+            "profit_margin": (revenue - spend_totals - payouts) / revenue,
+            "risk_to_reward": arpu / (appu + uac),
+        }
+
+
+def _init_worker(install_values, spend_values):
+    # Runs once per process so the data is not pickled with every task
+    _WORKER_DATA["install_values"] = install_values
+    _WORKER_DATA["spend_values"] = spend_values
+
+
+def _resampled_totals(rng, values, max_bytes):
+    # Column totals of one resample of the rows with replacement. The n draws are first split between blocks of rows
+    # with a multinomial and then drawn uniformly inside each block, which together is the same multinomial(n, 1/n)
+    # weighting as drawing all rows at once, but only one block of draws and counts is held at a time
+    n_rows = len(values)
+    block_size = max(1, min(n_rows, max_bytes // _BYTES_PER_ROW))
+    starts = np.arange(0, n_rows, block_size)
+    sizes = np.minimum(block_size, n_rows - starts)
+    totals = np.zeros(values.shape[1:])
+    for start, size, count in zip(starts, sizes, rng.multinomial(n_rows, sizes / n_rows)):
+        draws = rng.integers(0, size, count, dtype=np.int32)
+        totals += np.bincount(draws, minlength=size) @ values[start:start + size]
+    return totals
+
+
+def _bootstrap_totals(seed, n_replicates, max_bytes):
+    # Weighted totals for a block of replicates, computed from the per-install and ad spend arrays instead of
+    # resampling DataFrames
+    rng = np.random.default_rng(seed)
+    install_values = _WORKER_DATA["install_values"]
+    spend_values = _WORKER_DATA["spend_values"]
+    install_totals = np.empty((n_replicates, install_values.shape[1]))
+    spend_totals = np.empty(n_replicates)
+    for replicate in range(n_replicates):
+        install_totals[replicate] = _resampled_totals(rng, install_values, max_bytes)
+        spend_totals[replicate] = _resampled_totals(rng, spend_values, max_bytes)
+    return install_totals, spend_totals
+
+
+def bootstrap_kpis(install_values, spend_values, n_bootstrap=2000, confidence=0.95, seed=None, max_workers=None,
+                   batch_size=DEFAULT_BATCH_SIZE, unattributed=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Computes percentile bootstrap confidence intervals for the holistic KPIs.
+
+    Every replicate resamples the installs (with their revenue, payouts and conversion attached) and, independently,
+    the ad spend rows, both with replacement. Replicates are split into blocks that run in a process pool, each
+    block with its own independent random stream, so the result only depends on the seed and not on the number of
+    workers. Each worker holds at most about ``max_bytes`` of resampling draws besides the data, so memory does not
+    grow with the number of installs times the number of replicates. Revenue and payouts without a matching install
+    are not tied to any install, so they enter every replicate's profit margin unchanged; the point estimates then
+    equal the KPIs of ``holistic_main``.
+
+    Args:
+        install_values (numpy.ndarray): The output of ``per_install_values``.
+        spend_values (numpy.ndarray): The value_usd of every ad spend row.
+        n_bootstrap (int): The number of bootstrap replicates.
+        confidence (float): The confidence level of the intervals.
+        seed (int, optional): The random seed.
+        max_workers (int, optional): The number of processes; 1 runs in the current process.
+        batch_size (int): The number of replicates per task of the process pool.
+        unattributed (dict, optional): The revenue and payouts without a matching install, from
+            ``per_install_values``.
+        max_bytes (int): The memory each worker may use for the draws of one resample, in bytes.
+
+    Returns:
+        pd.DataFrame: One row per KPI with the point estimate, the standard error and the interval bounds.
+    """
+    install_values = np.asarray(install_values, dtype=float)
+    spend_values = np.asarray(spend_values, dtype=float)
+    n_installs = len(install_values)
+
+    # One task per batch; the blocks do not depend on max_workers, so the random streams do not either
+    n_blocks = max(1, -(-n_bootstrap // batch_size))
+    block_sizes = [len(block) for block in np.array_split(np.arange(n_bootstrap), n_blocks)]
+    seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+
+    if max_workers == 1:
+        _init_worker(install_values, spend_values)
+        blocks = [_bootstrap_totals(s, size, max_bytes) for s, size in zip(seeds, block_sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(install_values, spend_values)) as executor:
+            blocks = list(executor.map(_bootstrap_totals, seeds, block_sizes, [max_bytes] * n_blocks))
+
+    replicates = kpis_from_totals(np.concatenate([block[0] for block in blocks]),
+                                  np.concatenate([block[1] for block in blocks]), n_installs, unattributed)
+    estimates = kpis_from_totals(install_values.sum(axis=0), spend_values.sum(), n_installs, unattributed)
+
+    alpha = (1 - confidence) / 2
+    rows = {}
+    for name in KPI_NAMES:
+        values = replicates[name][np.isfinite(replicates[name])]
+        lower, upper = np.quantile(values, [alpha, 1 - alpha]) if len(values) else (np.nan, np.nan)
+        rows[name] = {"estimate": float(estimates[name]), "std_error": values.std(ddof=1) if len(values) > 1
+                      else np.nan, "ci_lower": lower, "ci_upper": upper}
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def bootstrap_holistic_kpis(installs_csv, revenue_csv, adspend_csv, payouts_csv, n_bootstrap=2000, confidence=0.95,
+                            seed=None, max_workers=None):
+    """
+    Loads the per-install aggregates and ad spend and bootstraps the holistic KPIs; see ``bootstrap_kpis``.
+
+    Args:
+        installs_csv (str): The path to the CSV file containing installs data.
+        revenue_csv (str): The path to the CSV file containing revenue data.
+        adspend_csv (str): The path to the CSV file containing ad spend data.
+        payouts_csv (str): The path to the CSV file containing payouts data.
+        n_bootstrap (int): The number of bootstrap replicates.
+        confidence (float): The confidence level of the intervals.
+        seed (int, optional): The random seed.
+        max_workers (int, optional): The number of processes.
+
+    Returns:
+        pd.DataFrame: One row per KPI with the point estimate, the standard error and the interval bounds.
+    """
+    install_values, unattributed = per_install_values(installs_csv, revenue_csv, payouts_csv)
+    spend_values = pd.read_csv(adspend_csv, usecols=["value_usd"])["value_usd"].to_numpy(dtype=float)
+    return bootstrap_kpis(install_values, spend_values, n_bootstrap, confidence, seed, max_workers,
+                          unattributed=unattributed)
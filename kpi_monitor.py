@@ -0,0 +1,408 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from date_dimension import day_numbers
+
+DATA_PATHS = {
+    "installs": "data/installs.csv",
+    "revenue": "data/revenue_converted.csv",
+    "payouts": "data/payouts_converted.csv",
+    "adspend": "data/adspend_converted.csv",
+}
+
+# Installs come first within a day, so revenue and payouts of a new install find it
+EVENT_KINDS = ("installs", "revenue", "payouts", "adspend")
+
+KPI_NAMES = ["average_revenue_per_user", "user_acquisition_cost", "average_payout_per_user", "conversion_rate_pct",
+             "profit_margin"]
+
+# A one-day tumbling window and a seven-day window sliding by one day; sizes and slides are in days
+DEFAULT_WINDOWS = {"tumbling_1d": (1, None), "sliding_7d": (7, 1)}
+
+# The (lower, upper) bounds of each KPI; None leaves a side unchecked
+DEFAULT_THRESHOLDS = {
+    "profit_margin": (-1.0, None),
+    "conversion_rate_pct": (1.0, None),
+    "user_acquisition_cost": (None, 5.0),
+}
+
+
+@dataclass
+class Event:
+    """One install, revenue, payout or ad spend event; time is a day number (days since 1970-01-01)."""
+    kind: str
+    time: int
+    install_id: Optional[str] = None
+    value_usd: float = 0.0
+
+
+@dataclass
+class Alert:
+    """A KPI of a window that crossed one of its bounds; time is the start of the window's last pane."""
+    window: str
+    kpi: str
+    value: float
+    bound: float
+    time: int
+
+
+class _Pane:
+    # The totals of one slide of a window; distinct install_ids are kept as counts so they can be subtracted again
+    def __init__(self, start):
+        self.start = start
+        self.totals = {"revenue": 0.0, "matched_revenue": 0.0, "payouts": 0.0, "matched_payouts": 0.0, "adspend": 0.0}
+        self.installs = {}
+        self.revenue_users = {}
+        self.payout_users = {}
+        self.converted = {}
+
+
+def _count(counts, key, delta=1):
+    # Returns 1 when the key was added, -1 when it was removed and 0 otherwise
+    previous = counts.get(key, 0)
+    value = previous + delta
+    if value:
+        counts[key] = value
+    else:
+        del counts[key]
+    return (value != 0) - (previous != 0)
+
+
+class SlidingWindow:
+    """
+    The holistic KPIs over the most recent ``size`` days, updated in O(1) per event.
+
+    The window is a queue of panes of ``slide`` days. Every event updates its pane and the running totals of the
+    window; when time moves past a pane, it is dropped and its users are subtracted from the window's counts, so no
+    event is ever visited twice. Distinct users are tracked as install_id counts, so removing a pane removes exactly
+    the users only it contributed. A window with ``slide`` equal to ``size`` (the default) is a tumbling window.
+
+    The KPIs follow ``holistic_analysis``: ARPU and APPU only count revenue and payouts of installs seen by the
+    monitor, so revenue dated before its install is not attributed as it is in the batch analysis. UAC divides ad
+    spend by the distinct installs in the window, conversion is the share of those installs with positive revenue in
+    the window, and the margin uses all revenue, ad spend and payouts.
+    """
+
+    def __init__(self, size, slide=None):
+        self.size = size
+        self.slide = slide or size
+        if self.size % self.slide:
+            raise ValueError("The window size must be a multiple of the slide")
+        self.panes = deque()
+        self.totals = _Pane(None).totals
+        self.installs = {}
+        self.revenue_users = {}
+        self.payout_users = {}
+        self.converted = {}
+        # The number of install_ids both installed and converted in the window, the numerator of the conversion rate
+        self.converted_installs = 0
+        self.late_events = 0
+
+    def _count_install(self, install_id, delta):
+        if _count(self.installs, install_id, delta) and install_id in self.converted:
+            self.converted_installs += 1 if delta > 0 else -1
+
+    def _count_converted(self, install_id, delta):
+        if _count(self.converted, install_id, delta) and install_id in self.installs:
+            self.converted_installs += 1 if delta > 0 else -1
+
+    def _evict(self, pane):
+        # The sums are rebuilt from the remaining panes rather than subtracted, so rounding errors cannot build up;
+        # that is one addition per pane per closed pane, not per event
+        self.totals = {key: sum(remaining.totals[key] for remaining in self.panes) for key in pane.totals}
+        for window_counts, pane_counts in ((self.revenue_users, pane.revenue_users),
+                                           (self.payout_users, pane.payout_users)):
+            for install_id, count in pane_counts.items():
+                _count(window_counts, install_id, -count)
+        for install_id, count in pane.installs.items():
+            self._count_install(install_id, -count)
+        for install_id, count in pane.converted.items():
+            self._count_converted(install_id, -count)
+
+    def advance(self, time):
+        """
+        Moves the window forward so that it ends with the pane holding ``time``.
+
+        Args:
+            time (int): The current day number.
+
+        Returns:
+            bool: Whether a new pane was started, i.e. the previous one closed.
+        """
+        pane_start = time - time % self.slide
+        if self.panes and pane_start <= self.panes[-1].start:
+            return False
+        # Panes stay contiguous so an event finds its pane by offset; days without events get empty panes, but never
+        # more than the window holds
+        next_start = self.panes[-1].start + self.slide if self.panes else pane_start
+        for start in range(max(next_start, pane_start - self.size + self.slide), pane_start + 1, self.slide):
+            self.panes.append(_Pane(start))
+        while self.panes[0].start <= pane_start - self.size:
+            self._evict(self.panes.popleft())
+        return True
+
+    def add(self, event, known_install):
+        """
+        Adds one event to the window.
+
+        Args:
+            event (Event): The event; events older than the window are counted as late and ignored.
+            known_install (bool): Whether the event's install was seen by the monitor.
+        """
+        self.advance(event.time)
+        pane_index = (event.time - event.time % self.slide - self.panes[0].start) // self.slide
+        if pane_index < 0:
+            self.late_events += 1
+            return
+        pane = self.panes[pane_index]
+
+        updates = {}
+        if event.kind == "installs":
+            _count(pane.installs, event.install_id)
+            self._count_install(event.install_id, 1)
+        elif event.kind == "adspend":
+            updates = {"adspend": event.value_usd}
+        elif event.kind == "revenue":
+            updates = {"revenue": event.value_usd}
+            if known_install:
+                updates["matched_revenue"] = event.value_usd
+                _count(pane.revenue_users, event.install_id)
+                _count(self.revenue_users, event.install_id)
+                if event.value_usd > 0:
+                    _count(pane.converted, event.install_id)
+                    self._count_converted(event.install_id, 1)
+        else:
+            updates = {"payouts": event.value_usd}
+            if known_install:
+                updates["matched_payouts"] = event.value_usd
+                _count(pane.payout_users, event.install_id)
+                _count(self.payout_users, event.install_id)
+
+        for key, value in updates.items():
+            pane.totals[key] += value
+            self.totals[key] += value
+
+    def kpis(self):
+        """
+        Computes the KPIs from the running totals; a KPI without a denominator is NaN.
+
+        Returns:
+            dict: The value of each KPI in ``KPI_NAMES``.
+        """
+        totals = self.totals
+
+        def ratio(numerator, denominator):
+            return numerator / denominator if denominator else np.nan
+
+        return {
+            "average_revenue_per_user": ratio(totals["matched_revenue"], len(self.revenue_users)),
+            "user_acquisition_cost": ratio(totals["adspend"], len(self.installs)),
+            "average_payout_per_user": ratio(totals["matched_payouts"], len(self.payout_users)),
+            "conversion_rate_pct": ratio(self.converted_installs * 100, len(self.installs)),
+            "profit_margin": ratio(totals["revenue"] - totals["adspend"] - totals["payouts"], totals["revenue"]),
+        }
+
+
+class KPIMonitor:
+    """
+    Maintains the holistic KPIs over several windows and raises alerts when a KPI leaves its bounds.
+
+    Bounds are checked whenever a pane of a window closes, i.e. with the first event past it, and at the end of the
+    stream. A half-filled pane would give misleading KPIs, e.g. a day's installs arrive before its revenue, so the
+    latency of an alert is one slide. An alert is raised when a KPI enters a breach, not again while it stays there.
+    The KPIs of every window are recorded at the same points.
+
+    Args:
+        windows (dict): The (size, slide) in days of each named window; a slide of None makes a tumbling window.
+        thresholds (dict): The (lower, upper) bounds of each KPI.
+        on_alert (callable, optional): Called with every Alert as it is raised.
+    """
+
+    def __init__(self, windows=None, thresholds=None, on_alert=None):
+        windows = windows or DEFAULT_WINDOWS
+        self.windows = {name: SlidingWindow(size, slide) for name, (size, slide) in windows.items()}
+        self.thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+        self.on_alert = on_alert
+        self.install_ids = set()
+        self.alerts = []
+        self.snapshots = []
+        self.events = 0
+        self._breaches = set()
+
+    def _close(self, name, window):
+        # Record and check the KPIs of the window ending with its newest pane, which is complete
+        end = window.panes[-1].start
+        kpis = window.kpis()
+        self.snapshots.append({"window": name, "end": end, **kpis})
+        self._check(name, kpis, end)
+
+    def _check(self, name, kpis, time):
+        for kpi, value in kpis.items():
+            if kpi not in self.thresholds or np.isnan(value):
+                continue
+            lower, upper = self.thresholds[kpi]
+            bound = lower if lower is not None and value < lower else upper if upper is not None and value > upper \
+                else None
+            if bound is None:
+                self._breaches.discard((name, kpi))
+            elif (name, kpi) not in self._breaches:
+                self._breaches.add((name, kpi))
+                alert = Alert(name, kpi, value, bound, time)
+                self.alerts.append(alert)
+                if self.on_alert is not None:
+                    self.on_alert(alert)
+
+    def process(self, event):
+        """
+        Updates every window with one event, first closing the panes it moves past.
+
+        Args:
+            event (Event): The event.
+        """
+        self.events += 1
+        if event.kind == "installs":
+            self.install_ids.add(event.install_id)
+        known_install = event.install_id in self.install_ids
+        for name, window in self.windows.items():
+            if window.panes and event.time - event.time % window.slide > window.panes[-1].start:
+                self._close(name, window)
+            window.add(event, known_install)
+
+    async def run(self, queue):
+        """
+        Consumes events from a queue until it yields None.
+
+        Args:
+            queue (asyncio.Queue): The event source.
+        """
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            self.process(event)
+        for name, window in self.windows.items():
+            if window.panes:
+                self._close(name, window)
+
+    def snapshot_frame(self):
+        """
+        Returns the recorded KPIs of every window.
+
+        Returns:
+            pd.DataFrame: One row per window and pane close, with the window end as a date.
+        """
+        snapshots = pd.DataFrame(self.snapshots, columns=["window", "end"] + KPI_NAMES)
+        snapshots["end"] = snapshots["end"].to_numpy().astype("datetime64[D]")
+        return snapshots
+
+
+def _read_events(kind, path):
+    # The events of one file, in file order
+    columns = ["event_date", "value_usd"] if kind == "adspend" else ["event_date", "install_id"] + (
+        [] if kind == "installs" else ["value_usd"])
+    data = pd.read_csv(path, usecols=columns)
+    return pd.DataFrame({
+        "time": day_numbers(data["event_date"]),
+        "kind": EVENT_KINDS.index(kind),
+        "install_id": data["install_id"] if "install_id" in data else None,
+        "value_usd": data["value_usd"] if "value_usd" in data else 0.0,
+    })
+
+
+async def replay_csv_events(queue, data_paths=None, seconds_per_day=0.0):
+    """
+    Replays the data files as one time-ordered event stream, a stand-in for a live source.
+
+    Args:
+        queue (asyncio.Queue): The queue the events are put on; None is put last.
+        data_paths (dict, optional): The file of each event kind. Defaults to ``DATA_PATHS``.
+        seconds_per_day (float): The pause between days, to simulate the data arriving over time.
+    """
+    data_paths = data_paths or DATA_PATHS
+    events = pd.concat([_read_events(kind, path) for kind, path in data_paths.items()], ignore_index=True)
+    events = events.sort_values(["time", "kind"], kind="mergesort")
+    current_day = None
+    for time, kind, install_id, value_usd in events.itertuples(index=False):
+        if seconds_per_day and current_day is not None and time != current_day:
+            await asyncio.sleep(seconds_per_day)
+        current_day = time
+        await queue.put(Event(EVENT_KINDS[kind], int(time), install_id, float(value_usd)))
+    await queue.put(None)
+
+
+def _parse_event_line(line):
+    # kind,event_date,install_id,value_usd
+    kind, event_date, install_id, value_usd = line.rstrip("\n").split(",")
+    if kind not in EVENT_KINDS:
+        raise ValueError(f"Unknown event kind: {kind}")
+    return Event(kind, int(day_numbers([event_date])[0]), install_id or None, float(value_usd or 0))
+
+
+async def tail_events(queue, path, poll_interval=0.1, stop_line="END"):
+    """
+    Follows a file that other processes append events to, one "kind,event_date,install_id,value_usd" line each.
+
+    Args:
+        queue (asyncio.Queue): The queue the events are put on; None is put when the stop line is read.
+        path (str): The path of the file.
+        poll_interval (float): The pause in seconds when no new line is available.
+        stop_line (str): The line that ends the stream.
+    """
+    with open(path) as file:
+        partial = ""
+        while True:
+            line = file.readline()
+            if not line:
+                await asyncio.sleep(poll_interval)
+                continue
+            partial += line
+            if not partial.endswith("\n"):
+                # A line still being written
+                continue
+            line, partial = partial.strip(), ""
+            if line == stop_line:
+                await queue.put(None)
+                return
+            if line:
+                await queue.put(_parse_event_line(line))
+
+
+async def _monitor_pipeline(monitor, source, max_queue_size):
+    queue = asyncio.Queue(maxsize=max_queue_size)
+    await asyncio.gather(source(queue), monitor.run(queue))
+
+
+def kpi_monitor_main(data_paths=None, windows=None, thresholds=None, seconds_per_day=0.0, max_queue_size=10_000,
+                     on_alert=None):
+    """
+    Streams the data files through the KPI monitor.
+
+    Args:
+        data_paths (dict, optional): The file of each event kind. Defaults to ``DATA_PATHS``.
+        windows (dict, optional): The windows; see ``KPIMonitor``.
+        thresholds (dict, optional): The KPI bounds; see ``KPIMonitor``.
+        seconds_per_day (float): The pause between days of the replay.
+        max_queue_size (int): The number of events buffered between the source and the monitor.
+        on_alert (callable, optional): Called with every Alert as it is raised.
+
+    Returns:
+        KPIMonitor: The monitor, with its alerts and KPI snapshots.
+    """
+    monitor = KPIMonitor(windows, thresholds, on_alert)
+
+    async def source(queue):
+        await replay_csv_events(queue, data_paths, seconds_per_day)
+
+    asyncio.run(_monitor_pipeline(monitor, source, max_queue_size))
+    return monitor
+
+
+if __name__ == "__main__":
+    kpi_monitor = kpi_monitor_main(on_alert=print)
+    print(f"{kpi_monitor.events} events, {len(kpi_monitor.alerts)} alerts")
+    print(kpi_monitor.snapshot_frame().groupby("window").tail(1).to_string(index=False))
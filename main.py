@@ -2,15 +2,21 @@
 
 # Import the required functions from their respective modules
 from data_check import data_check_main
+from figure_specs import show_figures
 from adspend_analysis import adspend_main
 from holistic_analysis import holistic_main
 from installs_analysis import installs_main
 from payouts_analysis import payouts_main
 from revenue_analysis import revenue_main
 from monte_carlo_simulation import monte_carlo_main
+from cohort_analysis import cohort_main
+from roas_cube import roas_main
+from reporting import (print_adspend_report, print_cohort_report, print_data_check_report, print_holistic_report,
+                       print_installs_report, print_monte_carlo_report, print_payouts_report, print_revenue_report,
+                       print_roas_report)
 
 
-def main():
+def main(as_micros=False):
     """
     This function calls the main analysis functions for each of the following:
     - Ad spend
@@ -20,46 +26,76 @@ def main():
     - Installs
     - Payouts
     - Revenue
+    - Cohort LTV
+    - ROAS by network and country
 
-    It serves as the entry point for the entire analysis pipeline.
+    It serves as the entry point for the entire analysis pipeline. The analysis functions return result objects
+    and do not print; the reporting functions format them for the console, and the figures of each analysis are
+    shown after its report when pyplot has an interactive backend.
+
+    Args:
+        as_micros (bool): Also store the converted value_usd amounts as int64 micro-dollars (value_micros), which the
+            USD totals are then summed from exactly.
     """
     # Call the main data check function for data_check.py
     print("===== Data Check =====")
-    data_check_main()
+    print_data_check_report(data_check_main(as_micros))
     print("\n")
 
     # Call the main analysis function for holistic analysis
     print("===== Holistic Analysis =====")
-    holistic_main()
+    result = holistic_main()
+    print_holistic_report(result)
+    show_figures(result.figures)
     print("\n")
 
     # Call the main analysis function for revenue
     print("===== Monte Carlo Simulation =====")
-    monte_carlo_main()
+    result = monte_carlo_main()
+    print_monte_carlo_report(result)
+    show_figures(result.figures)
     print("\n")
 
     # Call the main analysis function for ad spend
     print("===== Ad Spend Analysis =====")
     adspend_file_path = "data/adspend_converted.csv"
-    adspend_main(adspend_file_path)
+    result = adspend_main(adspend_file_path)
+    print_adspend_report(result)
+    show_figures(result.figures)
     print("\n")
 
     # Call the main analysis function for installs
     print("===== Installs Analysis =====")
 
     installs_file_path = "data/installs.csv"
-    installs_main(installs_file_path)
+    result = installs_main(installs_file_path)
+    print_installs_report(result)
+    show_figures(result.figures)
     print("\n")
 
     # Call the main analysis function for payouts
     print("===== Payouts Analysis =====")
     payouts_file_path = "data/payouts_converted.csv"
-    payouts_main(payouts_file_path)
+    result = payouts_main(payouts_file_path)
+    print_payouts_report(result)
+    show_figures(result.figures)
     print("\n")
 
     # Call the main analysis function for revenue
     print("===== Revenue Analysis =====")
-    revenue_main()
+    result = revenue_main()
+    print_revenue_report(result)
+    show_figures(result.figures)
+    print("\n")
+
+    # Call the main analysis function for install cohorts
+    print("===== Cohort Analysis =====")
+    print_cohort_report(cohort_main())
+    print("\n")
+
+    # Call the main analysis function for ROAS
+    print("===== ROAS Analysis =====")
+    print_roas_report(roas_main())
     print("\n")
 
 
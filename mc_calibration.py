@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from date_dimension import parse_event_dates
+
+DATA_PATHS = {
+    "revenue": "data/revenue_converted.csv",
+    "payouts": "data/payouts_converted.csv",
+    "adspend": "data/adspend_converted.csv",
+}
+
+# Share of the best and worst days treated as sudden convex payoffs and sudden errors instead of regular wins/losses
+DEFAULT_TAIL_QUANTILE = 0.02
+
+# The event interval range runs from the mean gap between tail days divided by this factor to the mean gap times it;
+# for a factor of 1.5 the mean event rate of a uniform interval is within 3% of the empirical one
+TAIL_INTERVAL_SPREAD = 1.5
+
+
+def _daily_totals(csv_path):
+    # Sum value_usd per day, reading only the two columns needed
+    data = pd.read_csv(csv_path, usecols=["event_date", "value_usd"])
+    return data.groupby(parse_event_dates(data["event_date"]))["value_usd"].sum()
+
+
+def daily_net_pnl(revenue_csv=DATA_PATHS["revenue"], payouts_csv=DATA_PATHS["payouts"],
+                  adspend_csv=DATA_PATHS["adspend"]):
+    """
+    Builds the daily revenue, payouts and ad spend series and the resulting net P&L.
+
+    Args:
+        revenue_csv (str): The path to the CSV file containing revenue data.
+        payouts_csv (str): The path to the CSV file containing payouts data.
+        adspend_csv (str): The path to the CSV file containing ad spend data.
+
+    Returns:
+        pd.DataFrame: One row per calendar day (days without data are zero) with the revenue, payouts, adspend and
+        net columns, where net = revenue - payouts - adspend.
+    """
+    daily = pd.concat({"revenue": _daily_totals(revenue_csv), "payouts": _daily_totals(payouts_csv),
+                       "adspend": _daily_totals(adspend_csv)}, axis=1)
+    calendar = pd.date_range(daily.index.min(), daily.index.max(), freq="D", name="event_date")
+    daily = daily.reindex(calendar).fillna(0.0)
+    daily["net"] = daily["revenue"] - daily["payouts"] - daily["adspend"]
+    return daily
+
+
+def daily_returns(net, initial_equity):
+    """
+    Converts a daily net P&L series into returns relative to the equity at the start of each day.
+
+    Args:
+        net (array-like): The daily net P&L.
+        initial_equity (float): The equity before the first day.
+
+    Returns:
+        numpy.ndarray: The daily returns; days that start with non-positive equity are dropped.
+    """
+    net = np.asarray(net, dtype=float)
+    equity_before = initial_equity + np.concatenate(([0.0], np.cumsum(net)[:-1]))
+    solvent = equity_before > 0
+    return net[solvent] / equity_before[solvent]
+
+
+def _event_parameters(returns, mask, n_days):
+    # Spacing range (in days) and size range of the tail events selected by mask. A path fires an event every
+    # interval days, with the interval drawn uniformly from the range, so the range is centred (in log terms) on the
+    # mean gap between tail days: 1 / interval then averages close to the empirical tail frequency. The extreme gaps
+    # would not do, as the smallest gap is usually 1 day, which fires an event on every step
+    sizes = np.abs(returns[mask])
+    if len(sizes) == 0:
+        return n_days, n_days, 0.0, 0.0
+    mean_gap = n_days / len(sizes)
+    interval_lower = max(int(round(mean_gap / TAIL_INTERVAL_SPREAD)), 1)
+    interval_upper = max(int(round(mean_gap * TAIL_INTERVAL_SPREAD)), interval_lower)
+    return interval_lower, interval_upper, float(sizes.min()), float(sizes.max())
+
+
+def calibrate_parameters(daily, initial_equity=None, number_of_trades=None, number_of_paths=50,
+                         tail_quantile=DEFAULT_TAIL_QUANTILE):
+    """
+    Derives the Monte Carlo parameters from the historical daily net P&L, treating every day as one trade.
+
+    The daily returns are split into a body and two tails. The body gives the win rate and the average win and loss
+    percentages; the upper tail gives the size and spacing range of sudden convex payoffs and the lower tail those of
+    sudden errors.
+
+    Args:
+        daily (pd.DataFrame): The output of ``daily_net_pnl``.
+        initial_equity (float, optional): The starting equity. Defaults to the total revenue of the history.
+        number_of_trades (int, optional): The number of steps per path. Defaults to the number of days.
+        number_of_paths (int): The number of paths to simulate.
+        tail_quantile (float): The share of days in each tail.
+
+    Returns:
+        tuple: The parameters in the order of ``monte_carlo_simulation.PARAMETER_NAMES``.
+    """
+    if initial_equity is None:
+        initial_equity = float(daily["revenue"].sum())
+    returns = daily_returns(daily["net"], initial_equity)
+    if number_of_trades is None:
+        number_of_trades = len(daily)
+
+    upper = (returns > 0) & (returns > np.quantile(returns, 1 - tail_quantile))
+    lower = (returns < 0) & (returns < np.quantile(returns, tail_quantile))
+    body = returns[~upper & ~lower]
+
+    wins = body[body > 0]
+    losses = body[body <= 0]
+    win_rate = len(wins) / len(body) if len(body) else 0.0
+    win_pct = float(wins.mean()) if len(wins) else 0.0
+    loss_pct = float(-losses.mean()) if len(losses) else 0.0
+
+    sudden_convex_interval_lower, sudden_convex_interval_upper, convex_payoff_lower, convex_payoff_upper = \
+        _event_parameters(returns, upper, len(returns))
+    sudden_error_interval_lower, sudden_error_interval_upper, sudden_error_lower, sudden_error_upper = \
+        _event_parameters(returns, lower, len(returns))
+
+    return initial_equity, loss_pct, win_pct, win_rate, number_of_trades, number_of_paths, \
+        sudden_error_interval_lower, sudden_error_interval_upper, sudden_error_upper, sudden_error_lower, \
+        sudden_convex_interval_lower, sudden_convex_interval_upper, convex_payoff_upper, convex_payoff_lower
+
+
+def block_bootstrap_paths(net, initial_equity, number_of_trades, number_of_paths, block_length=7, seed=None):
+    """
+    Simulates equity paths by resampling the historical daily net P&L in blocks.
+
+    A circular block bootstrap keeps the weekly seasonality and short-term autocorrelation of the history: each path
+    is a concatenation of blocks of ``block_length`` consecutive days starting at random days (wrapping around the end
+    of the history). All paths are drawn at once with a single index array. As in ``simulate_equity_curve``, the
+    first value of a path is the initial equity and a path stays at zero once it is ruined.
+
+    Args:
+        net (array-like): The historical daily net P&L.
+        initial_equity (float): The starting equity.
+        number_of_trades (int): The number of values per path, including the starting value.
+        number_of_paths (int): The number of paths.
+        block_length (int): The number of consecutive days in each block.
+        seed (int, optional): The random seed.
+
+    Returns:
+        numpy.ndarray: An array of shape (number_of_paths, number_of_trades) with the equity after each day.
+    """
+    net = np.asarray(net, dtype=float)
+    rng = np.random.default_rng(seed)
+    n_steps = number_of_trades - 1
+    n_blocks = -(-n_steps // block_length)
+
+    starts = rng.integers(0, len(net), size=(number_of_paths, n_blocks))
+    days = (starts[:, :, None] + np.arange(block_length)) % len(net)
+    pnl = net[days.reshape(number_of_paths, -1)[:, :n_steps]]
+
+    equity = np.empty((number_of_paths, number_of_trades))
+    equity[:, 0] = initial_equity
+    np.cumsum(pnl, axis=1, out=equity[:, 1:])
+    equity[:, 1:] += initial_equity
+
+    ruined = np.logical_or.accumulate(equity <= 0, axis=1)
+    equity[ruined] = 0.0
+    return equity
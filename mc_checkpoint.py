@@ -0,0 +1,153 @@
+import json
+import os
+
+import numpy as np
+
+from mc_engine import draw_layout, draw_uniforms, simulate_paths
+from path_store import PathStore
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_CHUNK_PATHS = 1 << 17
+
+
+def _chunk_path(checkpoint_dir, chunk_index):
+    return os.path.join(checkpoint_dir, f"chunk_{chunk_index:06d}.npz")
+
+
+def _write_atomically(path, write):
+    # Write to a temporary file and rename it, so a crash never leaves a half-written checkpoint behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def _save_manifest(checkpoint_dir, manifest):
+    path = os.path.join(checkpoint_dir, MANIFEST_NAME)
+    _write_atomically(path, lambda file: file.write(json.dumps(manifest, indent=2).encode()))
+
+
+def load_manifest(checkpoint_dir):
+    """
+    Reads the manifest of a checkpointed run.
+
+    Args:
+        checkpoint_dir (str): The checkpoint directory.
+
+    Returns:
+        dict: The manifest, or None if the directory has no checkpoint.
+    """
+    path = os.path.join(checkpoint_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def run_checkpointed(parameters, checkpoint_dir, chunk_paths=DEFAULT_CHUNK_PATHS, sampling="plain", seed=None,
+                     resume=True, keep_paths=None, use_numba=None):
+    """
+    Runs a large simulation in chunks of paths, saving every finished chunk to disk so the run can be resumed.
+
+    Each chunk stores the final equity and ruin step of its paths in its own .npz file; the first chunk also stores
+    up to ``keep_paths`` full paths for plotting. The manifest records the parameters, the chunk size and the random
+    state (the entropy of the root SeedSequence; chunk i draws from its i-th child), then the list of finished chunks.
+    Files are written to a temporary name and renamed, so a crash loses at most the chunk in progress. Resuming skips
+    the finished chunks and gives exactly the same result as an uninterrupted run.
+
+    Args:
+        parameters (tuple): The parameters in the order of ``monte_carlo_simulation.PARAMETER_NAMES``.
+        checkpoint_dir (str): The directory holding the manifest and the chunk files.
+        chunk_paths (int): The number of paths per chunk (a power of two for Sobol sampling).
+        sampling (str): The sampling method; see ``mc_engine.draw_uniforms``.
+        seed (int, optional): The random seed; ignored when resuming, as the manifest's random state is used.
+        resume (bool): Continue from an existing checkpoint instead of starting over.
+        keep_paths (int, optional): The number of full paths kept for plotting.
+        use_numba (bool, optional): Whether to use the Numba kernel; see ``mc_engine.simulate_paths``.
+
+    Returns:
+        PathStore: The merged results of all chunks; see ``load_checkpointed_results``.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    parameters = [float(value) if isinstance(value, float) else int(value) for value in parameters]
+    number_of_paths = parameters[5]
+    manifest = load_manifest(checkpoint_dir) if resume else None
+
+    if manifest is None:
+        manifest = {
+            "parameters": parameters,
+            "sampling": sampling,
+            "chunk_paths": chunk_paths,
+            "keep_paths": keep_paths,
+            "entropy": str(np.random.SeedSequence(seed).entropy),
+            "completed_chunks": [],
+        }
+        _save_manifest(checkpoint_dir, manifest)
+    else:
+        requested = {"parameters": parameters, "sampling": sampling, "chunk_paths": chunk_paths}
+        for key, value in requested.items():
+            if manifest[key] != value:
+                raise ValueError(f"The checkpoint in {checkpoint_dir} was made with {key}={manifest[key]!r}, "
+                                 f"not {value!r}")
+
+    layout = draw_layout(parameters)
+    dimensions = max(part.stop for part in layout.values())
+    root = np.random.SeedSequence(int(manifest["entropy"]))
+    n_chunks = -(-number_of_paths // chunk_paths)
+    completed = set(manifest["completed_chunks"])
+
+    for chunk_index in range(n_chunks):
+        if chunk_index in completed and os.path.exists(_chunk_path(checkpoint_dir, chunk_index)):
+            continue
+        size = min(chunk_paths, number_of_paths - chunk_index * chunk_paths)
+        chunk_seed = np.random.SeedSequence(root.entropy, spawn_key=(chunk_index,))
+        uniforms = draw_uniforms(size, dimensions, sampling, chunk_seed)
+        chunk_keep_paths = (manifest["keep_paths"] or 0) if chunk_index == 0 else 0
+        store = simulate_paths(parameters[:5] + [size] + parameters[6:], uniforms, keep_paths=chunk_keep_paths,
+                               use_numba=use_numba)
+
+        arrays = {"final_equity": store.final_equity, "ruin_index": store.ruin_index}
+        if chunk_keep_paths:
+            arrays["paths"] = store.to_array()
+        _write_atomically(_chunk_path(checkpoint_dir, chunk_index), lambda file: np.savez(file, **arrays))
+
+        completed.add(chunk_index)
+        manifest["completed_chunks"] = sorted(completed)
+        _save_manifest(checkpoint_dir, manifest)
+
+    return load_checkpointed_results(checkpoint_dir)
+
+
+def load_checkpointed_results(checkpoint_dir):
+    """
+    Merges the chunks of a checkpointed run into one PathStore.
+
+    Args:
+        checkpoint_dir (str): The checkpoint directory.
+
+    Returns:
+        PathStore: The final equity and ruin step of every finished path and the full paths kept by the first chunk.
+    """
+    manifest = load_manifest(checkpoint_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No checkpoint in {checkpoint_dir}")
+
+    final_equity = []
+    ruin_index = []
+    paths = np.empty((0, manifest["parameters"][4]))
+    for position, chunk_index in enumerate(manifest["completed_chunks"]):
+        # Reading an array from the archive copies it, so each file is closed before the next one is opened
+        with np.load(_chunk_path(checkpoint_dir, chunk_index)) as chunk:
+            final_equity.append(chunk["final_equity"])
+            ruin_index.append(chunk["ruin_index"])
+            if position == 0 and "paths" in chunk.files:
+                paths = chunk["paths"]
+    final_equity = np.concatenate(final_equity) if final_equity else np.empty(0)
+
+    store = PathStore(len(final_equity), manifest["parameters"][4], keep_paths=len(paths))
+    store.values[:] = paths
+    store.final_equity[:] = final_equity
+    store.ruin_index[:] = np.concatenate(ruin_index) if ruin_index else []
+    return store
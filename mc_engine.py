@@ -0,0 +1,281 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from path_store import PathStore
+
+try:
+    import numba
+    from numba import prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    prange = range
+    NUMBA_AVAILABLE = False
+
+SAMPLING_METHODS = ("plain", "antithetic", "stratified", "sobol")
+
+# Commissions or costs charged on every trade, as in simulate_equity_curve
+COMMISSIONS_OR_COSTS = -4
+
+
+def _max_events(number_of_trades, interval_lower):
+    # The most events a path can have: one every interval_lower trades
+    return (number_of_trades - 1) // max(interval_lower, 1)
+
+
+def draw_layout(parameters):
+    """
+    Describes how the uniform draws of one path are laid out, so that every random input has its own dimension.
+
+    Args:
+        parameters (tuple): The parameters in the order of ``monte_carlo_simulation.PARAMETER_NAMES``.
+
+    Returns:
+        dict: The column slice of each input: win (one per trade), error_interval and convex_interval (one per path),
+        convex_payoff and sudden_error (one per possible event).
+    """
+    number_of_trades = parameters[4]
+    sizes = {
+        "win": number_of_trades - 1,
+        "error_interval": 1,
+        "convex_interval": 1,
+        "convex_payoff": _max_events(number_of_trades, parameters[10]),
+        "sudden_error": _max_events(number_of_trades, parameters[6]),
+    }
+    layout = {}
+    start = 0
+    for name, size in sizes.items():
+        layout[name] = slice(start, start + size)
+        start += size
+    return layout
+
+
+def draw_uniforms(number_of_paths, dimensions, sampling="plain", seed=None):
+    """
+    Draws the uniform random numbers that drive a simulation, one row per path.
+
+    Args:
+        number_of_paths (int): The number of paths.
+        dimensions (int): The number of uniforms per path.
+        sampling (str): One of:
+            - "plain": independent pseudo-random uniforms.
+            - "antithetic": the second half of the paths mirrors the first (u and 1 - u).
+            - "stratified": Latin hypercube sampling; each dimension has exactly one draw per 1/n stratum.
+            - "sobol": a scrambled Sobol sequence (best with a power-of-two number of paths).
+        seed (int, optional): The random seed.
+
+    Returns:
+        numpy.ndarray: An array of shape (number_of_paths, dimensions) with values in [0, 1).
+    """
+    rng = np.random.default_rng(seed)
+    if sampling == "plain":
+        return rng.random((number_of_paths, dimensions))
+    if sampling == "antithetic":
+        half = rng.random((number_of_paths // 2, dimensions))
+        extra = rng.random((number_of_paths % 2, dimensions))
+        return np.concatenate([half, 1 - half, extra])
+    if sampling == "stratified":
+        strata = rng.permuted(np.tile(np.arange(number_of_paths), (dimensions, 1)), axis=1).T
+        return (strata + rng.random((number_of_paths, dimensions))) / number_of_paths
+    if sampling == "sobol":
+        return qmc.Sobol(d=dimensions, scramble=True, seed=rng).random(number_of_paths)
+    raise ValueError(f"Unknown sampling method: {sampling}")
+
+
+def _path_inputs(parameters, uniforms):
+    # Inverse transforms of the uniforms, matching random.randint and np.random.uniform
+    win_rate = parameters[3]
+    sudden_error_interval_lower, sudden_error_interval_upper, sudden_error_upper, sudden_error_lower, \
+        sudden_convex_interval_lower, sudden_convex_interval_upper, convex_payoff_upper, convex_payoff_lower \
+        = parameters[6:]
+    layout = draw_layout(parameters)
+
+    wins = uniforms[:, layout["win"]] < win_rate
+    error_interval = sudden_error_interval_lower + np.floor(
+        uniforms[:, layout["error_interval"]][:, 0] * (sudden_error_interval_upper - sudden_error_interval_lower + 1)
+    ).astype(np.int64)
+    convex_interval = sudden_convex_interval_lower + np.floor(
+        uniforms[:, layout["convex_interval"]][:, 0] * (sudden_convex_interval_upper - sudden_convex_interval_lower + 1)
+    ).astype(np.int64)
+    convex_payoff = convex_payoff_lower + uniforms[:, layout["convex_payoff"]] * (convex_payoff_upper
+                                                                                  - convex_payoff_lower)
+    sudden_error = sudden_error_upper + uniforms[:, layout["sudden_error"]] * (sudden_error_lower - sudden_error_upper)
+    return wins, error_interval, convex_interval, convex_payoff, sudden_error
+
+
+def _step_paths_numpy(initial_equity, loss_pct, win_pct, wins, error_interval, convex_interval, convex_payoff,
+                      sudden_error, keep_every, values, ruin_index, final_equity):
+    # Steps through the trades, updating all paths at once
+    number_of_paths, number_of_steps = wins.shape[0], wins.shape[1] + 1
+    paths = np.arange(number_of_paths)
+    n_kept = len(values)
+    equity = np.full(number_of_paths, float(initial_equity))
+    recorded = equity.copy()
+    alive = np.ones(number_of_paths, dtype=bool)
+    values[:, 0] = equity[:n_kept]
+
+    for i in range(1, number_of_steps):
+        step_return = np.where(wins[:, i - 1], equity * win_pct, -equity * loss_pct)
+        equity = np.where(alive, equity + step_return + COMMISSIONS_OR_COSTS, equity)
+        recorded = np.where(alive, equity, 0.0)
+
+        convex = alive & (i % convex_interval == 0)
+        if convex.any():
+            event = i // convex_interval[convex] - 1
+            equity[convex] += equity[convex] * convex_payoff[paths[convex], event]
+        error = alive & (i % error_interval == 0)
+        if error.any():
+            event = i // error_interval[error] - 1
+            equity[error] -= equity[error] * sudden_error[paths[error], event]
+
+        ruined = alive & (equity <= 0)
+        ruin_index[ruined] = i
+        if i % keep_every == 0:
+            values[:, i // keep_every] = recorded[:n_kept]
+        alive &= ~ruined
+
+    # The last recorded value is the final equity; paths ruined earlier end at zero
+    final_equity[:] = recorded
+
+
+def _path_kernel(initial_equity, loss_pct, win_pct, wins, error_interval, convex_interval, convex_payoff,
+                 sudden_error, keep_every, values, ruin_index, final_equity):
+    # Same arithmetic as _step_paths_numpy, one path at a time; compiled by Numba with the paths spread over threads
+    number_of_paths, number_of_steps = wins.shape[0], wins.shape[1] + 1
+    n_kept = values.shape[0]
+    for path in prange(number_of_paths):
+        equity = float(initial_equity)
+        recorded = equity
+        if path < n_kept:
+            values[path, 0] = equity
+        for i in range(1, number_of_steps):
+            if wins[path, i - 1]:
+                step_return = equity * win_pct
+            else:
+                step_return = -equity * loss_pct
+            equity = equity + step_return + COMMISSIONS_OR_COSTS
+            recorded = equity
+            if i % keep_every == 0 and path < n_kept:
+                values[path, i // keep_every] = recorded
+
+            if i % convex_interval[path] == 0:
+                equity += equity * convex_payoff[path, i // convex_interval[path] - 1]
+            if i % error_interval[path] == 0:
+                equity -= equity * sudden_error[path, i // error_interval[path] - 1]
+
+            if equity <= 0:
+                ruin_index[path] = i
+                if i < number_of_steps - 1:
+                    recorded = 0.0
+                break
+        final_equity[path] = recorded
+
+
+if NUMBA_AVAILABLE:
+    _path_kernel = numba.njit(parallel=True, cache=True)(_path_kernel)
+
+
+def simulate_paths(parameters, uniforms, dtype=np.float64, keep_every=1, keep_paths=None, use_numba=None):
+    """
+    Simulates all paths from pre-drawn uniforms.
+
+    The model is the one of ``simulate_equity_curve``: a win or loss per trade, a fixed cost per trade, and convex
+    payoffs and sudden errors at a random interval drawn once per path. Keeping the random draws separate from the
+    simulation makes variance reduction a matter of how the uniforms are drawn, and lets the NumPy and Numba kernels
+    give identical paths from the same draws.
+
+    Args:
+        parameters (tuple): The parameters in the order of ``monte_carlo_simulation.PARAMETER_NAMES``.
+        uniforms (numpy.ndarray): The output of ``draw_uniforms`` with ``draw_layout`` dimensions per path.
+        dtype (numpy.dtype): The dtype of the stored paths.
+        keep_every (int): Only store every k-th step of each path.
+        keep_paths (int, optional): Only store this many paths.
+        use_numba (bool, optional): Run the JIT-compiled per-path kernel, parallel over paths. Defaults to whether
+            Numba is installed; without Numba the vectorized NumPy kernel is used.
+
+    Returns:
+        PathStore: The simulated paths.
+    """
+    initial_equity, loss_pct, win_pct, _, number_of_trades = parameters[:5]
+    store = PathStore(len(uniforms), number_of_trades, dtype, keep_every, keep_paths)
+    if use_numba is None:
+        use_numba = NUMBA_AVAILABLE
+    if use_numba and not NUMBA_AVAILABLE:
+        raise ImportError("use_numba=True requires the numba package")
+
+    kernel = _path_kernel if use_numba else _step_paths_numpy
+    kernel(float(initial_equity), float(loss_pct), float(win_pct), *_path_inputs(parameters, uniforms), keep_every,
+           store.values, store.ruin_index, store.final_equity)
+    return store
+
+
+def run_vectorized_simulations(parameters, sampling="plain", seed=None, dtype=np.float64, keep_every=1,
+                               keep_paths=None, use_numba=None):
+    """
+    Draws the uniforms for ``parameters`` with the given sampling method and simulates all paths.
+
+    Args:
+        parameters (tuple): The parameters in the order of ``monte_carlo_simulation.PARAMETER_NAMES``.
+        sampling (str): The sampling method; see ``draw_uniforms``.
+        seed (int, optional): The random seed.
+        dtype (numpy.dtype): The dtype of the stored paths.
+        keep_every (int): Only store every k-th step of each path.
+        keep_paths (int, optional): Only store this many paths.
+        use_numba (bool, optional): Whether to use the Numba kernel; see ``simulate_paths``.
+
+    Returns:
+        PathStore: The simulated paths.
+    """
+    layout = draw_layout(parameters)
+    dimensions = max(part.stop for part in layout.values())
+    uniforms = draw_uniforms(parameters[5], dimensions, sampling, seed)
+    return simulate_paths(parameters, uniforms, dtype, keep_every, keep_paths, use_numba)
+
+
+def _end_statistics(final_equity, initial_equity):
+    # The estimates whose precision the convergence report tracks
+    return {
+        "avg_equity": final_equity.mean(),
+        "p_doubled": np.mean(final_equity >= 2 * initial_equity) * 100,
+        "std_dev": final_equity.std(),
+    }
+
+
+def convergence_report(parameters, path_counts=(256, 512, 1024, 2048, 4096), samplings=SAMPLING_METHODS,
+                       n_replications=20, seed=None):
+    """
+    Measures how the standard error of the end-of-path statistics falls with the number of paths for each sampling
+    method.
+
+    Every combination is simulated ``n_replications`` times with independent seeds, and the standard error is the
+    standard deviation of the statistic across the replications.
+
+    Args:
+        parameters (tuple): The parameters in the order of ``monte_carlo_simulation.PARAMETER_NAMES``.
+        path_counts (iterable of int): The numbers of paths to compare.
+        samplings (iterable of str): The sampling methods to compare.
+        n_replications (int): The number of independent runs per combination.
+        seed (int, optional): The random seed.
+
+    Returns:
+        pd.DataFrame: The mean and standard error of avg_equity, p_doubled and std_dev, indexed by sampling method and
+        number of paths.
+    """
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(samplings) * len(path_counts) * n_replications))
+    rows = {}
+    for sampling in samplings:
+        for number_of_paths in path_counts:
+            run_parameters = tuple(parameters[:5]) + (number_of_paths,) + tuple(parameters[6:])
+            runs = pd.DataFrame([
+                _end_statistics(run_vectorized_simulations(run_parameters, sampling, next(seeds)).final_equity,
+                                parameters[0])
+                for _ in range(n_replications)
+            ])
+            row = {}
+            for statistic in runs.columns:
+                row[f"{statistic}_mean"] = runs[statistic].mean()
+                row[f"{statistic}_se"] = runs[statistic].std(ddof=1)
+            rows[(sampling, number_of_paths)] = row
+    report = pd.DataFrame.from_dict(rows, orient="index")
+    report.index.names = ["sampling", "paths"]
+    return report
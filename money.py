@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+MICROS_PER_USD = 1_000_000
+
+# The column holding USD values as floats, and the column holding them as int64 micro-dollars
+USD_COLUMN = "value_usd"
+MICROS_COLUMN = "value_micros"
+
+
+def to_micros(values, allow_missing=False):
+    """
+    Converts USD amounts to int64 micro-dollars, rounding to the nearest micro-dollar.
+
+    Amounts are exact for anything below about 9 billion USD, where float64 still resolves a micro-dollar.
+
+    Args:
+        values (array-like): USD amounts as floats or numeric strings, including scientific notation.
+        allow_missing (bool): Return missing and non-finite amounts as <NA> in a nullable Int64 array instead of
+            raising a ValueError.
+
+    Returns:
+        numpy.ndarray or pd.arrays.IntegerArray: The amounts as int64 micro-dollars; an Int64 array with
+        ``allow_missing``.
+    """
+    values = pd.to_numeric(pd.Series(np.asarray(values)), errors="raise").to_numpy(dtype=float)
+    finite = np.isfinite(values)
+    if allow_missing:
+        micros = np.rint(np.where(finite, values, 0.0) * MICROS_PER_USD).astype(np.int64)
+        return pd.arrays.IntegerArray(micros, ~finite)
+    if not finite.all():
+        raise ValueError("Missing or non-finite USD amounts cannot be stored as micro-dollars")
+    return np.rint(values * MICROS_PER_USD).astype(np.int64)
+
+
+def to_usd(micros):
+    """
+    Converts micro-dollars back to float USD, e.g. for plotting or ratios.
+
+    Args:
+        micros (array-like or int): Micro-dollar amounts; Series and arrays keep their type.
+
+    Returns:
+        The amounts in USD, as floats.
+    """
+    if isinstance(micros, (list, tuple)):
+        micros = np.asarray(micros)
+    return micros / MICROS_PER_USD
+
+
+def sum_micros(micros):
+    """
+    Sums micro-dollars exactly with an integer reduction.
+
+    Missing amounts (<NA>, or NaN once a CSV reader has read the column as floats) are skipped, as pandas skips them in
+    a float sum. An int64 sum holds about 9.2 trillion USD before it overflows.
+
+    Args:
+        micros (array-like): Micro-dollar amounts.
+
+    Returns:
+        int: The total in micro-dollars.
+    """
+    if isinstance(micros, pd.Series):
+        micros = micros.dropna().to_numpy()
+    micros = np.asarray(micros)
+    if micros.dtype.kind == "f":
+        micros = micros[~np.isnan(micros)]
+    return int(micros.astype(np.int64).sum())
+
+
+def total_usd(data):
+    """
+    Totals the money column of a DataFrame, ColumnStore or ChunkedCSV.
+
+    Data with a value_micros column is summed exactly with ``sum_micros`` and converted once; float data is summed as
+    it is. Missing amounts are skipped in both cases, as pandas does. Only the USD totals go through here (total revenue and payouts, the holistic KPIs, the daily rollups and
+    the per-app ad spend split); averages, breakdowns and charts still use the float value_usd column.
+
+    Args:
+        data: The data, with either a value_micros or a value_usd column.
+
+    Returns:
+        float: The total in USD.
+    """
+    if MICROS_COLUMN in data.columns:
+        if hasattr(data, "chunks"):
+            # A ChunkedCSV is summed chunk by chunk
+            return to_usd(sum(sum_micros(chunk[MICROS_COLUMN]) for chunk in data.chunks([MICROS_COLUMN])))
+        return to_usd(sum_micros(data[MICROS_COLUMN]))
+    values = data[USD_COLUMN]
+    if isinstance(values, np.ndarray):
+        # A ColumnStore column is a raw array, where a missing amount is NaN and would make a plain sum NaN
+        return float(np.nansum(values))
+    return values.sum()
+
+
+def format_usd(micros, decimals=6):
+    """
+    Formats micro-dollar amounts as fixed-point strings with integer arithmetic, for reports only.
+
+    Args:
+        micros (array-like): Micro-dollar amounts.
+        decimals (int): The number of decimals, at most 6; amounts are rounded half away from zero.
+
+    Returns:
+        pd.Series: The formatted amounts, e.g. "-12.500000".
+    """
+    if not 0 <= decimals <= 6:
+        raise ValueError("decimals must be between 0 and 6")
+    micros = np.asarray(micros, dtype=np.int64)
+    step = 10 ** (6 - decimals)
+    units = (np.abs(micros) + step // 2) // step
+    whole, fraction = np.divmod(units, 10 ** decimals)
+    sign = pd.Series(np.where((micros < 0) & (units > 0), "-", ""))
+    formatted = sign + pd.Series(whole).astype(str)
+    if decimals:
+        formatted = formatted + "." + pd.Series(fraction).astype(str).str.zfill(decimals)
+    return formatted
@@ -1,7 +1,25 @@
 import numpy as np
 import random
-import matplotlib.pyplot as plt
 import time
+from matplotlib import cm
+from matplotlib.collections import LineCollection
+
+from figure_specs import FigureSpec, render_figures, show_figures
+from mc_calibration import block_bootstrap_paths, calibrate_parameters, daily_net_pnl
+from mc_checkpoint import run_checkpointed
+from mc_engine import run_vectorized_simulations
+from path_store import PathStore, final_equities, path_matrix
+from reporting import print_monte_carlo_report
+from results import MonteCarloResult
+
+# Above this many paths the equity curves are drawn as a fan chart instead of one line per path
+FAN_CHART_MIN_PATHS = 1000
+
+# Names of the values returned by initialize_parameters, in order
+PARAMETER_NAMES = ("initial_equity", "loss_pct", "win_pct", "win_rate", "number_of_trades", "number_of_paths",
+                   "sudden_error_interval_lower", "sudden_error_interval_upper", "sudden_error_upper",
+                   "sudden_error_lower", "sudden_convex_interval_lower", "sudden_convex_interval_upper",
+                   "convex_payoff_upper", "convex_payoff_lower")
 
 
 def initialize_parameters():
@@ -45,11 +63,6 @@ def initialize_parameters():
     convex_payoff_upper = 0.3
     convex_payoff_lower = 0.2
 
-    print(f"Stats\nrrr: ", win_pct * 100, " to ", loss_pct * 100, "\nwin rate: ", win_rate, "%", "\nTrades num:",
-          number_of_trades, "\nPaths/traders num: ", number_of_paths, "\n"f'Sudden error % (random range) from'
-                                                                      f' {sudden_error_lower * 100}'  f' to {sudden_error_upper * 100}\nSudden convex profit % (random range) from'
-                                                                      f' {convex_payoff_lower * 100} to {convex_payoff_upper * 100}\n')
-
     return initial_equity, loss_pct, win_pct, win_rate, number_of_trades, number_of_paths, \
         sudden_error_interval_lower, sudden_error_interval_upper, sudden_error_upper, sudden_error_lower, \
         sudden_convex_interval_lower, sudden_convex_interval_upper, convex_payoff_upper, convex_payoff_lower
@@ -71,6 +84,18 @@ def simulate_equity_curve(initial_equity, loss_pct, win_pct, win_rate, n_simulat
         equity_array (numpy.ndarray): Array of equity values after each simulated trade.
     """
     equity_array = np.zeros(n_simulations)
+    _simulate_path(equity_array, initial_equity, loss_pct, win_pct, win_rate,
+                   sudden_error_interval_lower, sudden_error_interval_upper, sudden_error_upper, sudden_error_lower,
+                   sudden_convex_interval_lower, sudden_convex_interval_upper, convex_payoff_upper, convex_payoff_lower)
+    return equity_array
+
+
+def _simulate_path(equity_array, initial_equity, loss_pct, win_pct, win_rate,
+                   sudden_error_interval_lower, sudden_error_interval_upper, sudden_error_upper, sudden_error_lower,
+                   sudden_convex_interval_lower, sudden_convex_interval_upper, convex_payoff_upper, convex_payoff_lower):
+    # Writes one path into equity_array (one entry per trade) and returns the step at which it was ruined, or -1.
+    # Entries after the ruin step are left untouched.
+    n_simulations = len(equity_array)
     equity_array[0] = initial_equity
     equity_counter = initial_equity
     commissions_or_costs = -4
@@ -111,28 +136,31 @@ def simulate_equity_curve(initial_equity, loss_pct, win_pct, win_rate, n_simulat
             equity_counter += sudden_loss
 
         if equity_counter <= 0:
-            break
+            return i
 
-    return equity_array
+    return -1
 
 
 def run_simulations(initial_equity, loss_pct, win_pct, win_rate, number_of_trades, number_of_paths,
                     sudden_error_interval_lower, sudden_error_interval_upper,
                     sudden_error_upper, sudden_error_lower,
                     sudden_convex_interval_lower, sudden_convex_interval_upper,
-                    convex_payoff_upper, convex_payoff_lower):
+                    convex_payoff_upper, convex_payoff_lower, dtype=np.float64, keep_every=1, keep_paths=None):
     # This function takes several parameters to simulate multiple equity curves for a given set of trading parameters.
-    # It returns a list of equity curves of length number_of_trades for each path.
+    # It returns a PathStore holding the equity curves (of length number_of_trades) of the paths; dtype, keep_every
+    # and keep_paths control how much of each path is kept.
 
-    all_paths_results = []
+    all_paths_results = PathStore(number_of_paths, number_of_trades, dtype, keep_every, keep_paths)
 
+    # Every path is simulated into the same full-resolution buffer before it is stored
+    equity_buffer = np.empty(number_of_trades)
     for i in range(number_of_paths):
-        result = simulate_equity_curve(initial_equity, loss_pct, win_pct, win_rate, number_of_trades,
-                                       sudden_error_interval_lower, sudden_error_interval_upper,
-                                       sudden_error_upper, sudden_error_lower,
-                                       sudden_convex_interval_lower, sudden_convex_interval_upper,
-                                       convex_payoff_upper, convex_payoff_lower)
-        all_paths_results.append(result)
+        ruin_index = _simulate_path(equity_buffer, initial_equity, loss_pct, win_pct, win_rate,
+                                    sudden_error_interval_lower, sudden_error_interval_upper,
+                                    sudden_error_upper, sudden_error_lower,
+                                    sudden_convex_interval_lower, sudden_convex_interval_upper,
+                                    convex_payoff_upper, convex_payoff_lower)
+        all_paths_results.record(i, equity_buffer, ruin_index)
 
     return all_paths_results
 
@@ -143,74 +171,149 @@ def calculate_stats(all_paths_results, initial_equity, loss_pct, win_pct, win_ra
     # and average equity, percentage above/below average equity, percentage of simulations that double
     # the initial equity, and the standard deviation of equity variation from the average.
 
-    min_equity = np.min([result[-1] for result in all_paths_results])
-    max_equity = np.max([result[-1] for result in all_paths_results])
-    avg_equity = np.average([result[-1] for result in all_paths_results])
+    end_results = final_equities(all_paths_results)
+    min_equity = np.min(end_results)
+    max_equity = np.max(end_results)
+    avg_equity = np.average(end_results)
 
-    n_above_avg = np.count_nonzero([result[-1] > avg_equity for result in all_paths_results])
+    n_above_avg = np.count_nonzero(end_results > avg_equity)
     p_above_avg = round(n_above_avg / number_of_paths * 100, 2)
     p_below_avg = 100 - p_above_avg
 
-    n_doubled = 0
-    for result in all_paths_results:
-        final_equity = result[-1]
-        if final_equity >= 2 * initial_equity:
-            n_doubled += 1
+    n_doubled = np.count_nonzero(end_results >= 2 * initial_equity)
     p_doubled = round((n_doubled / number_of_paths) * 100, 2)
 
-    variation_from_avg = [result[-1] - avg_equity for result in all_paths_results]
+    variation_from_avg = end_results - avg_equity
     std_dev = np.std(variation_from_avg)
     std_dev_round = round(std_dev, 2)
 
     return min_equity, max_equity, avg_equity, p_above_avg, p_below_avg, p_doubled, std_dev_round
 
 
-def plot_equity_curves(all_paths_results, min_equity, max_equity, avg_equity, number_of_trades, number_of_paths):
+def _draw_equity_markers(ax, min_equity, max_equity, avg_equity, number_of_trades):
+    # Lines and labels for the minimum, maximum and average final equity
+    ax.plot([0, number_of_trades - 1], [max_equity, max_equity], color='green', label="max")
+    ax.plot([0, number_of_trades - 1], [avg_equity, avg_equity], color='blue', label="avg")
+    ax.plot([0, number_of_trades - 1], [min_equity, min_equity], color='red', label="min")
+
+    ax.text(0, min_equity, f'${min_equity:.0f}', fontsize="13")
+    ax.text(0, max_equity, f'${max_equity:.0f}', fontsize="13")
+    ax.text(0, avg_equity, f'${avg_equity:.0f}', fontsize="13")
+    ax.set_ylabel("$$$")
+    ax.set_xlabel("Num of simulations")
+
+
+def draw_equity_curves(fig, equity_paths, min_equity, max_equity, avg_equity, number_of_trades, number_of_paths):
     # This function plots the equity curves for multiple simulations and adds markers for the minimum, maximum,
     # and average equity. It also displays the values of the minimum, maximum, and average equity.
+    ax = fig.subplots()
+    for i, path in enumerate(equity_paths["paths"]):
+        ax.plot(equity_paths["steps"], path, color=cm.cool(i / number_of_paths), label="")
 
-    plt.figure(figsize=(12, 8))
-    for i in range(number_of_paths):
-        plt.plot(all_paths_results[i], color=plt.cm.cool(i / number_of_paths), label="")
+    _draw_equity_markers(ax, min_equity, max_equity, avg_equity, number_of_trades)
+    ax.set_title("JustDice Monte Carlo Simulation")
 
-    plt.plot([0, number_of_trades - 1], [max_equity, max_equity], color='green', label="max")
-    plt.plot([0, number_of_trades - 1], [avg_equity, avg_equity], color='blue', label="avg")
-    plt.plot([0, number_of_trades - 1], [min_equity, min_equity], color='red', label="min")
 
-    plt.text(0, min_equity, f'${min_equity:.0f}', fontsize="13")
-    plt.text(0, max_equity, f'${max_equity:.0f}', fontsize="13")
-    plt.text(0, avg_equity, f'${avg_equity:.0f}', fontsize="13")
+def draw_equity_fan_chart(fig, fan, percentiles, min_equity, max_equity, avg_equity, number_of_trades,
+                          number_of_paths):
+    """
+    Draws the equity paths as a fan chart, as a ``figure_specs.FigureSpec`` draw function.
+
+    The sampled paths are drawn as a single LineCollection, so the number of artists (and the rendering time) does not
+    grow with the number of paths.
 
-    plt.title("JustDice Monte Carlo Simulation")
-    plt.ylabel("$$$")
-    plt.xlabel("Num of simulations")
-    plt.savefig('Monte Carlo Simu paths.png', dpi=600, bbox_inches='tight')
-    plt.show()
+    Args:
+        fig (matplotlib.figure.Figure): The empty figure.
+        fan (dict): The step numbers ("steps"), the percentile bands ("bands", one row per percentile) and the
+            sampled paths ("sample_paths"), from ``monte_carlo_figure_specs``.
+        percentiles (tuple): The percentiles of the bands.
+        min_equity (float): The minimum final equity.
+        max_equity (float): The maximum final equity.
+        avg_equity (float): The average final equity.
+        number_of_trades (int): The number of trades per path.
+        number_of_paths (int): The number of paths the bands were computed from.
+    """
+    steps, bands, sample_paths = fan["steps"], fan["bands"], fan["sample_paths"]
+    ax = fig.subplots()
+    n_bands = len(percentiles) // 2
+    for i in range(n_bands):
+        ax.fill_between(steps, bands[i], bands[-i - 1], color="tab:blue", alpha=0.15 + 0.2 * i, linewidth=0,
+                        label=f"{percentiles[i]}th-{percentiles[-i - 1]}th percentile")
+    if len(percentiles) % 2:
+        ax.plot(steps, bands[n_bands], color="tab:blue", label=f"{percentiles[n_bands]}th percentile")
+
+    segments = np.stack([np.broadcast_to(steps, sample_paths.shape), sample_paths], axis=-1)
+    ax.add_collection(LineCollection(segments, colors=cm.cool(np.linspace(0, 1, len(sample_paths))), linewidths=0.5,
+                                     alpha=0.6))
+
+    _draw_equity_markers(ax, min_equity, max_equity, avg_equity, number_of_trades)
+    ax.set_title(f"JustDice Monte Carlo Simulation ({number_of_paths} paths)")
+    ax.legend(loc="upper left")
+
+
+def draw_histogram(fig, end_results):
+    ax = fig.subplots()
+    ax.hist(end_results, bins=150)
+    ax.set_xlabel("$$$")
+    ax.set_ylabel("Number of companies/traders")
+    ax.set_title("Histogram of End Results")
+
+
+def monte_carlo_figure_specs(all_paths_results, min_equity, max_equity, avg_equity, number_of_trades,
+                             number_of_paths, percentiles=(5, 25, 50, 75, 95), n_sample_paths=50, seed=None):
+    """
+    Declares the Monte Carlo charts for ``figure_specs.render_figures``.
 
+    Above ``FAN_CHART_MIN_PATHS`` paths the equity curves are drawn as a fan chart: percentile bands over all paths,
+    computed here with one vectorized ``np.percentile`` over the path matrix, plus a random sample of individual
+    paths. The specs then hold the bands and the sample rather than every path.
 
-def plot_histogram(all_paths_results, number_of_paths):
-    end_results = [result[-1] for result in all_paths_results]
+    Args:
+        all_paths_results (PathStore, numpy.ndarray or list): The simulated paths.
+        min_equity (float): The minimum final equity.
+        max_equity (float): The maximum final equity.
+        avg_equity (float): The average final equity.
+        number_of_trades (int): The number of trades per path.
+        number_of_paths (int): The number of simulated paths.
+        percentiles (tuple): Symmetric percentiles; each outer pair is a band and the middle one is drawn as a line.
+        n_sample_paths (int): The number of individual paths drawn on top of the bands.
+        seed (int, optional): The random seed for choosing the sampled paths.
 
-    plt.figure(figsize=(12, 8))
-    plt.hist(end_results, bins=150)
-    plt.xlabel("$$$")
-    plt.ylabel("Number of companies/traders")
-    plt.title("Histogram of End Results")
-    plt.savefig('Monte Carlo Simu Histogram of End Results.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    Returns:
+        list of FigureSpec: The equity chart and the histogram of the final equities.
+    """
+    # A PathStore may keep fewer paths and only every k-th step
+    steps, paths = path_matrix(all_paths_results)
+    markers = {"min_equity": min_equity, "max_equity": max_equity, "avg_equity": avg_equity,
+               "number_of_trades": number_of_trades}
+    if number_of_paths > FAN_CHART_MIN_PATHS:
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(paths), size=min(n_sample_paths, len(paths)), replace=False)
+        fan = {"steps": steps, "bands": np.percentile(paths, percentiles, axis=0), "sample_paths": paths[sample]}
+        equity_chart = FigureSpec('Monte Carlo Simu fan chart.png', draw_equity_fan_chart, fan,
+                                  dict(markers, percentiles=tuple(percentiles), number_of_paths=len(paths)),
+                                  figsize=(12, 8))
+    else:
+        equity_chart = FigureSpec('Monte Carlo Simu paths.png', draw_equity_curves, {"steps": steps, "paths": paths},
+                                  dict(markers, number_of_paths=number_of_paths), figsize=(12, 8), dpi=600)
+
+    return [equity_chart,
+            FigureSpec('Monte Carlo Simu Histogram of End Results.png', draw_histogram,
+                       final_equities(all_paths_results), figsize=(12, 8))]
 
 
 def calc_min_max_avg_equity(all_paths_results):
-    min_equity = np.min([result[-1] for result in all_paths_results])
-    max_equity = np.max([result[-1] for result in all_paths_results])
-    avg_equity = np.average([result[-1] for result in all_paths_results])
+    end_results = final_equities(all_paths_results)
+    min_equity = np.min(end_results)
+    max_equity = np.max(end_results)
+    avg_equity = np.average(end_results)
 
     return round(min_equity, 2), round(avg_equity, 2), round(max_equity, 2)
 
 
 def calc_probabilities(all_paths_results, avg_equity, n_paths):
     # thsi function calculates the probabilities of being above below average
-    n_above_avg = np.count_nonzero([result[-1] > avg_equity for result in all_paths_results])
+    n_above_avg = np.count_nonzero(final_equities(all_paths_results) > avg_equity)
     p_above_avg = round(n_above_avg / n_paths * 100, 2)
     p_below_avg = 100 - p_above_avg
 
@@ -220,63 +323,103 @@ def calc_probabilities(all_paths_results, avg_equity, n_paths):
 def calc_probability_doubling(all_paths_results, initial_equity, n_paths):
     # this function calculates the probability of doubling the initial equity
 
-    n_doubled = 0
-    for result in all_paths_results:
-        final_equity = result[-1]
-        if final_equity >= 2 * initial_equity:
-            n_doubled += 1
+    n_doubled = np.count_nonzero(final_equities(all_paths_results) >= 2 * initial_equity)
     p_doubled = round((n_doubled / n_paths) * 100, 2)
 
     return p_doubled
 
 
 def calc_std_dev_from_avg(all_paths_results, avg_equity):
-    variation_from_avg = [result[-1] - avg_equity for result in all_paths_results]
+    variation_from_avg = final_equities(all_paths_results) - avg_equity
     std_dev = np.std(variation_from_avg)
     std_dev_round = round(std_dev, 2)
 
     return std_dev_round
 
 
-def monte_carlo_main():
+def monte_carlo_main(make_plots=True, source="constants", block_length=7, seed=None, dtype=np.float64, keep_every=1,
+                     keep_paths=None, sampling=None, checkpoint_dir=None):
+    """
+    Runs the Monte Carlo simulation without printing anything.
+
+    Args:
+        make_plots (bool): Whether to render and save the figures.
+        source (str): Where the simulation inputs come from:
+            - "constants": the hand-set parameters of ``initialize_parameters``.
+            - "calibrated": parameters derived from the daily revenue, payouts and ad spend data.
+            - "bootstrap": paths resampled in blocks from the historical daily net P&L.
+        block_length (int): The block length in days for the "bootstrap" source.
+        seed (int, optional): The random seed for the "bootstrap" source and the vectorized engine.
+        dtype (numpy.dtype): The dtype of the stored paths, e.g. np.float32 to halve their memory.
+        keep_every (int): Only store every k-th step of each path.
+        keep_paths (int, optional): Only store this many paths (e.g. for plotting); statistics use all paths.
+        sampling (str, optional): Simulate all paths at once with ``mc_engine`` using this sampling method ("plain",
+            "antithetic", "stratified" or "sobol") instead of path by path.
+        checkpoint_dir (str, optional): Run the engine in chunks saved to this directory, resuming a previous run
+            from its last finished chunk; see ``mc_checkpoint.run_checkpointed``.
+
+    Returns:
+        MonteCarloResult: The parameters, end-of-path statistics and figure specs.
+    """
     start_time = time.time()
 
+    daily = None
+    if source == "constants":
+        parameters = initialize_parameters()
+    elif source in ("calibrated", "bootstrap"):
+        daily = daily_net_pnl()
+        parameters = calibrate_parameters(daily)
+    else:
+        raise ValueError(f"Unknown source: {source}")
     initial_equity, loss_pct, win_pct, win_rate, number_of_trades, number_of_paths, \
         sudden_error_interval_lower, sudden_error_interval_upper, sudden_error_upper, sudden_error_lower, \
         sudden_convex_interval_lower, sudden_convex_interval_upper, convex_payoff_upper, convex_payoff_lower \
-        = initialize_parameters()
-
-    all_paths_results = run_simulations(initial_equity, loss_pct, win_pct, win_rate, number_of_trades,
-                                        number_of_paths, sudden_error_interval_lower, sudden_error_interval_upper,
-                                        sudden_error_upper, sudden_error_lower, sudden_convex_interval_lower,
-                                        sudden_convex_interval_upper, convex_payoff_upper, convex_payoff_lower)
+        = parameters
+
+    if source == "bootstrap":
+        all_paths_results = block_bootstrap_paths(daily["net"], initial_equity, number_of_trades, number_of_paths,
+                                                  block_length, seed)
+    elif checkpoint_dir is not None:
+        # Only the final equities are merged from disk, plus a sample of full paths for the plots
+        all_paths_results = run_checkpointed(parameters, checkpoint_dir, sampling=sampling or "plain", seed=seed,
+                                             keep_paths=keep_paths if keep_paths is not None else 1000)
+    elif sampling is not None:
+        all_paths_results = run_vectorized_simulations(parameters, sampling, seed, dtype, keep_every, keep_paths)
+    else:
+        all_paths_results = run_simulations(initial_equity, loss_pct, win_pct, win_rate, number_of_trades,
+                                            number_of_paths, sudden_error_interval_lower, sudden_error_interval_upper,
+                                            sudden_error_upper, sudden_error_lower, sudden_convex_interval_lower,
+                                            sudden_convex_interval_upper, convex_payoff_upper, convex_payoff_lower,
+                                            dtype, keep_every, keep_paths)
 
     min_equity, max_equity, avg_equity, p_above_avg, p_below_avg, p_doubled, std_dev_round \
         = calculate_stats(all_paths_results, initial_equity, loss_pct, win_pct, win_rate, number_of_trades,
                           number_of_paths)
 
-    plot_equity_curves(all_paths_results, min_equity, max_equity, avg_equity, number_of_trades, number_of_paths)
-
-    plot_histogram(all_paths_results, number_of_paths)
+    # Render the charts whose saved PNG is out of date; the result holds their specs, not drawn figures
+    figures = []
+    if make_plots:
+        figures = monte_carlo_figure_specs(all_paths_results, min_equity, max_equity, avg_equity, number_of_trades,
+                                           number_of_paths)
+        render_figures(figures)
 
     min_equity, avg_equity, max_equity = calc_min_max_avg_equity(all_paths_results)
-    print("Min equity:", min_equity, "\nAvg equity:", avg_equity, "\nMax equity:", max_equity)
 
     p_above_avg, p_below_avg = calc_probabilities(all_paths_results, avg_equity, number_of_paths)
-    print("\nProbability of above avg equity:", p_above_avg, "%")
-    print("Probability of below avg equity:", p_below_avg, "%")
 
     p_doubled = calc_probability_doubling(all_paths_results, initial_equity, number_of_paths)
-    print("Probability of doubling initial equity:", p_doubled, "%")
+
+    std_dev_round = calc_std_dev_from_avg(all_paths_results, avg_equity)
 
     elapsed_time = time.time() - start_time
-    rounded_time = round(elapsed_time / 60, 2)
-    print("Computation time: ", rounded_time, "minutes")
 
-    std_dev_round = calc_std_dev_from_avg(all_paths_results, avg_equity)
-    print("σ: One standard deviation of variation from average equity:", std_dev_round)
+    return MonteCarloResult(parameters=dict(zip(PARAMETER_NAMES, parameters)), min_equity=min_equity,
+                            avg_equity=avg_equity, max_equity=max_equity, p_above_avg=p_above_avg,
+                            p_below_avg=p_below_avg, p_doubled=p_doubled, std_dev=std_dev_round,
+                            computation_time=elapsed_time, figures=figures)
 
 
 if __name__ == "__main__":
-    monte_carlo_main()
-
+    result = monte_carlo_main()
+    print_monte_carlo_report(result)
+    show_figures(result.figures)
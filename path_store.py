@@ -0,0 +1,101 @@
+import numpy as np
+
+
+class PathStore:
+    """
+    Preallocated storage for Monte Carlo equity paths.
+
+    All paths live in one 2-D array of a configurable dtype (float32 halves the memory of float64). A ruined path is
+    not padded with zeros: its ruin step is recorded and the rest of its row is never written. To shrink big runs
+    further, only every ``keep_every``-th step and only the first ``keep_paths`` paths can be kept; the final equity
+    of every path is always kept, in float64, so the end-of-path statistics do not depend on these options.
+
+    Iterating over the store yields the kept paths as arrays with zeros after the ruin step, like the arrays returned
+    by ``simulate_equity_curve``.
+    """
+
+    def __init__(self, number_of_paths, number_of_steps, dtype=np.float64, keep_every=1, keep_paths=None):
+        self.number_of_paths = number_of_paths
+        self.number_of_steps = number_of_steps
+        self.keep_every = keep_every
+        self.steps = np.arange(0, number_of_steps, keep_every)
+        n_kept = number_of_paths if keep_paths is None else min(keep_paths, number_of_paths)
+        self.values = np.empty((n_kept, len(self.steps)), dtype=dtype)
+        self.ruin_index = np.full(number_of_paths, -1, dtype=np.int64)
+        self.final_equity = np.zeros(number_of_paths)
+
+    def record(self, path_index, equity, ruin_index=-1):
+        """
+        Stores one simulated path.
+
+        Args:
+            path_index (int): The number of the path.
+            equity (numpy.ndarray): The full-resolution equity of the path; entries after ruin_index are ignored.
+            ruin_index (int): The step at which the path was ruined, or -1.
+        """
+        self.ruin_index[path_index] = ruin_index
+        # A path ruined before its last step ends at zero
+        ruined_early = 0 <= ruin_index < self.number_of_steps - 1
+        self.final_equity[path_index] = 0.0 if ruined_early else equity[self.number_of_steps - 1]
+        if path_index < len(self.values):
+            self.values[path_index] = equity[::self.keep_every]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, path_index):
+        path = self.values[path_index].copy()
+        ruin_index = self.ruin_index[path_index]
+        if ruin_index >= 0:
+            path[self.steps > ruin_index] = 0
+        return path
+
+    def __iter__(self):
+        for path_index in range(len(self)):
+            yield self[path_index]
+
+    def to_array(self):
+        """
+        Returns the kept paths as one 2-D array, with zeros after each ruin step.
+
+        Returns:
+            numpy.ndarray: An array of shape (number of kept paths, number of kept steps).
+        """
+        ruin_index = self.ruin_index[:len(self)]
+        after_ruin = (ruin_index[:, None] >= 0) & (self.steps[None, :] > ruin_index[:, None])
+        return np.where(after_ruin, 0, self.values)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.ruin_index.nbytes + self.final_equity.nbytes
+
+
+def final_equities(all_paths_results):
+    """
+    Returns the final equity of every path.
+
+    Args:
+        all_paths_results (PathStore, numpy.ndarray or list): The simulated paths.
+
+    Returns:
+        numpy.ndarray: The final equity of each path.
+    """
+    if isinstance(all_paths_results, PathStore):
+        return all_paths_results.final_equity
+    return np.array([result[-1] for result in all_paths_results])
+
+
+def path_matrix(all_paths_results):
+    """
+    Returns the simulated paths as one 2-D array and the trade number of each of its columns.
+
+    Args:
+        all_paths_results (PathStore, numpy.ndarray or list): The simulated paths.
+
+    Returns:
+        tuple: The step numbers (numpy.ndarray) and the paths (numpy.ndarray of shape (paths, steps)).
+    """
+    if isinstance(all_paths_results, PathStore):
+        return all_paths_results.steps, all_paths_results.to_array()
+    paths = np.asarray(all_paths_results)
+    return np.arange(paths.shape[1]), paths
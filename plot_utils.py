@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+OTHER_LABEL = "Other"
+
+# The white, black-edged box drawn around the installs bar labels
+LABEL_BOX = dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.2')
+
+
+def top_n_with_other(values, top_n=None, other_label=OTHER_LABEL):
+    """
+    Keeps the largest categories of a series and sums the rest into one "Other" category.
+
+    Args:
+        values (pd.Series): The value of each category, e.g. ad spend by client.
+        top_n (int, optional): The number of categories to keep. Defaults to keeping all of them.
+        other_label (str): The label of the category holding the rest.
+
+    Returns:
+        pd.Series: The top_n categories in descending order, followed by "Other" if any categories were folded into it.
+    """
+    values = values.sort_values(ascending=False)
+    if top_n is None or len(values) <= top_n:
+        return values
+    other = pd.Series([values.iloc[top_n:].sum()], index=[other_label])
+    top = values.iloc[:top_n]
+    # The ids become labels once "Other" is among them
+    top.index = top.index.astype(str)
+    return pd.concat([top, other]).rename(values.name).rename_axis(values.index.name)
+
+
+def share_labels(values, total, min_percentage=None, with_counts=False, label_last=False):
+    """
+    Formats the percentage of the total of each bar, optionally with its count, e.g. "1520, 12.3%".
+
+    Args:
+        values (array-like): The bar heights, in bar order.
+        total (float): The total the percentages refer to.
+        min_percentage (float, optional): Leave bars at or below this percentage unlabelled.
+        with_counts (bool): Prefix each label with the value.
+        label_last (bool): Always label the last bar, whatever its percentage.
+
+    Returns:
+        list of str: One label per bar; empty for unlabelled bars.
+    """
+    values = np.asarray(values, dtype=float)
+    percentages = values / total * 100
+    labels = [f"{value:.0f}, {percentage:.1f}%" if with_counts else f"{percentage:.1f}%"
+              for value, percentage in zip(values, percentages)]
+    if min_percentage is not None:
+        shown = percentages > min_percentage
+        if label_last and len(labels):
+            shown[-1] = True
+        labels = [label if show else "" for label, show in zip(labels, shown)]
+    return labels
+
+
+def label_bars(ax, labels, container=None, **kwargs):
+    """
+    Labels all bars of a bar chart with one ``ax.bar_label`` call instead of one ``ax.text`` per bar.
+
+    Args:
+        ax (matplotlib.axes.Axes): The axes holding the bar chart.
+        labels (list of str or callable): The label of each bar in bar order, or a function from a bar's height to its
+            label, which does not depend on the order the bars were drawn in.
+        container (matplotlib.container.BarContainer, optional): The bars. Defaults to the first bars of the axes.
+        **kwargs: Passed to ``ax.bar_label``, e.g. fontsize or bbox.
+
+    Returns:
+        list: The label annotations.
+    """
+    container = ax.containers[0] if container is None else container
+    if callable(labels):
+        labels = [labels(height) for height in container.datavalues]
+    kwargs.setdefault("padding", 3)
+    return ax.bar_label(container, labels=labels, **kwargs)
+
+
+# The percentiles of the categories at which the Pareto charts are drawn
+PARETO_PERCENTILES = np.arange(0, 101, 5)
+
+
+def pareto_points(values, from_zero=True, total=None):
+    """
+    Computes the cumulative percentage of the total at every 5th percentile of the categories, largest first.
+
+    Args:
+        values (array-like): The value of each category, e.g. installs by country, in any order.
+        from_zero (bool): Start the curve at 0% for the 0th percentile, rather than at the share of the largest
+            category.
+        total (float, optional): The total the percentages refer to. Defaults to the sum of the values.
+
+    Returns:
+        pd.Series: The cumulative percentage, indexed by ``PARETO_PERCENTILES``.
+    """
+    values = np.sort(np.asarray(values, dtype=float))[::-1]
+    cumulative_percentage = values.cumsum() / (values.sum() if total is None else total) * 100
+    if from_zero:
+        cumulative_percentage = np.insert(cumulative_percentage, 0, 0)
+    percentiles = np.linspace(0, 100, len(cumulative_percentage))
+    return pd.Series(np.interp(PARETO_PERCENTILES, percentiles, cumulative_percentage), index=PARETO_PERCENTILES)
+
+
+def draw_pareto(fig, points, title, xlabel, ylabel, tight=True):
+    """
+    Draws a Pareto curve computed by ``pareto_points``, as a ``figure_specs.FigureSpec`` draw function.
+
+    Args:
+        fig (matplotlib.figure.Figure): The empty figure.
+        points (pd.Series): The cumulative percentages, indexed by percentile.
+        title (str): The chart title.
+        xlabel (str): The x-axis label, e.g. "Percentile of Country".
+        ylabel (str): The y-axis label.
+        tight (bool): Apply a tight layout.
+    """
+    ax = fig.subplots()
+    ax.plot(points.index, points.to_numpy(), marker='o')
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.set_xticks(np.arange(0, 101, 10))
+    ax.set_yticks(np.arange(0, 101, 10))
+    ax.grid()
+    if tight:
+        fig.tight_layout()
@@ -0,0 +1,282 @@
+import asyncio
+import json
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from cohort_analysis import lookup_install_codes
+from date_dimension import day_numbers
+
+DATA_PATHS = {
+    "installs": "data/installs.csv",
+    "revenue": "data/revenue_converted.csv",
+    "adspend": "data/adspend_converted.csv",
+    "payouts": "data/payouts_converted.csv",
+}
+INSTALL_DIMENSIONS = ["country_id", "network_id", "app_id"]
+FILTER_DIMENSIONS = ["country_id", "network_id", "app_id", "client_id"]
+
+# Responses are cached per path and query string; the data never changes while the server runs
+MAX_CACHED_RESPONSES = 1024
+
+
+def load_store(paths=DATA_PATHS):
+    """
+    Loads the four datasets once and indexes them for fast filtered queries.
+
+    Installs are deduplicated on install_id (keeping the first row). Revenue and payouts rows are tagged with the
+    integer code and the country, network and app of their install, so they can be filtered by install dimensions
+    without a join at query time. Every dataset is sorted by event date, so a date range is a binary search and a
+    slice instead of a scan.
+
+    Args:
+        paths (dict): The CSV paths of the installs, revenue, adspend and payouts datasets.
+
+    Returns:
+        dict: The indexed datasets plus per-install lookups, shared read-only by all requests.
+    """
+    installs = pd.read_csv(paths["installs"]).drop_duplicates(subset="install_id", keep="first")
+    installs = installs.sort_values("install_id", kind="mergesort").reset_index(drop=True)
+    installs["install_code"] = np.arange(len(installs))
+    install_index = {"install_ids": installs["install_id"].to_numpy()}
+
+    store = {"n_installs": len(installs)}
+    for name in ["revenue", "payouts"]:
+        events = pd.read_csv(paths[name])
+        codes = lookup_install_codes(install_index, events["install_id"].to_numpy())
+        events["install_code"] = codes
+        for column in INSTALL_DIMENSIONS:
+            events[column] = installs[column].reindex(codes).to_numpy()
+        store[name] = events
+
+    # An install converts when its first revenue row in file order is positive, as in holistic_analysis
+    revenue = store["revenue"]
+    first_rows = revenue[revenue["install_code"] >= 0].drop_duplicates(subset="install_code", keep="first")
+    converted = np.zeros(len(installs), dtype=bool)
+    converted[first_rows["install_code"].to_numpy()] = first_rows["value_usd"].to_numpy() > 0
+    store["converted"] = converted
+
+    store["installs"] = installs
+    store["adspend"] = pd.read_csv(paths["adspend"])
+    for name in ["installs", "revenue", "payouts", "adspend"]:
+        frame = store[name]
+        frame["day"] = day_numbers(frame["event_date"])
+        store[name] = frame.sort_values("day", kind="mergesort").reset_index(drop=True)
+    return store
+
+
+def _slice_dates(frame, start_date=None, end_date=None):
+    # Binary search on the sorted day column
+    days = frame["day"].to_numpy()
+    start = 0 if start_date is None else np.searchsorted(days, day_numbers([start_date])[0], side="left")
+    end = len(days) if end_date is None else np.searchsorted(days, day_numbers([end_date])[0], side="right")
+    return frame.iloc[start:end]
+
+
+def _filter(frame, filters):
+    # Dimensions that the dataset does not have (e.g. app_id for adspend) are ignored
+    mask = np.ones(len(frame), dtype=bool)
+    for column, values in filters.items():
+        if column in frame.columns:
+            mask &= frame[column].isin(values).to_numpy()
+    return frame.loc[mask]
+
+
+def _events_of_installs(events, selected):
+    # Keep the events whose install is selected; events without an install (code -1) hit the trailing False
+    codes = events["install_code"].to_numpy()
+    return events.loc[np.append(selected, False)[codes]]
+
+
+def compute_kpis(store, filters, start_date=None, end_date=None):
+    """
+    Computes the holistic KPIs for the installs in a date range and slice.
+
+    Revenue and payouts are those of the selected installs; ad spend is filtered by its own event date and by
+    country and network (ad spend has no app_id, so an app filter does not narrow it).
+
+    Args:
+        store (dict): The output of ``load_store``.
+        filters (dict): Lists of accepted values keyed by dimension.
+        start_date (str, optional): The first install date, inclusive.
+        end_date (str, optional): The last install date, inclusive.
+
+    Returns:
+        dict: The installs count, ARPU, UAC, APPU, conversion rate, gross profit margin and risk-to-reward ratio.
+    """
+    installs = _filter(_slice_dates(store["installs"], start_date, end_date), filters)
+    selected = np.zeros(store["n_installs"], dtype=bool)
+    selected[installs["install_code"].to_numpy()] = True
+
+    revenue = _events_of_installs(store["revenue"], selected)
+    payouts = _events_of_installs(store["payouts"], selected)
+    adspend = _filter(_slice_dates(store["adspend"], start_date, end_date), filters)
+
+    n_installs = len(installs)
+    total_revenue = revenue["value_usd"].sum()
+    total_payout = payouts["value_usd"].sum()
+    total_ad_spend = adspend["value_usd"].sum()
+    revenue_users = revenue["install_code"].nunique()
+    payout_users = payouts["install_code"].nunique()
+
+    arpu = total_revenue / revenue_users if revenue_users else None
+    appu = total_payout / payout_users if payout_users else None
+    uac = total_ad_spend / n_installs if n_installs else None
+    return {
+        "installs": n_installs,
+        "average_revenue_per_user": arpu,
+        "user_acquisition_cost": uac,
+        "average_payout_per_user": appu,
+        "conversion_rate_pct": store["converted"][selected].sum() / n_installs * 100 if n_installs else None,
+        "profit_margin": (total_revenue - total_ad_spend - total_payout) / total_revenue if total_revenue else None,
+        "risk_to_reward": arpu / (appu + uac) if None not in (arpu, appu, uac) and appu + uac else None,
+    }
+
+
+def compute_aggregate(store, dataset, by, filters, start_date=None, end_date=None):
+    """
+    Sums value_usd (or counts installs) of a dataset grouped by one of its columns.
+
+    Args:
+        store (dict): The output of ``load_store``.
+        dataset (str): One of installs, revenue, payouts and adspend.
+        by (str): The column to group by, e.g. country_id or event_date.
+        filters (dict): Lists of accepted values keyed by dimension.
+        start_date (str, optional): The first event date, inclusive.
+        end_date (str, optional): The last event date, inclusive.
+
+    Returns:
+        dict: The aggregate value for each group, keyed by the group value as a string.
+    """
+    frame = _filter(_slice_dates(store[dataset], start_date, end_date), filters)
+    if dataset == "installs":
+        grouped = frame.groupby(by)["install_id"].count()
+    else:
+        grouped = frame.groupby(by)["value_usd"].sum()
+    return {str(key): value for key, value in grouped.items()}
+
+
+def compute_deciles(store, dataset, filters, start_date=None, end_date=None):
+    """
+    Splits install_ids into ten equal groups by their total value and reports each group's share.
+
+    As in revenue_analysis.decile_revenues, install_ids are sorted from the highest to the lowest value, so decile 1
+    holds the top 10%.
+
+    Args:
+        store (dict): The output of ``load_store``.
+        dataset (str): Either revenue or payouts.
+        filters (dict): Lists of accepted values keyed by dimension.
+        start_date (str, optional): The first event date, inclusive.
+        end_date (str, optional): The last event date, inclusive.
+
+    Returns:
+        list of dict: The decile number, value in USD and percentage of the total for each decile.
+    """
+    frame = _filter(_slice_dates(store[dataset], start_date, end_date), filters)
+    by_install_id = np.sort(frame.groupby("install_id")["value_usd"].sum().to_numpy())[::-1]
+    total = by_install_id.sum()
+    deciles = []
+    for i, part in enumerate(np.array_split(by_install_id, 10)):
+        value = part.sum()
+        deciles.append({"decile": i + 1, "value_usd": value, "percentage": value / total * 100 if total else None})
+    return deciles
+
+
+def _parse_query(query):
+    # Filters are comma separated lists, e.g. ?country_id=1,2&start_date=2022-01-01; a malformed one is a client error
+    filters = {}
+    for column in FILTER_DIMENSIONS:
+        if column in query:
+            try:
+                filters[column] = [int(value) for value in query[column].split(",")]
+            except ValueError:
+                raise web.HTTPBadRequest(text=f"{column} must be a comma separated list of integers, "
+                                              f"not {query[column]!r}")
+    return filters, query.get("start_date"), query.get("end_date")
+
+
+def _json_default(value):
+    # NumPy scalars are not JSON serializable by default
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def _respond(request, compute):
+    cache = request.app["cache"]
+    key = (request.path, tuple(sorted(request.query.items())))
+    if key not in cache:
+        # Run the computation in a worker thread so slow queries do not block the event loop
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(None, compute)
+        except (KeyError, ValueError) as error:
+            raise web.HTTPBadRequest(text=str(error))
+        if len(cache) >= MAX_CACHED_RESPONSES:
+            cache.clear()
+        cache[key] = json.dumps(result, default=_json_default)
+    return web.Response(text=cache[key], content_type="application/json")
+
+
+async def handle_kpis(request):
+    filters, start_date, end_date = _parse_query(request.query)
+    return await _respond(request, lambda: compute_kpis(request.app["store"], filters, start_date, end_date))
+
+
+async def handle_aggregates(request):
+    dataset = request.match_info["dataset"]
+    if dataset not in DATA_PATHS:
+        raise web.HTTPNotFound(text=f"Unknown dataset: {dataset}")
+    by = request.query.get("by", "event_date")
+    filters, start_date, end_date = _parse_query(request.query)
+    return await _respond(request, lambda: compute_aggregate(request.app["store"], dataset, by, filters,
+                                                             start_date, end_date))
+
+
+async def handle_deciles(request):
+    dataset = request.match_info["dataset"]
+    if dataset not in ("revenue", "payouts"):
+        raise web.HTTPNotFound(text=f"Deciles are available for revenue and payouts, not {dataset}")
+    filters, start_date, end_date = _parse_query(request.query)
+    return await _respond(request, lambda: compute_deciles(request.app["store"], dataset, filters,
+                                                           start_date, end_date))
+
+
+def create_app(store):
+    """
+    Creates the web application serving queries from an already loaded store.
+
+    Endpoints:
+        GET /kpis: The holistic KPIs.
+        GET /aggregates/{dataset}?by=<column>: Totals of installs, revenue, payouts or adspend per group.
+        GET /deciles/{dataset}: Decile contributions of revenue or payouts per install_id.
+
+    All endpoints accept start_date and end_date (YYYY-MM-DD) and comma separated country_id, network_id, app_id
+    and client_id filters.
+
+    Args:
+        store (dict): The output of ``load_store``.
+
+    Returns:
+        aiohttp.web.Application: The application.
+    """
+    app = web.Application()
+    app["store"] = store
+    app["cache"] = {}
+    app.add_routes([
+        web.get("/kpis", handle_kpis),
+        web.get("/aggregates/{dataset}", handle_aggregates),
+        web.get("/deciles/{dataset}", handle_deciles),
+    ])
+    return app
+
+
+def query_service_main(host="127.0.0.1", port=8080):
+    store = load_store()
+    web.run_app(create_app(store), host=host, port=port)
+
+
+if __name__ == "__main__":
+    query_service_main()
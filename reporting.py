@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+from money import format_usd, to_micros
+
+SEPARATOR = "______________________"
+
+
+def _format_total(total, decimals=6):
+    # USD totals are formatted from whole micro-dollars, so they print the same whichever way they were summed
+    if not np.isfinite(total):
+        return str(total)
+    return format_usd(to_micros([total]), decimals)[0]
+
+
+def print_temporal_scope(temporal_scope_info):
+    """
+    Prints the temporal scope dictionary returned by the ``get_*_temporal_scope`` functions.
+
+    Args:
+        temporal_scope_info (dict): The filename, first_date, last_date and temporal_scope of a data file.
+    """
+    print(f"File Path: {temporal_scope_info['filename']}")
+    print(f"First Date: {temporal_scope_info['first_date']}")
+    print(f"Last Date: {temporal_scope_info['last_date']}")
+    print(f"Temporal Scope: {temporal_scope_info['temporal_scope']} days")
+    print(SEPARATOR)
+
+
+def print_decile_revenues(decile_revenues, total_revenue):
+    """
+    Prints the revenue percentage for each decile.
+
+    Args:
+        decile_revenues (list): List of revenue for each decile.
+        total_revenue (float): Total revenue for the dataset.
+    """
+    for i, decile_revenue in enumerate(decile_revenues):
+        decile_percentage = (decile_revenue / total_revenue) * 100
+        print(f"Decile {i + 1}: {decile_revenue:.2f} USD ({decile_percentage:.2f}%)")
+    print(SEPARATOR)
+
+
+def print_revenue_report(result):
+    """
+    Prints the results of ``revenue_analysis.revenue_main``.
+
+    Args:
+        result (RevenueResult): The revenue results.
+    """
+    print_temporal_scope(result.temporal_scope)
+
+    print(f"The number of unique install_id: {result.unique_install_ids}")
+    print(SEPARATOR)
+    print(f"Total Revenue (USD):\n{_format_total(result.total_revenue, 2)}")
+    print(SEPARATOR)
+    print("Revenue central tendency:\n", result.central_tendency)
+    print(SEPARATOR)
+    print("Revenue by Date:\n", result.revenue_by_date, "Shape: ", result.revenue_by_date.shape)
+    print(SEPARATOR)
+    with pd.option_context("display.float_format", "{:.6f}".format):
+        print("Revenue by install_id:\n", result.revenue_by_install_id, "Shape: ",
+              result.revenue_by_install_id.shape)
+    print(SEPARATOR)
+    print("top_1_percent", result.top_1_percent)
+    print(SEPARATOR)
+
+    print_decile_revenues(result.decile_revenues, result.total_revenue)
+
+    print("Duplicate install_ids:\n", result.duplicate_install_ids, "Shape: ", result.duplicate_install_ids.shape)
+    print(SEPARATOR)
+
+    id_counts = result.install_id_counts
+    if not id_counts.empty:
+        print(f"The most repeated install_id: {id_counts.idxmax()} with {id_counts.max()} occurrences.")
+        print(f"The least repeated install_id: {id_counts.idxmin()} with {id_counts.min()} occurrences.")
+    print(SEPARATOR)
+
+
+def print_installs_report(result):
+    """
+    Prints the results of ``installs_analysis.installs_main``.
+
+    Args:
+        result (InstallsResult): The installs results.
+    """
+    print(f"\nTemporal scope of installs.csv: {result.first_date} - {result.last_date}")
+    print(f"\nUnique Install IDs: {result.unique_install_ids}\nTotal Install IDs: {result.total_install_ids}\n")
+    print("Duplicate Install IDs:\n", result.duplicate_install_ids["install_id"].values)
+    for column, unique_values in result.unique_values.items():
+        print(f"Number of unique {column}s:", len(unique_values))
+        print(f"List of unique {column}s:", unique_values)
+        print()
+
+
+def print_payouts_report(result):
+    """
+    Prints the results of ``payouts_analysis.payouts_main``.
+
+    Args:
+        result (PayoutsResult): The payouts results.
+    """
+    print(f"\nTemporal scope of payouts_converted.csv: {result.first_date} - {result.last_date}")
+    print(f"\nTotal Payouts (USD): {_format_total(result.total_payouts)}"
+          f"\nAverage Payout per Install: {result.average_payout_per_install}"
+          f"\nMaximum Payout: {result.max_payout}\nMinimum Payout: {result.min_payout}")
+    print(f"Shape of Data: {result.shape}\nNumber of All Install IDs: {result.num_all_install_ids}"
+          f"\nNumber of Unique Install IDs: {result.num_unique_install_ids}\n")
+    print(f"\nUnique Install IDs: {result.unique_install_ids}\nTotal Install IDs: {result.total_install_ids}")
+    print(f"Mean: {result.mean}\nMedian: {result.median}\nMode: {result.mode}")
+
+
+def print_adspend_report(result):
+    """
+    Prints the results of ``adspend_analysis.adspend_main``.
+
+    Args:
+        result (AdspendResult): The ad spend results.
+    """
+    print_temporal_scope(result.temporal_scope)
+    print("Total ad spend (USD):", _format_total(result.total_adspend))
+    print(SEPARATOR)
+    print("adspend_by_date:\n", result.adspend_by_date)
+    print(SEPARATOR)
+    print("adspend_by_client:\n", result.adspend_by_client, "\nShape:\n", result.adspend_by_client.shape)
+    print(SEPARATOR)
+    print("adspend_by_network:\n", result.adspend_by_network)
+    print(SEPARATOR)
+    print("adspend_by_country:\n", result.adspend_by_country)
+    print(SEPARATOR)
+    print("The percentage of ad spend for each client: ", result.adspend_percentage_by_client)
+
+
+def print_holistic_report(result):
+    """
+    Prints the results of ``holistic_analysis.holistic_main``.
+
+    Args:
+        result (HolisticResult): The holistic KPIs.
+    """
+    print('Average Revenue per User (ARPU): $', round(result.average_revenue_per_user, 2))
+    print('User Acquisition Cost (UAC/CPL): $', round(result.user_acquisition_cost, 2))
+    print('Average Payout per User (APPU): $', round(result.average_payout_per_user, 2))
+    print(f"Conversion Rate: {round(result.conversion_rate_pct, 2)}%")
+    print('Gross Profit Margin:', round(result.profit_margin, 2) * 100, "%")
+    print(f"Risk-to-Reward ratio: {result.risk_to_reward:.2f}:1")
+    if result.confidence_intervals is not None:
+        print(SEPARATOR)
+        print("Bootstrap confidence intervals:\n", result.confidence_intervals)
+
+
+def print_data_check_report(result):
+    """
+    Prints the results of ``data_check.data_check_main``.
+
+    Args:
+        result (DataCheckResult): The data check results.
+    """
+    for name, data_types_count in result.data_types_counts.items():
+        print(f"\n{name.capitalize()}: ")
+        for column, count in data_types_count.items():
+            print(f"{column}, {count}")
+
+    for name, report in result.quality_reports.items():
+        print(SEPARATOR)
+        print(f"{name.capitalize()} quality report ({report['rows']} rows):")
+        print(pd.DataFrame(report["columns"]).T.drop(columns="types"))
+        if "key" in report:
+            key = report["key"]
+            if "duplicates" in key:
+                print(f"{key['column']}: {key['distinct']} distinct, {key['duplicates']} duplicates")
+            else:
+                low, high = key["duplicates_range"]
+                print(f"{key['column']}: ~{key['approx_distinct']} distinct, ~{key['approx_duplicates']} duplicates "
+                      f"(95% range {low}-{high})")
+        if "value_out_of_range" in report:
+            flags = report["value_out_of_range"]
+            print(f"{flags['column']} outside {flags['range']}: {flags['count']} rows {flags['sample_rows']}")
+
+
+def print_monte_carlo_report(result):
+    """
+    Prints the results of ``monte_carlo_simulation.monte_carlo_main``.
+
+    Args:
+        result (MonteCarloResult): The Monte Carlo results.
+    """
+    p = result.parameters
+    print(f"Stats\nrrr: ", p["win_pct"] * 100, " to ", p["loss_pct"] * 100, "\nwin rate: ", p["win_rate"], "%",
+          "\nTrades num:", p["number_of_trades"], "\nPaths/traders num: ", p["number_of_paths"],
+          f"\nSudden error % (random range) from {p['sudden_error_lower'] * 100} to {p['sudden_error_upper'] * 100}"
+          f"\nSudden convex profit % (random range) from {p['convex_payoff_lower'] * 100}"
+          f" to {p['convex_payoff_upper'] * 100}\n")
+    print("Min equity:", result.min_equity, "\nAvg equity:", result.avg_equity, "\nMax equity:", result.max_equity)
+    print("\nProbability of above avg equity:", result.p_above_avg, "%")
+    print("Probability of below avg equity:", result.p_below_avg, "%")
+    print("Probability of doubling initial equity:", result.p_doubled, "%")
+    print("Computation time: ", round(result.computation_time / 60, 2), "minutes")
+    print("σ: One standard deviation of variation from average equity:", result.std_dev)
+
+
+def print_cohort_report(result):
+    """
+    Prints the results of ``cohort_analysis.cohort_main``.
+
+    Args:
+        result (CohortResult): The cohort LTV tables.
+    """
+    print("Cohort LTV by install date:\n", result.cohorts)
+    print(SEPARATOR)
+    print("Cohort LTV by install date and network:\n", result.cohorts_by_network)
+    print(SEPARATOR)
+
+
+def print_roas_report(result):
+    """
+    Prints the results of ``roas_cube.roas_main``.
+
+    Args:
+        result (RoasResult): The ROAS slices.
+    """
+    print("Overall:\n", result.overall)
+    print(SEPARATOR)
+    print("ROAS by network:\n", result.by_network)
+    print(SEPARATOR)
+    print("ROAS by country:\n", result.by_country)
+    print(SEPARATOR)
@@ -0,0 +1,124 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from figure_specs import FigureSpec
+
+
+@dataclass
+class DataCheckResult:
+    """The converted file paths, the per-column data type counts and the quality report of each checked CSV file."""
+    converted_paths: Dict[str, str]
+    data_types_counts: Dict[str, Dict[str, Dict[str, int]]]
+    quality_reports: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+@dataclass
+class HolisticResult:
+    """The portfolio-wide KPIs computed by ``holistic_main``."""
+    average_revenue_per_user: float
+    user_acquisition_cost: float
+    average_payout_per_user: float
+    conversion_rate_pct: float
+    profit_margin: float
+    risk_to_reward: float
+    figures: List[FigureSpec] = field(default_factory=list)
+    confidence_intervals: Optional[pd.DataFrame] = None
+
+
+@dataclass
+class AdspendResult:
+    """The ad spend aggregates computed by ``adspend_main``."""
+    temporal_scope: Dict[str, Any]
+    total_adspend: float
+    adspend_by_country: pd.Series
+    adspend_by_network: pd.Series
+    adspend_by_client: pd.Series
+    adspend_by_date: pd.Series
+    adspend_percentage_by_client: pd.Series
+    figures: List[FigureSpec] = field(default_factory=list)
+
+
+@dataclass
+class InstallsResult:
+    """The install counts and breakdowns computed by ``installs_main``."""
+    first_date: Any
+    last_date: Any
+    unique_install_ids: int
+    total_install_ids: int
+    duplicate_install_ids: pd.DataFrame
+    unique_values: Dict[str, Any]
+    installs_by: Dict[str, pd.Series]
+    figures: List[FigureSpec] = field(default_factory=list)
+
+
+@dataclass
+class PayoutsResult:
+    """The payout KPIs and aggregates computed by ``payouts_main``."""
+    first_date: Any
+    last_date: Any
+    total_payouts: float
+    average_payout_per_install: float
+    max_payout: float
+    min_payout: float
+    shape: tuple
+    num_all_install_ids: int
+    num_unique_install_ids: int
+    unique_install_ids: int
+    total_install_ids: int
+    mean: float
+    median: float
+    mode: float
+    daily_payouts: pd.DataFrame
+    decile_payouts: pd.DataFrame
+    top_decile_payouts: pd.DataFrame
+    figures: List[FigureSpec] = field(default_factory=list)
+
+
+@dataclass
+class RevenueResult:
+    """The revenue KPIs and aggregates computed by ``revenue_main``."""
+    temporal_scope: Dict[str, Any]
+    unique_install_ids: int
+    total_revenue: float
+    central_tendency: pd.Series
+    revenue_by_date: pd.Series
+    revenue_by_install_id: pd.Series
+    top_1_percent: pd.Series
+    decile_revenues: List[float]
+    duplicate_install_ids: pd.DataFrame
+    install_id_counts: pd.Series
+    top_10_percent_decile_revenues: List[float]
+    figures: List[FigureSpec] = field(default_factory=list)
+
+
+@dataclass
+class MonteCarloResult:
+    """The parameters and end-of-path statistics of a Monte Carlo run."""
+    parameters: Dict[str, Any]
+    min_equity: float
+    avg_equity: float
+    max_equity: float
+    p_above_avg: float
+    p_below_avg: float
+    p_doubled: float
+    std_dev: float
+    computation_time: float
+    figures: List[FigureSpec] = field(default_factory=list)
+
+
+@dataclass
+class CohortResult:
+    """The cohort LTV tables computed by ``cohort_main``."""
+    cohorts: pd.DataFrame
+    cohorts_by_network: pd.DataFrame
+
+
+@dataclass
+class RoasResult:
+    """The ROAS cube and the slices reported by ``roas_main``."""
+    cube: pd.DataFrame
+    overall: pd.DataFrame
+    by_network: pd.DataFrame
+    by_country: pd.DataFrame
@@ -1,6 +1,15 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+
+from chunked_backend import ChunkedCSV, is_chunked
+from date_dimension import parse_event_dates, temporal_scope
+from figure_specs import FigureSpec, render_figures, show_figures
+from hyperloglog import approx_nunique
+from money import total_usd
+from plot_utils import draw_pareto, label_bars, pareto_points
+from reporting import print_revenue_report
+from results import RevenueResult
+from time_series import build_daily_calendar, rolling_stats
 
 
 def get_revenue_temporal_scope(csv_file):
@@ -17,50 +26,51 @@ def get_revenue_temporal_scope(csv_file):
             - last_date (datetime): The latest date in the revenue data.
             - temporal_scope (int): The number of days between the earliest and latest dates, inclusive.
     """
-    df = pd.read_csv(csv_file)
-    date_col = [col for col in df.columns if 'date' in col.lower()][0]
-    first_date = pd.to_datetime(df[date_col]).min()
-    last_date = pd.to_datetime(df[date_col]).max()
-    temporal_scope = (last_date - first_date).days + 1
+    header = pd.read_csv(csv_file, nrows=0)
+    date_col = [col for col in header.columns if 'date' in col.lower()][0]
+    # Only the date column is needed, and it is parsed once
+    first_date, last_date, n_days = temporal_scope(pd.read_csv(csv_file, usecols=[date_col])[date_col])
     temporal_scope_info = {'filename': csv_file, 'first_date': first_date, 'last_date': last_date,
-                           'temporal_scope': temporal_scope}
-    print(f"File Path: {temporal_scope_info['filename']}")
-    print(f"First Date: {temporal_scope_info['first_date']}")
-    print(f"Last Date: {temporal_scope_info['last_date']}")
-    print(f"Temporal Scope: {temporal_scope_info['temporal_scope']} days")
-    print("______________________")
+                           'temporal_scope': n_days}
     return temporal_scope_info
 
 
-def read_and_explore(file_path):
+def read_and_explore(file_path, chunksize=None):
     """
-    Reads a revenue CSV file and explores its contents.
+    Reads a revenue CSV file.
+
+    When a chunk size is given, the file is not loaded; a ChunkedCSV is returned instead, on which totals,
+    revenue_by_date and revenue_by_install_id run as streaming passes with bounded memory.
 
     Args:
         file_path (str): The path to the CSV file.
+        chunksize (int, optional): The number of rows to process at a time.
 
     Returns:
-        pandas.DataFrame: A DataFrame containing the revenue data.
+        pandas.DataFrame or ChunkedCSV: The revenue data.
     """
+    if chunksize is not None:
+        revenue = ChunkedCSV(file_path, chunksize=chunksize, parse_dates=['event_date'])
+        return revenue
     revenue = pd.read_csv(file_path)
-    print("Explore revenue DF:", revenue, "Shape: ", revenue.shape)
-    print("______________________")
     return revenue
 
 
-def unique_install_id_count(revenue):
+def unique_install_id_count(revenue, approximate=False):
     """
     Count the number of unique install IDs in the revenue dataframe.
 
     Args:
         revenue (pandas.DataFrame): The revenue dataframe.
+        approximate (bool): Estimate the count with a HyperLogLog sketch (about 0.8% error) instead of an exact
+            hash set of all install IDs.
 
     Returns:
         int: The number of unique install IDs.
     """
+    if approximate:
+        return approx_nunique(revenue['install_id'])
     count = revenue['install_id'].nunique()
-    print(f"The number of unique install_id: {count}")
-    print("______________________")
     return count
 
 
@@ -74,7 +84,10 @@ def preprocess_data(revenue):
     Returns:
         pandas.DataFrame: The preprocessed revenue data as a Pandas DataFrame.
     """
-    revenue['event_date'] = pd.to_datetime(revenue['event_date'])
+    if is_chunked(revenue):
+        # Chunked sources parse event_date while streaming
+        return revenue
+    revenue['event_date'] = parse_event_dates(revenue['event_date'])
     return revenue
 
 
@@ -83,14 +96,13 @@ def total_revenue(revenue):
     Computes the total revenue in USD from the given revenue data.
 
     Args:
-        revenue (pd.DataFrame): A pandas DataFrame containing the revenue data.
+        revenue (pd.DataFrame or ColumnStore): The revenue data. A ColumnStore (see ``column_store.load_columns``)
+            only maps the value_usd column instead of parsing the whole CSV file.
 
     Returns:
-        float: The total revenue in USD.
+        float: The total revenue in USD, summed exactly from value_micros when the data has that column.
     """
-    total = revenue['value_usd'].sum()
-    print(f"Total Revenue (USD):\n{total:.2f}")
-    print("______________________")
+    total = total_usd(revenue)
     return total
 
 
@@ -105,8 +117,6 @@ def revenue_central_tendency(revenue):
         pandas.Series: A pandas Series object containing summary statistics of the revenue data.
     """
     summary = revenue['value_usd'].describe()
-    print("Revenue central tendency:\n", summary)
-    print("______________________")
     return summary
 
 
@@ -121,8 +131,6 @@ def revenue_by_date(revenue):
         pd.Series: A pandas Series containing the total revenue for each unique date in the `event_date` column.
     """
     by_date = revenue.groupby('event_date')['value_usd'].sum()
-    print("Revenue by Date:\n", by_date, "Shape: ", by_date.shape)
-    print("______________________")
     return by_date
 
 
@@ -137,9 +145,6 @@ def revenue_by_install_id(revenue):
         pd.Series: A Series with the total revenue for each unique install_id, sorted in descending order.
     """
     by_install_id = revenue.groupby('install_id')['value_usd'].sum().sort_values(ascending=False)
-    pd.options.display.float_format = '{:.6f}'.format
-    print("Revenue by install_id:\n", by_install_id, "Shape: ", by_install_id.shape)
-    print("______________________")
     return by_install_id
 
 
@@ -154,8 +159,6 @@ def cumulative_revenue(revenue_by_install_id):
         pandas.Series: A pandas Series containing the cumulative revenue generated by each install_id.
     """
     cum_revenue = revenue_by_install_id.cumsum()
-    print("cumulative_revenue:", cum_revenue)
-    print("______________________")
     return cum_revenue
 
 
@@ -170,8 +173,6 @@ def top_1_percent(cumulative_revenue):
         pandas.Series: A series containing the top 1% of revenue by install_id.
     """
     top_1 = cumulative_revenue[cumulative_revenue >= cumulative_revenue.quantile(0.99)]
-    print("top_1_percent", top_1)
-    print("______________________")
     return top_1
 
 
@@ -197,25 +198,9 @@ def decile_revenues(revenue_by_install_id, total_revenue):
         decile_revenue = revenue_by_install_id.iloc[lower:upper].sum()
         decile_revs.append(decile_revenue)
 
-    # Print the decile revenues and return the list of decile revenues
-    print_decile_revenues(decile_revs, total_revenue)
     return decile_revs
 
 
-def print_decile_revenues(decile_revenues, total_revenue):
-    """
-    Prints the revenue percentage for each decile.
-
-    Args:
-        decile_revenues (list): List of revenue for each decile.
-        total_revenue (float): Total revenue for the dataset.
-    """
-    for i, decile_revenue in enumerate(decile_revenues):
-        decile_percentage = (decile_revenue / total_revenue) * 100
-        print(f"Decile {i + 1}: {decile_revenue:.2f} USD ({decile_percentage:.2f}%)")
-    print("______________________")
-
-
 def duplicate_install_ids(revenue):
     """
     Finds and returns the duplicate install IDs in the revenue dataframe.
@@ -227,15 +212,13 @@ def duplicate_install_ids(revenue):
         pandas.DataFrame: A dataframe containing the duplicate install IDs.
     """
     duplicates = revenue[revenue['install_id'].duplicated()]
-    print("Duplicate install_ids:\n", duplicates, "Shape: ", duplicates.shape)
-    print("______________________")
     return duplicates
 
 
 def install_id_counts(revenue):
     """
-    Returns the count of occurrences of each unique install_id in the revenue DataFrame, and prints the install_id with
-    the highest and lowest count of occurrences.
+    Returns the count of occurrences of each unique install_id in the revenue DataFrame, sorted so that the most and
+    least repeated install_ids come first and last.
 
     Args:
         revenue (pandas.DataFrame): The revenue data to be analyzed.
@@ -244,110 +227,9 @@ def install_id_counts(revenue):
         pandas.Series: A series with the count of occurrences of each unique install_id.
     """
     id_counts = revenue['install_id'].value_counts()
-    most_repeated_install_id = id_counts.idxmax()
-    least_repeated_install_id = id_counts.idxmin()
-    most_repeated_count = id_counts.max()
-    least_repeated_count = id_counts.min()
-    print(f"The most repeated install_id: {most_repeated_install_id} with {most_repeated_count} occurrences.")
-    print(f"The least repeated install_id: {least_repeated_install_id} with {least_repeated_count} occurrences.")
-    print("______________________")
     return id_counts
 
 
-def plot_revenue_over_time(revenue_by_date):
-    """
-    Plots the revenue distribution over time using a line graph with a 30-day moving average.
-
-    Args:
-        revenue_by_date (pd.Series): A pandas series with the revenue summed by date.
-
-    Returns:
-        None
-    """
-    rolling_revenue = revenue_by_date.rolling(window=30).mean()
-    plt.figure(figsize=(12, 6))
-    revenue_by_date.plot(kind="line")
-    rolling_revenue.plot(kind="line", color="red", label="30-day Moving Average")
-    plt.title("Revenue Distribution Over Time")
-    plt.xlabel("Date")
-    plt.ylabel("Revenue (USD)")
-    plt.tight_layout()
-    plt.legend()
-    plt.savefig('Time: Time series plot for Revenue over time with Moving Average.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def plot_decile_revenue_usd(decile_revenues):
-    """
-    Plots the install_id revenue contribution by decile in USD.
-
-    Args:
-        decile_revenues (list): A list of revenue values for each decile.
-
-    Returns:
-        None
-    """
-    deciles = [f'Decile {i + 1}' for i in range(len(decile_revenues))]
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar(deciles, decile_revenues)
-    ax.set_xlabel('Deciles')
-    ax.set_ylabel('Revenue (USD)')
-    ax.set_title('Install_id Revenue Contribution by Decile in USD')
-    for i, v in enumerate(decile_revenues):
-        ax.text(i - 0.25, v + 1000, f"${v:,.2f}", fontsize=9)
-    plt.savefig('Install_id Revenue Contribution by Decile in USD.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def plot_decile_revenue_of_total_percentage(decile_revenues, total_revenue):
-    """
-    Plots the revenue contribution by decile as a percentage of the total revenue.
-
-    Args:
-        decile_revenues (list): A list of decile revenues.
-        total_revenue (float): The total revenue.
-
-    Returns:
-        None
-    """
-    deciles = [f'Decile {i + 1}' for i in range(len(decile_revenues))]
-    decile_percentages = [(decile_revenue / total_revenue) * 100 for decile_revenue in decile_revenues]
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar(deciles, decile_percentages)
-    ax.set_xlabel('Deciles')
-    ax.set_ylabel('Percentage of Total Revenue')
-    ax.set_title('Install_id Revenue Contribution by Decile as percentage')
-    for i, v in enumerate(decile_percentages):
-        ax.text(i - 0.25, v + 0.25, f"{v:.2f}%", fontsize=9)
-    plt.savefig('Install_id Revenue Contribution by Decile as percentage.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-def pareto_distribution(cumulative_percentage):
-    """
-    Plots the Pareto distribution of total revenue by install_id.
-
-    Args:
-        cumulative_percentage (array-like): The cumulative percentage of total revenue contributed by each install_id.
-
-    Returns:
-        None: The function only plots the graph.
-    """
-    percentiles = np.linspace(0, 100, len(cumulative_percentage))
-    selected_percentiles = np.arange(0, 101, 5)
-    selected_cumulative_percentage = np.interp(selected_percentiles, percentiles, cumulative_percentage)
-    fig, ax = plt.subplots(figsize=(12, 8))
-    ax.plot(selected_percentiles, selected_cumulative_percentage, marker='o')
-    ax.set_xlabel('Percentile of install_id')
-    ax.set_ylabel('Cumulative Percentage of Total Revenue')
-    ax.set_title('Pareto Distribution of Total Revenue by install_id')
-    ax.set_xticks(np.arange(0, 101, 10))
-    ax.set_yticks(np.arange(0, 101, 10))
-    plt.grid()
-    plt.savefig('Pareto Distribution of Total Revenue by install_id.png', dpi=300, bbox_inches='tight')
-    plt.show()
-
-
 def top_10_percent_decile_revenues(revenue_by_install_id, total_revenue):
     """
     Computes the revenue contribution of the top 10% install_ids divided into deciles.
@@ -370,120 +252,160 @@ def top_10_percent_decile_revenues(revenue_by_install_id, total_revenue):
     return top_10_percent_decile_revenues
 
 
-def plot_top_10_percent_decile_percentages(top_10_percent_decile_revenues, total_revenue):
+def draw_revenue_over_time(fig, revenue_over_time):
     """
-    Plots the percentage of total revenue contributed by each decile for the top 10% of install_ids by revenue.
+    Draws the revenue over time with its 30-day moving average, as a ``figure_specs.FigureSpec`` draw function.
 
     Args:
-        top_10_percent_decile_revenues (list): A list of revenues for each decile of the top 10% install_ids.
-        total_revenue (float): The total revenue of the dataset.
-
-    Returns:
-        None
+        fig (matplotlib.figure.Figure): The empty figure.
+        revenue_over_time (pd.DataFrame): The daily revenue in ``value_usd`` and its moving average in ``mean_30``.
     """
-    top_10_percent_decile_percentages = [(decile_revenue / total_revenue) * 100 for decile_revenue in
-                                         top_10_percent_decile_revenues]
-    deciles = [f'Decile {i + 1}' for i in range(len(top_10_percent_decile_percentages))]
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar(deciles, top_10_percent_decile_percentages)
-    ax.set_xlabel('Deciles')
-    ax.set_ylabel('Percentage of Total Revenue')
-    ax.set_title('Revenue Contribution by Decile for Top 10% install_ids as percentage')
-    for i, v in enumerate(top_10_percent_decile_percentages):
-        ax.text(i - 0.25, v + 0.1, f"{v:.2f}%", fontsize=9)
-    plt.savefig('revenue_chart.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    ax = fig.subplots()
+    revenue_over_time["value_usd"].plot(kind="line", ax=ax)
+    revenue_over_time["mean_30"].plot(kind="line", ax=ax, color="red", label="30-day Moving Average")
+    ax.set_title("Revenue Distribution Over Time")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Revenue (USD)")
+    fig.tight_layout()
+    ax.legend()
 
 
-def plot_top_10_percent_decile_revenues(top_10_percent_decile_revenues):
+def draw_decile_bars(fig, values, title, ylabel, label_format):
     """
-    Plots the revenue contribution by decile for the top 10% of install_ids in USD.
+    Draws one bar per decile, each labelled with its value, as a ``figure_specs.FigureSpec`` draw function.
 
     Args:
-    top_10_percent_decile_revenues (list): A list of revenue values for each decile.
+        fig (matplotlib.figure.Figure): The empty figure.
+        values (list): The value of each decile, in USD or percent.
+        title (str): The chart title.
+        ylabel (str): The y-axis label.
+        label_format (str): The format of the bar labels, e.g. "${:,.2f}".
+    """
+    deciles = [f'Decile {i + 1}' for i in range(len(values))]
+    ax = fig.subplots()
+    ax.bar(deciles, values)
+    ax.set_xlabel('Deciles')
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    # Labels sit a fixed distance above their bar whatever the scale of the values
+    label_bars(ax, label_format.format, fontsize=9)
 
-    Returns:
-    None
+
+def revenue_figure_specs(rev_by_date, rev_by_install_id, decile_revenue, top_10_decile_revenues, total_rev):
     """
-    deciles = [f'Decile {i + 1}' for i in range(len(top_10_percent_decile_revenues))]
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar(deciles, top_10_percent_decile_revenues)
-    ax.set_xlabel('Deciles')
-    ax.set_ylabel('Revenue (USD)')
-    ax.set_title('Revenue Contribution by Decile for Top 10% install_ids in USD')
-    for i, v in enumerate(top_10_percent_decile_revenues):
-        ax.text(i - 0.25, v + 100, f"${v:,.2f}", fontsize=9)
-    plt.savefig('Revenue Contribution by Decile for Top 10% install_ids in USD.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    Declares the revenue charts for ``figure_specs.render_figures``.
 
+    The moving average, the percentages and the Pareto curve are computed here, so the draw functions only draw.
 
-def revenue_main():
-    # Set the path to the revenue data file
-    revenue_path = "data/revenue_converted.csv"
+    Returns:
+        list of FigureSpec: The charts, in the order ``revenue_main`` used to plot them.
+    """
+    # Days without revenue are filled with zero, so the moving average always spans 30 calendar days
+    revenue_by_date = build_daily_calendar(rev_by_date)
+    revenue_over_time = rolling_stats(revenue_by_date, windows=(30,), stats=("mean",))[["mean_30"]]
+    revenue_over_time.insert(0, "value_usd", revenue_by_date)
+
+    decile_percentages = [(decile / total_rev) * 100 for decile in decile_revenue]
+    top_10_decile_percentages = [(decile / total_rev) * 100 for decile in top_10_decile_revenues]
+
+    return [
+        FigureSpec('Time: Time series plot for Revenue over time with Moving Average.png', draw_revenue_over_time,
+                   revenue_over_time, figsize=(12, 6)),
+        FigureSpec('Install_id Revenue Contribution by Decile in USD.png', draw_decile_bars, decile_revenue,
+                   {"title": 'Install_id Revenue Contribution by Decile in USD', "ylabel": 'Revenue (USD)',
+                    "label_format": "${:,.2f}"}, figsize=(10, 6)),
+        FigureSpec('Install_id Revenue Contribution by Decile as percentage.png', draw_decile_bars,
+                   decile_percentages,
+                   {"title": 'Install_id Revenue Contribution by Decile as percentage',
+                    "ylabel": 'Percentage of Total Revenue', "label_format": "{:.2f}%"},
+                   figsize=(10, 6)),
+        # The curve starts at the share of the top install_id and is relative to all revenue, with or without id
+        FigureSpec('Pareto Distribution of Total Revenue by install_id.png', draw_pareto,
+                   pareto_points(rev_by_install_id, from_zero=False, total=total_rev),
+                   {"title": 'Pareto Distribution of Total Revenue by install_id',
+                    "xlabel": 'Percentile of install_id', "ylabel": 'Cumulative Percentage of Total Revenue',
+                    "tight": False}, figsize=(12, 8)),
+        FigureSpec('revenue_chart.png', draw_decile_bars, top_10_decile_percentages,
+                   {"title": 'Revenue Contribution by Decile for Top 10% install_ids as percentage',
+                    "ylabel": 'Percentage of Total Revenue', "label_format": "{:.2f}%"},
+                   figsize=(10, 6)),
+        FigureSpec('Revenue Contribution by Decile for Top 10% install_ids in USD.png', draw_decile_bars,
+                   top_10_decile_revenues,
+                   {"title": 'Revenue Contribution by Decile for Top 10% install_ids in USD',
+                    "ylabel": 'Revenue (USD)', "label_format": "${:,.2f}"}, figsize=(10, 6)),
+    ]
+
+
+def revenue_main(revenue_path="data/revenue_converted.csv", make_plots=True, approximate=False):
+    """
+    Runs the revenue analysis without printing anything.
+
+    Args:
+        revenue_path (str): The path to the revenue data file.
+        make_plots (bool): Whether to render and save the figures.
+        approximate (bool): Estimate the number of unique install_ids with a HyperLogLog sketch.
 
-    # Get and print the temporal scope of the revenue data
-    get_revenue_temporal_scope(revenue_path)
+    Returns:
+        RevenueResult: The revenue KPIs, aggregates and figure specs; see ``reporting.print_revenue_report``.
+    """
+    # Get the temporal scope of the revenue data
+    temporal_scope = get_revenue_temporal_scope(revenue_path)
 
-    # Read the revenue data and print basic information
+    # Read the revenue data
     revenue = read_and_explore(revenue_path)
 
-    # Count and print the number of unique install_ids in the data
-    unique_install_id_count(revenue)
+    # Count the number of unique install_ids in the data
+    unique_install_ids = unique_install_id_count(revenue, approximate)
 
     # Preprocess the revenue data (e.g., convert date strings to datetime objects)
     revenue = preprocess_data(revenue)
 
-    # Calculate and print the total revenue
+    # Calculate the total revenue
     total_rev = total_revenue(revenue)
 
-    # Calculate and print central tendency measures for the revenue data
-    revenue_central_tendency(revenue)
+    # Calculate central tendency measures for the revenue data
+    central_tendency = revenue_central_tendency(revenue)
 
-    # Calculate and print the revenue per date
+    # Calculate the revenue per date
     rev_by_date = revenue_by_date(revenue)
 
-    # Calculate and print the revenue per install_id
+    # Calculate the revenue per install_id
     rev_by_install_id = revenue_by_install_id(revenue)
 
-    # Calculate and print the cumulative revenue per install_id
+    # Calculate the cumulative revenue per install_id
     cum_revenue = cumulative_revenue(rev_by_install_id)
 
-    # Calculate and store the cumulative percentage of revenue per install_id
-    cumulative_percentage = (cum_revenue / total_rev) * 100
-
-    # Find and print the top 1% of install_ids based on revenue
+    # Find the top 1% of install_ids based on revenue
     top1 = top_1_percent(cum_revenue)
 
-    # Calculate and print the revenue for each decile of install_ids
+    # Calculate the revenue for each decile of install_ids
     decile_revenue = decile_revenues(rev_by_install_id, total_rev)
 
-    # Find and print any duplicate install_ids
-    duplicate_install_ids(revenue)
-
-    # Calculate and print the number of occurrences for each install_id
-    install_id_counts(revenue)
-
-    # Plot and save the revenue distribution over time
-    plot_revenue_over_time(rev_by_date)
-
-    # Plot and save the decile revenue in USD
-    plot_decile_revenue_usd(decile_revenue)
-
-    # Plot and save the decile revenue as a percentage of total revenue
-    plot_decile_revenue_of_total_percentage(decile_revenue, total_rev)
+    # Find any duplicate install_ids
+    duplicates = duplicate_install_ids(revenue)
 
-    # Plot and save the Pareto distribution of revenue by install_id
-    pareto_distribution(cumulative_percentage)
+    # Calculate the number of occurrences for each install_id
+    id_counts = install_id_counts(revenue)
 
     # Calculate and store the revenue for each decile within the top 10% of install_ids
     top_10_decile_revenues = top_10_percent_decile_revenues(rev_by_install_id, total_rev)
 
-    # Plot and save the top 10% decile percentages
-    plot_top_10_percent_decile_percentages(top_10_decile_revenues, total_rev)
+    # Render the charts whose saved PNG is out of date; the result holds their specs, not drawn figures
+    figures = []
+    if make_plots:
+        figures = revenue_figure_specs(rev_by_date, rev_by_install_id, decile_revenue, top_10_decile_revenues,
+                                       total_rev)
+        render_figures(figures)
 
-    # Plot and save the top 10% decile revenues in USD
-    plot_top_10_percent_decile_revenues(top_10_decile_revenues)
+    return RevenueResult(temporal_scope=temporal_scope, unique_install_ids=unique_install_ids,
+                         total_revenue=total_rev, central_tendency=central_tendency, revenue_by_date=rev_by_date,
+                         revenue_by_install_id=rev_by_install_id, top_1_percent=top1,
+                         decile_revenues=decile_revenue, duplicate_install_ids=duplicates,
+                         install_id_counts=id_counts, top_10_percent_decile_revenues=top_10_decile_revenues,
+                         figures=figures)
 
 
 if __name__ == '__main__':
-    revenue_main()
+    result = revenue_main()
+    print_revenue_report(result)
+    show_figures(result.figures)
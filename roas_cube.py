@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+from reporting import print_roas_report
+from results import RoasResult
+
+from cohort_analysis import EVENT_COLUMNS, build_install_index, lookup_install_codes
+from date_dimension import day_numbers
+
+CUBE_KEYS = ["day", "country_id", "network_id"]
+CUBE_MEASURES = ["spend", "installs", "revenue", "payouts"]
+
+
+def _compact_keys(frame):
+    # Day numbers fit in int32 and country/network ids in the smallest integer type that holds them
+    frame["day"] = frame["day"].astype(np.int32)
+    for column in ["country_id", "network_id"]:
+        frame[column] = pd.to_numeric(frame[column], downcast="integer")
+    return frame
+
+
+def _attributed_totals(install_index, csv_path, chunksize):
+    # Sum event values onto the cube cell of the install they belong to, one bincount per chunk
+    n_cells = len(install_index["cohorts"])
+    totals = np.zeros(n_cells)
+    for chunk in pd.read_csv(csv_path, usecols=EVENT_COLUMNS, chunksize=chunksize):
+        codes = lookup_install_codes(install_index, chunk["install_id"].to_numpy())
+        matched = codes >= 0
+        cells = install_index["cohort_code"][codes[matched]]
+        values = chunk["value_usd"].to_numpy(dtype=float)[matched]
+        totals += np.bincount(cells, weights=values, minlength=n_cells)
+    return totals
+
+
+def build_cube(adspend_csv, installs_csv, revenue_csv, payouts_csv, chunksize=5_000_000):
+    """
+    Builds a pre-aggregated cube of spend, installs, revenue and payouts keyed by (day, country_id, network_id).
+
+    Spend is keyed by the ad spend event date. Installs are deduplicated on install_id and keyed by their install
+    date, country and network; revenue and payouts are attributed to the cell of the install they belong to, so a
+    cell's revenue is what the installs bought on that day eventually earned. Each source is read once.
+
+    Args:
+        adspend_csv (str): The path to the CSV file containing ad spend data.
+        installs_csv (str): The path to the CSV file containing installs data.
+        revenue_csv (str): The path to the CSV file containing revenue data.
+        payouts_csv (str): The path to the CSV file containing payouts data.
+        chunksize (int): The number of rows read at a time from the ad spend, revenue and payouts files.
+
+    Returns:
+        pd.DataFrame: One row per non-empty cell with the day (days since 1970-01-01), country_id, network_id,
+        spend, installs, revenue and payouts columns.
+    """
+    spend_parts = []
+    for chunk in pd.read_csv(adspend_csv, usecols=["event_date", "country_id", "network_id", "value_usd"],
+                             chunksize=chunksize):
+        chunk["day"] = day_numbers(chunk["event_date"])
+        spend_parts.append(chunk.groupby(CUBE_KEYS)["value_usd"].sum())
+    spend = pd.concat(spend_parts).groupby(level=CUBE_KEYS).sum().rename("spend")
+
+    installs = pd.read_csv(installs_csv, usecols=["event_date", "install_id", "country_id", "network_id"])
+    install_index = build_install_index(installs, dimensions=("country_id", "network_id"))
+    del installs
+
+    cells = install_index["cohorts"].reset_index()
+    cells["day"] = day_numbers(cells.pop("install_date"))
+    cells["revenue"] = _attributed_totals(install_index, revenue_csv, chunksize)
+    cells["payouts"] = _attributed_totals(install_index, payouts_csv, chunksize)
+    cells = cells.set_index(CUBE_KEYS)
+
+    cube = cells.join(spend, how="outer").fillna(0).reset_index()
+    cube["installs"] = cube["installs"].astype(np.int64)
+    return _compact_keys(cube)[CUBE_KEYS + CUBE_MEASURES]
+
+
+def save_cube(cube, path):
+    """
+    Saves a cube as a compressed NumPy archive with one array per column.
+
+    Args:
+        cube (pd.DataFrame): The output of ``build_cube``.
+        path (str): The path of the .npz file to write.
+    """
+    np.savez_compressed(path, **{column: cube[column].to_numpy() for column in cube.columns})
+
+
+def load_cube(path):
+    """
+    Loads a cube saved with ``save_cube``.
+
+    Args:
+        path (str): The path of the .npz file.
+
+    Returns:
+        pd.DataFrame: The cube.
+    """
+    with np.load(path) as archive:
+        return pd.DataFrame({column: archive[column] for column in CUBE_KEYS + CUBE_MEASURES})
+
+
+def query_cube(cube, start_date=None, end_date=None, country_ids=None, network_ids=None, by=None):
+    """
+    Answers ROAS, CPI and ARPU for a slice of the cube by summing its cells.
+
+    Args:
+        cube (pd.DataFrame): The output of ``build_cube`` or ``load_cube``.
+        start_date (str, optional): The first date of the slice, inclusive.
+        end_date (str, optional): The last date of the slice, inclusive.
+        country_ids (iterable, optional): Restrict the slice to these countries.
+        network_ids (iterable, optional): Restrict the slice to these networks.
+        by (str or list of str, optional): Break the slice down by these cube keys, e.g. "network_id".
+
+    Returns:
+        pd.DataFrame: The summed measures plus roas (revenue / spend), cpi (spend / installs) and arpu
+        (revenue / installs); a single row when ``by`` is not given.
+    """
+    mask = np.ones(len(cube), dtype=bool)
+    if start_date is not None:
+        mask &= cube["day"].to_numpy() >= day_numbers([start_date])[0]
+    if end_date is not None:
+        mask &= cube["day"].to_numpy() <= day_numbers([end_date])[0]
+    if country_ids is not None:
+        mask &= cube["country_id"].isin(country_ids).to_numpy()
+    if network_ids is not None:
+        mask &= cube["network_id"].isin(network_ids).to_numpy()
+    selected = cube.loc[mask]
+
+    if by is None:
+        totals = selected[CUBE_MEASURES].sum().to_frame().T.astype({"installs": np.int64})
+    else:
+        totals = selected.groupby(by)[CUBE_MEASURES].sum()
+
+    # Empty denominators give NaN rather than inf
+    spend = totals["spend"].where(totals["spend"] != 0)
+    installs = totals["installs"].where(totals["installs"] != 0)
+    totals["roas"] = totals["revenue"] / spend
+    totals["cpi"] = totals["spend"] / installs
+    totals["arpu"] = totals["revenue"] / installs
+    return totals
+
+
+def roas_main():
+    # Set the paths to the CSV files
+    adspend_path = "data/adspend_converted.csv"
+    installs_path = "data/installs.csv"
+    revenue_path = "data/revenue_converted.csv"
+    payouts_path = "data/payouts_converted.csv"
+
+    cube = build_cube(adspend_path, installs_path, revenue_path, payouts_path)
+    save_cube(cube, "data/roas_cube.npz")
+
+    return RoasResult(cube=cube, overall=query_cube(cube), by_network=query_cube(cube, by="network_id"),
+                      by_country=query_cube(cube, by="country_id"))
+
+
+if __name__ == "__main__":
+    print_roas_report(roas_main())
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+from date_dimension import date_attributes, day_numbers
+from money import MICROS_COLUMN, USD_COLUMN, to_usd
+
+# The series of the holistic time series, counted (installs) or summed over value_usd (the others)
+ROLLUP_SERIES = ["Installs", "Revenue", "Adspend", "Payouts"]
+
+
+def daily_totals(csv_path, value_column="value_usd", chunksize=1_000_000):
+    """
+    Totals a CSV file per event day in one streaming pass.
+
+    Only the distinct dates of each chunk are parsed (see ``date_dimension.day_numbers``). A file with a value_micros
+    column (``data_check.convert_scientific_notation(as_micros=True)``) is summed exactly with integer reductions of
+    that column and converted to USD once per day.
+
+    Args:
+        csv_path (str): The path to the CSV file.
+        value_column (str, optional): The column to sum, or None to count rows.
+        chunksize (int): The number of rows read at a time.
+
+    Returns:
+        pd.Series: The total per day, indexed by day number (days since 1970-01-01) in ascending order.
+    """
+    as_micros = value_column == USD_COLUMN and MICROS_COLUMN in pd.read_csv(csv_path, nrows=0).columns
+    if as_micros:
+        value_column = MICROS_COLUMN
+    usecols = ["event_date"] if value_column is None else ["event_date", value_column]
+    parts = []
+    for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=chunksize):
+        chunk = chunk[chunk["event_date"].notna()]
+        days = day_numbers(chunk["event_date"])
+        if value_column is None:
+            values = np.ones(len(chunk))
+        elif as_micros:
+            # Missing micro-dollars add nothing, as NaN adds nothing to a float sum
+            values = chunk[value_column].fillna(0).to_numpy(dtype=np.int64)
+        else:
+            values = chunk[value_column].to_numpy(dtype=float)
+        parts.append(pd.Series(values).groupby(days).sum())
+    if not parts:
+        return pd.Series(dtype=float).rename_axis("day")
+    totals = pd.concat(parts).groupby(level=0).sum().rename_axis("day")
+    return to_usd(totals) if as_micros else totals
+
+
+def build_daily_aggregates(installs_path, revenue_path, adspend_path, payouts_path, chunksize=1_000_000):
+    """
+    Builds the daily totals behind the holistic time series: install rows, and revenue, ad spend and payouts in USD.
+
+    Args:
+        installs_path (str): The path to the installs data file.
+        revenue_path (str): The path to the revenue data file.
+        adspend_path (str): The path to the ad spend data file.
+        payouts_path (str): The path to the payouts data file.
+        chunksize (int): The number of rows read at a time.
+
+    Returns:
+        pd.DataFrame: One column per ``ROLLUP_SERIES`` entry indexed by day number; NaN where a file has no rows.
+    """
+    return pd.DataFrame({
+        "Installs": daily_totals(installs_path, None, chunksize),
+        "Revenue": daily_totals(revenue_path, chunksize=chunksize),
+        "Adspend": daily_totals(adspend_path, chunksize=chunksize),
+        "Payouts": daily_totals(payouts_path, chunksize=chunksize),
+    })
+
+
+def monthly_rollup(daily):
+    """
+    Rolls daily totals up to calendar months, taking the month of each day from the date dimension.
+
+    Args:
+        daily (pd.DataFrame): Totals indexed by day number, e.g. the output of ``build_daily_aggregates``.
+
+    Returns:
+        pd.DataFrame: The totals per month, indexed by the first day of the month. A month stays NaN for a series
+        without any day in it, so that series skips the month like a groupby over its rows would.
+    """
+    months = date_attributes(daily.index, ["month"])["month"].to_numpy()
+    monthly = daily.groupby(months).sum(min_count=1)
+    monthly.index = pd.DatetimeIndex(monthly.index, name="month")
+    return monthly
+
+
+def update_rollups(daily, monthly, new_daily):
+    """
+    Adds newly arrived daily totals to the daily aggregates and their monthly rollup, without recomputing either.
+
+    Args:
+        daily (pd.DataFrame): The existing daily aggregates.
+        monthly (pd.DataFrame): The existing monthly rollup of ``daily``.
+        new_daily (pd.DataFrame): The daily totals of the new rows, with the same columns.
+
+    Returns:
+        tuple: The updated daily aggregates and monthly rollup.
+    """
+    return daily.add(new_daily, fill_value=0), monthly.add(monthly_rollup(new_daily), fill_value=0)
+
+
+def percentage_change(monthly):
+    """
+    Calculates the month-over-month percentage change of every series of a monthly rollup.
+
+    Args:
+        monthly (pd.DataFrame): The output of ``monthly_rollup``.
+
+    Returns:
+        pd.DataFrame: The change of each series relative to its previous month with data.
+    """
+    return pd.DataFrame({column: monthly[column].dropna().pct_change() for column in monthly.columns})
+
+
+def save_rollups(daily, monthly, path):
+    """
+    Saves the daily aggregates and monthly rollup as a compressed NumPy archive.
+
+    Args:
+        daily (pd.DataFrame): The daily aggregates.
+        monthly (pd.DataFrame): The monthly rollup.
+        path (str): The path of the .npz file to write.
+    """
+    arrays = {"day": daily.index.to_numpy(np.int32), "month": monthly.index.to_numpy().astype("datetime64[M]")}
+    for column in daily.columns:
+        arrays[f"daily_{column}"] = daily[column].to_numpy()
+        arrays[f"monthly_{column}"] = monthly[column].to_numpy()
+    np.savez_compressed(path, **arrays)
+
+
+def load_rollups(path):
+    """
+    Loads the rollups saved with ``save_rollups``.
+
+    Args:
+        path (str): The path of the .npz file.
+
+    Returns:
+        tuple: The daily aggregates and monthly rollup.
+    """
+    with np.load(path) as archive:
+        daily = pd.DataFrame({column: archive[f"daily_{column}"] for column in ROLLUP_SERIES},
+                             index=pd.Index(archive["day"], name="day"))
+        monthly = pd.DataFrame({column: archive[f"monthly_{column}"] for column in ROLLUP_SERIES},
+                               index=pd.DatetimeIndex(archive["month"].astype("datetime64[ns]"), name="month"))
+    return daily, monthly
+
+
+if __name__ == "__main__":
+    daily_aggregates = build_daily_aggregates("data/installs.csv", "data/revenue_converted.csv",
+                                              "data/adspend_converted.csv", "data/payouts_converted.csv")
+    monthly_aggregates = monthly_rollup(daily_aggregates)
+    save_rollups(daily_aggregates, monthly_aggregates, "data/rollups.npz")
+    print(monthly_aggregates)
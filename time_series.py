@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+
+def build_daily_calendar(series, fill_value=0.0):
+    """
+    Reindexes a date-keyed series onto a dense daily calendar so that missing days count as explicit zeros.
+
+    Args:
+        series (pd.Series): Values indexed by date (datetime-like, or strings/dates that pandas can parse).
+        fill_value (float): The value used for days that have no observations.
+
+    Returns:
+        pd.Series: A float series with one entry per calendar day between the first and last date.
+    """
+    daily = series.copy()
+    daily.index = pd.to_datetime(daily.index)
+    # Collapse repeated dates first so that the reindex below is well defined
+    if not daily.index.is_unique:
+        daily = daily.groupby(level=0).sum()
+    daily = daily.sort_index()
+    if daily.empty:
+        return daily.astype(float)
+    calendar = pd.date_range(daily.index.min(), daily.index.max(), freq="D", name=daily.index.name)
+    return daily.reindex(calendar, fill_value=fill_value).astype(float)
+
+
+def _window_sums(cumulative, window):
+    # Sum over the trailing window for every position, computed from a zero-padded cumulative sum
+    sums = np.full(len(cumulative) - 1, np.nan)
+    if window <= len(sums):
+        sums[window - 1:] = cumulative[window:] - cumulative[:-window]
+    return sums
+
+
+def rolling_stats(daily, windows=(30,), stats=("mean", "sum", "std")):
+    """
+    Computes rolling statistics for several window sizes in a single O(n) pass over a dense daily series.
+
+    The rolling sums are taken as differences of one cumulative sum (and one cumulative sum of squares for the
+    standard deviation), so every extra window costs a vectorized subtraction instead of another rolling scan.
+    As with pandas' ``rolling(window).mean()``, the first ``window - 1`` days are NaN.
+
+    Args:
+        daily (pd.Series): A dense daily series, e.g. the output of ``build_daily_calendar``.
+        windows (iterable of int): The window sizes in days.
+        stats (iterable of str): Any of "mean", "sum" and "std" (sample standard deviation).
+
+    Returns:
+        pd.DataFrame: A frame indexed like ``daily`` with one column per statistic and window, e.g. "mean_30".
+    """
+    values = daily.to_numpy(dtype=float)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    cumulative_sq = np.concatenate(([0.0], np.cumsum(values ** 2))) if "std" in stats else None
+
+    result = {}
+    for window in windows:
+        sums = _window_sums(cumulative, window)
+        if "mean" in stats:
+            result[f"mean_{window}"] = sums / window
+        if "sum" in stats:
+            result[f"sum_{window}"] = sums
+        if "std" in stats:
+            if window > 1:
+                sums_sq = _window_sums(cumulative_sq, window)
+                variance = (sums_sq - sums ** 2 / window) / (window - 1)
+                # Cancellation can leave tiny negative variances on flat stretches
+                result[f"std_{window}"] = np.sqrt(np.clip(variance, 0, None))
+            else:
+                result[f"std_{window}"] = np.full(len(values), np.nan)
+
+    return pd.DataFrame(result, index=daily.index)
+
+
+def append_days(daily, new_daily, fill_value=0.0):
+    """
+    Adds newly arrived daily totals to an existing dense daily series.
+
+    Days that are already present are summed with the new values, and any gap between the old and new dates is
+    filled so that the result stays dense.
+
+    Args:
+        daily (pd.Series): The existing dense daily series.
+        new_daily (pd.Series): The new totals indexed by date.
+        fill_value (float): The value used for days that have no observations.
+
+    Returns:
+        pd.Series: The extended dense daily series.
+    """
+    return build_daily_calendar(pd.concat([daily, build_daily_calendar(new_daily, fill_value)]), fill_value)
+
+
+def _check_daily_index(index, name):
+    # The incremental update aligns on dates, so both inputs must be dense daily calendars
+    if not isinstance(index, pd.DatetimeIndex) or (index[1:] - index[:-1] != pd.Timedelta(days=1)).any():
+        raise ValueError(f"{name} must be indexed by consecutive days, as build_daily_calendar returns")
+
+
+def update_rolling_stats(previous_stats, daily, windows=(30,), stats=("mean", "sum", "std"), changed_from=None):
+    """
+    Incrementally extends rolling statistics after the daily series was updated.
+
+    ``previous_stats`` and ``daily`` are aligned on their dates. The statistics of days before ``changed_from`` are
+    kept, and the rest is recomputed from the largest window's look-back before it, so a daily refresh costs
+    O(changed days + window) rather than a pass over the full history. Days added before the first day of
+    ``previous_stats`` shift every window, so they trigger a full recomputation.
+
+    Args:
+        previous_stats (pd.DataFrame): The output of an earlier ``rolling_stats`` call on the same windows and stats.
+        daily (pd.Series): The updated dense daily series, e.g. the output of ``append_days``.
+        windows (iterable of int): The window sizes used for ``previous_stats``.
+        stats (iterable of str): The statistics used for ``previous_stats``.
+        changed_from (datetime-like, optional): The earliest day whose total changed since ``previous_stats`` was
+            computed, e.g. the first date of the ``new_daily`` passed to ``append_days``. Defaults to the last day of
+            ``previous_stats``, i.e. only that day may have received late events.
+
+    Returns:
+        pd.DataFrame: Rolling statistics for the whole of ``daily``.
+
+    Raises:
+        ValueError: If an index is not a dense daily calendar, the columns of ``previous_stats`` do not match
+            ``windows`` and ``stats``, or ``previous_stats`` has days that ``daily`` does not.
+    """
+    if previous_stats.empty:
+        return rolling_stats(daily, windows, stats)
+
+    _check_daily_index(daily.index, "daily")
+    _check_daily_index(previous_stats.index, "previous_stats")
+    columns = list(rolling_stats(daily.iloc[:0], windows, stats).columns)
+    if list(previous_stats.columns) != columns:
+        raise ValueError(f"previous_stats has columns {list(previous_stats.columns)}, expected {columns}")
+    first, last = previous_stats.index[0], previous_stats.index[-1]
+    if daily.empty or daily.index[0] > first or daily.index[-1] < last:
+        raise ValueError("daily must cover every day of previous_stats")
+
+    changed_from = last if changed_from is None else min(pd.Timestamp(changed_from), last)
+    if daily.index[0] < first:
+        changed_from = daily.index[0]
+    kept = previous_stats.loc[previous_stats.index < changed_from]
+    first_new = len(kept)
+    start = max(first_new - (max(windows) - 1), 0)
+
+    tail_stats = rolling_stats(daily.iloc[start:], windows, stats).iloc[first_new - start:]
+    return pd.concat([kept, tail_stats])